@@ -1,11 +1,35 @@
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
 from .state import AgentState
-from .orchestrator.orchestrator import OrchestratorAgent
-from .generator.generator import GeneratorAgent
-from .evaluator.evaluator import EvaluatorAgent
+
+if TYPE_CHECKING:
+    from .orchestrator.orchestrator import OrchestratorAgent
+    from .generator.generator import GeneratorAgent
+    from .evaluator.evaluator import EvaluatorAgent
+
+# Agent classes pull in jinja2/requests/langchain, so they are imported on
+# first attribute access instead of with the package.
+_LAZY_ATTRS = {
+    "OrchestratorAgent": ".orchestrator.orchestrator",
+    "GeneratorAgent": ".generator.generator",
+    "EvaluatorAgent": ".evaluator.evaluator",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "AgentState",
     "OrchestratorAgent",
     "GeneratorAgent",
     "EvaluatorAgent",
-]
\ No newline at end of file
+]
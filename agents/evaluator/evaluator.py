@@ -2,18 +2,24 @@ from __future__ import annotations
 import json
 import re
 from typing import Any, Dict, List, Optional
-from jinja2 import Environment, FileSystemLoader, Template
-from utils import call_llm
+from utils import LLMCallError, call_llm
+from utils.log_service import get_logger
+from agents.templates import TemplateRegistry, get_template_registry
+
+logger = get_logger("evaluator")
 
 
 class EvaluatorAgent:
-    def __init__(self, llm, template_dir: str = "agents/evaluator/templates"):
+    def __init__(self,
+                 llm,
+                 template_dir: Optional[str] = None,
+                 templates: Optional[TemplateRegistry] = None):
         self.llm = llm
-        self.template_dir = template_dir
-        self.env = Environment(loader=FileSystemLoader(template_dir))
-        
-        # Load main template
-        self.main_template = self.env.get_template("evaluator_main.j2")
+        # Shared registry unless the caller points this agent at its own directory
+        self.templates = templates or (
+            TemplateRegistry({"evaluator": template_dir}) if template_dir else get_template_registry()
+        )
+        self.template_dir = str(self.templates.template_dirs["evaluator"])
         
         # Baseline template mapping
         self.baseline_templates = {
@@ -45,6 +51,14 @@ class EvaluatorAgent:
             "completeness": 0.15,
         }
 
+        # Fail at startup (not mid-run) on missing templates or unknown variables
+        self.templates.validate("evaluator", required=[
+            "evaluator_main.j2",
+            *self.baseline_templates.values(),
+            *self.criteria_templates.values(),
+        ])
+        self.main_template = self.templates.get("evaluator", "evaluator_main.j2")
+
     def evaluate(self, 
                  candidate: Any,
                  post_type: str = "health_nutrition",
@@ -82,7 +96,7 @@ class EvaluatorAgent:
         # Load baseline template
         baseline_template_name = self.baseline_templates[post_type]
         try:
-            baseline_template = self.env.get_template(baseline_template_name)
+            baseline_template = self.templates.get("evaluator", baseline_template_name)
         except Exception as e:
             raise ValueError(f"Failed to load baseline template {baseline_template_name}: {e}")
         
@@ -90,7 +104,7 @@ class EvaluatorAgent:
         criteria_contents = {}
         for criteria_name, template_name in self.criteria_templates.items():
             try:
-                criteria_template = self.env.get_template(template_name)
+                criteria_template = self.templates.get("evaluator", template_name)
                 criteria_contents[criteria_name] = criteria_template.render(
                     language=language,
                     post_type=post_type,
@@ -99,7 +113,7 @@ class EvaluatorAgent:
                     criteria_weight=criteria.get(criteria_name, 0.0)
                 )
             except Exception as e:
-                print(f"Warning: Failed to load criteria template {template_name}: {e}")
+                logger.warning("Failed to load criteria template %s: %s", template_name, e)
                 criteria_contents[criteria_name] = f"Criteria {criteria_name} template error: {e}"
         
         # Render the baseline template
@@ -133,6 +147,8 @@ class EvaluatorAgent:
         # Get LLM response
         try:
             raw_response = call_llm(self.llm, prompt).strip()
+        except LLMCallError:
+            raise
         except Exception as e:
             raise ValueError(f"Failed to call LLM: {e}")
         
@@ -207,7 +223,7 @@ class EvaluatorAgent:
                 feedback = str(data.get("feedback", "No feedback provided"))
                 return score, feedback
             except (json.JSONDecodeError, ValueError, TypeError) as e:
-                print(f"JSON parsing error: {e}")
+                logger.debug("JSON parsing error: %s", e)
                 continue
         
         # Enhanced fallback parsing
@@ -227,5 +243,5 @@ class EvaluatorAgent:
         else:
             feedback = "Cannot parse evaluation response - please check template format"
         
-        print(f"Using fallback parsing - Score: {score}, Feedback: {feedback}")
+        logger.warning("Using fallback parsing - Score: %s, Feedback: %s", score, feedback)
         return score, feedback
\ No newline at end of file
@@ -2,18 +2,21 @@ from __future__ import annotations
 import re
 import json
 from typing import Any, Dict, List, Optional
-from jinja2 import Environment, FileSystemLoader, Template
 from utils import call_llm
+from agents.templates import TemplateRegistry, get_template_registry
 
 
 class GeneratorAgent:
-    def __init__(self, llm, template_dir: str = "agents/generator/templates"):
+    def __init__(self,
+                 llm,
+                 template_dir: Optional[str] = None,
+                 templates: Optional[TemplateRegistry] = None):
         self.llm = llm
-        self.template_dir = template_dir
-        self.env = Environment(loader=FileSystemLoader(template_dir))
-        
-        # Load main template
-        self.main_template = self.env.get_template("generator_main.j2")
+        # Shared registry unless the caller points this agent at its own directory
+        self.templates = templates or (
+            TemplateRegistry({"generator": template_dir}) if template_dir else get_template_registry()
+        )
+        self.template_dir = str(self.templates.template_dirs["generator"])
         
         # Post type template mapping
         self.post_type_templates = {
@@ -25,6 +28,13 @@ class GeneratorAgent:
             "holiday_event": "post_types/holiday_event.j2",
         }
 
+        # Fail at startup (not mid-run) on missing templates or unknown variables
+        self.templates.validate("generator", required=[
+            "generator_main.j2",
+            *self.post_type_templates.values(),
+        ])
+        self.main_template = self.templates.get("generator", "generator_main.j2")
+
     def _extract_search_content_from_plan(self, plan_data: Any) -> str:
         """Extract search content from orchestrator plan data"""
         search_content = ""
@@ -69,7 +79,8 @@ class GeneratorAgent:
                  post_type: str = "health_nutrition",
                  target_audience: Optional[str] = None,
                  custom_hashtags: Optional[List[str]] = None,
-                 feedback: str = "") -> Dict[str, Any]:
+                 feedback: str = "",
+                 internal_context: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate content using Jinja2 templates with search content from orchestrator
         """
@@ -102,7 +113,7 @@ class GeneratorAgent:
         # Load post type specific template
         post_type_template_name = self.post_type_templates[post_type]
         try:
-            post_type_template = self.env.get_template(post_type_template_name)
+            post_type_template = self.templates.get("generator", post_type_template_name)
         except Exception as e:
             raise ValueError(f"Failed to load template {post_type_template_name}: {e}")
         
@@ -117,7 +128,8 @@ class GeneratorAgent:
             "plan_text": plan_text,
             "feedback": feedback,
             "search_content": search_content if search_content else None,
-            "search_enabled": bool(search_content)
+            "search_enabled": bool(search_content),
+            "internal_context": internal_context or None
         }
         
         # Render post type template first
@@ -1,22 +1,32 @@
 from __future__ import annotations
+import os
 import re
 import json
 from typing import Any, Dict, List, Optional, Tuple
-from jinja2 import Environment, FileSystemLoader, Template
+from config import CONFIG
 from utils import call_llm
-import requests
-import time
+from utils.cassette import get_cassette
+from utils.log_service import get_logger
+from utils.tracing import get_tracer
+from agents.templates import TemplateRegistry, get_template_registry
+
+logger = get_logger("orchestrator")
 
 
 class OrchestratorAgent:
-    def __init__(self, llm, tavily_api_key: str, template_dir: str = "agents/orchestrator/templates"):
+    def __init__(self,
+                 llm,
+                 tavily_api_key: str,
+                 template_dir: Optional[str] = None,
+                 templates: Optional[TemplateRegistry] = None):
         self.llm = llm
         self.tavily_api_key = tavily_api_key
-        self.template_dir = template_dir
-        self.env = Environment(loader=FileSystemLoader(template_dir))
-        
-        # Load main template
-        self.main_template = self.env.get_template("orchestrator_main.j2")
+        # Shared registry unless the caller points this agent at its own directory
+        self.templates = templates or (
+            TemplateRegistry({"orchestrator": template_dir}) if template_dir else get_template_registry()
+        )
+        self.template_dir = str(self.templates.template_dirs["orchestrator"])
+        self._session = None  # HTTP session for Tavily, created on first search
         
         # Topic template mapping
         self.topic_templates = {
@@ -28,10 +38,38 @@ class OrchestratorAgent:
             "holiday_event": "topics/holiday_event.j2",
         }
 
+        # Fail at startup (not mid-run) on missing templates or unknown variables
+        self.templates.validate("orchestrator", required=[
+            "orchestrator_main.j2",
+            *self.topic_templates.values(),
+        ])
+        self.main_template = self.templates.get("orchestrator", "orchestrator_main.j2")
+
+    def _get_session(self):
+        """Reusable requests session (keeps the Tavily connection alive)"""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
     def _search_with_tavily(self, query: str) -> Dict[str, Any]:
         """Search using Tavily API with the original user query"""
+        cassette = get_cassette()
+        with get_tracer().span("tavily.search", kind="search") as span:
+            if cassette is None:
+                result = self._request_tavily(query)
+            else:
+                result = cassette.call("search", {"query": query}, lambda: self._request_tavily(query))
+                span.set(cassette=cassette.mode)
+            span.set(success=result.get("success"), results=result.get("total_results", 0))
+            return result
+
+    def _request_tavily(self, query: str) -> Dict[str, Any]:
+        import requests
+
         try:
-            api_url = "https://api.tavily.com/search"
+            api_url = (os.environ.get("TAVILY_API_URL")
+                       or CONFIG.get("TAVILY_API_URL", "https://api.tavily.com/search"))
             
             payload = {
                 "api_key": self.tavily_api_key,
@@ -43,7 +81,7 @@ class OrchestratorAgent:
                 "include_domains": None  # Let Tavily find the best sources
             }
             
-            response = requests.post(api_url, json=payload, timeout=30)
+            response = self._get_session().post(api_url, json=payload, timeout=30)
             response.raise_for_status()
             
             data = response.json()
@@ -73,10 +111,10 @@ class OrchestratorAgent:
             }
             
         except requests.exceptions.RequestException as e:
-            print(f"Tavily Search API error: {e}")
+            logger.error("Tavily Search API error: %s", e)
             return {"success": False, "error": str(e), "query": query}
         except Exception as e:
-            print(f"Unexpected error in Tavily Search: {e}")
+            logger.exception("Unexpected error in Tavily Search: %s", e)
             return {"success": False, "error": str(e), "query": query}
 
     def _format_search_results(self, search_data: Dict[str, Any]) -> str:
@@ -122,8 +160,9 @@ class OrchestratorAgent:
              topic_type: str = "food_nutrition",
              target_audience: Optional[str] = None,
              custom_hashtags: Optional[List[str]] = None,
-             enable_search: bool = True) -> Dict[str, Any]:
-        """Generate orchestrator plan with Tavily search"""
+             enable_search: bool = True,
+             internal_context: Optional[str] = None) -> Dict[str, Any]:
+        """Generate orchestrator plan with Tavily search (and AFFINA internal context when given)"""
         
         if language not in ["vietnamese", "english"]:
             raise ValueError("Language must be 'vietnamese' or 'english'")
@@ -134,13 +173,13 @@ class OrchestratorAgent:
         # Perform Tavily search if enabled
         search_results = None
         if enable_search:
-            print("Tavily searching sources...")
+            logger.info("Tavily searching sources...")
             search_results = self._search_with_tavily(user_request)
         
         # Load topic-specific template
         topic_template_name = self.topic_templates[topic_type]
         try:
-            topic_template = self.env.get_template(topic_template_name)
+            topic_template = self.templates.get("orchestrator", topic_template_name)
         except Exception as e:
             raise ValueError(f"Failed to load template {topic_template_name}: {e}")
         
@@ -152,7 +191,8 @@ class OrchestratorAgent:
             "target_audience": target_audience,
             "custom_hashtags": custom_hashtags or [],
             "user_request": user_request,
-            "search_results": search_results
+            "search_results": search_results,
+            "internal_context": internal_context or None
         }
         
         # Render topic template first
@@ -16,6 +16,10 @@ class AgentState(TypedDict):
     # Web search configuration and results
     enable_search: bool
     search_results: Optional[Dict[str, Any]]
+
+    # AFFINA internal knowledge (RAG), retrieved once per run
+    enable_rag: bool
+    internal_context: Optional[str]
     
     # Agent outputs
     orchestrator_plan: Dict[str, Any]
@@ -96,7 +100,8 @@ def create_initial_agent_state(
     evaluation_focus: Optional[str] = None,
     max_iterations: int = 3,
     pass_threshold: float = 0.75,
-    enable_search: bool = True
+    enable_search: bool = True,
+    enable_rag: bool = True
 ) -> AgentState:
     """Create initial AgentState with validation"""
     
@@ -117,6 +122,8 @@ def create_initial_agent_state(
         evaluation_focus=evaluation_focus,
         enable_search=enable_search,
         search_results=None,
+        enable_rag=enable_rag,
+        internal_context=None,
         orchestrator_plan={},
         generator_output={},
         evaluator_output={},
@@ -151,5 +158,6 @@ def get_state_summary(state: AgentState) -> Dict[str, Any]:
         "should_continue": state["should_continue"],
         "total_thinking_entries": len(state["thinking_log"]),
         "enable_search": state["enable_search"],
-        "has_search_results": bool(state["search_results"])
+        "has_search_results": bool(state["search_results"]),
+        "has_internal_context": bool(state.get("internal_context"))
     }
\ No newline at end of file
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, PrefixLoader, Template, meta
+
+from config import CONFIG, CONFIG_PATH
+
+ROOT_DIR = CONFIG_PATH.parent
+
+DEFAULT_TEMPLATE_DIRS = {
+    "orchestrator": CONFIG.get("ORCHESTRATOR_TEMPLATE_DIR", "agents/orchestrator/templates"),
+    "generator": CONFIG.get("GENERATOR_TEMPLATE_DIR", "agents/generator/templates"),
+    "evaluator": CONFIG.get("EVALUATOR_TEMPLATE_DIR", "agents/evaluator/templates"),
+}
+
+# Variables each agent passes to render(); a template referring to anything
+# else is a bug that would otherwise only show up mid-run as an empty value.
+TEMPLATE_VARIABLES: Dict[str, Set[str]] = {
+    "orchestrator": {
+        "language", "topic_type", "topic_template_name", "target_audience",
+        "custom_hashtags", "user_request", "search_results",
+        "topic_content", "search_summary", "internal_context",
+    },
+    "generator": {
+        "language", "post_type", "post_type_template_name", "target_audience",
+        "custom_hashtags", "user_request", "plan_text", "feedback",
+        "search_content", "search_enabled", "post_type_content", "internal_context",
+    },
+    "evaluator": {
+        "language", "post_type", "target_audience", "custom_criteria", "criteria",
+        "criteria_weight", "evaluation_focus", "content_text",
+        "baseline_content", "criteria_contents",
+    },
+}
+
+
+class TemplateValidationError(ValueError):
+    """A template is missing, fails to compile or uses an unknown variable"""
+
+
+class TemplateRegistry:
+    """
+    One Jinja2 Environment for all agents' templates.
+
+    Templates are addressed as (agent, name), e.g. ("generator",
+    "post_types/health_nutrition.j2"). Compiled templates are kept in a
+    persistent bytecode cache, so a new process skips recompilation, and with
+    auto_reload off a loaded template is never re-stat'ed.
+    """
+
+    def __init__(self,
+                 template_dirs: Optional[Dict[str, str]] = None,
+                 auto_reload: Optional[bool] = None,
+                 bytecode_cache_dir: Optional[str] = None):
+        self.template_dirs = {
+            agent: self._resolve(path)
+            for agent, path in (template_dirs or DEFAULT_TEMPLATE_DIRS).items()
+        }
+        if auto_reload is None:
+            auto_reload = bool(CONFIG.get("TEMPLATE_AUTO_RELOAD", False))
+        cache_dir = bytecode_cache_dir or CONFIG.get("TEMPLATE_CACHE_DIR")
+
+        bytecode_cache = None
+        if cache_dir:
+            cache_path = self._resolve(cache_dir)
+            cache_path.mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(cache_path))
+
+        self.env = Environment(
+            loader=PrefixLoader({
+                agent: FileSystemLoader(str(path))
+                for agent, path in self.template_dirs.items()
+            }),
+            auto_reload=auto_reload,
+            bytecode_cache=bytecode_cache,
+        )
+        self._validated: Set[str] = set()
+
+    @staticmethod
+    def _resolve(path: str | Path) -> Path:
+        path = Path(path)
+        return path if path.is_absolute() else ROOT_DIR / path
+
+    def get(self, agent: str, name: str) -> Template:
+        return self.env.get_template(f"{agent}/{name}")
+
+    def list_templates(self, agent: str) -> List[str]:
+        prefix = f"{agent}/"
+        return [
+            name[len(prefix):]
+            for name in self.env.list_templates(extensions=["j2"])
+            if name.startswith(prefix)
+        ]
+
+    def validate(self, agent: str, required: Iterable[str] = ()) -> None:
+        """
+        Compile every template of `agent` and check the variables it uses
+        against TEMPLATE_VARIABLES. `required` lists template names the
+        agent maps to and which therefore must exist.
+        Runs once per agent per registry.
+        """
+        if agent in self._validated:
+            return
+
+        allowed = TEMPLATE_VARIABLES.get(agent, set()) | set(self.env.globals) | {"loop"}
+        names = self.list_templates(agent)
+        missing = sorted(set(required) - set(names))
+        if missing:
+            raise TemplateValidationError(
+                f"{agent}: missing templates {missing} in {self.template_dirs.get(agent)}"
+            )
+
+        errors = []
+        for name in names:
+            full_name = f"{agent}/{name}"
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, full_name)
+                unknown = meta.find_undeclared_variables(self.env.parse(source)) - allowed
+                self.env.get_template(full_name)  # compile (and fill bytecode cache)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(f"{full_name}: {e}")
+                continue
+            if unknown:
+                errors.append(f"{full_name}: unknown variables {sorted(unknown)}")
+
+        if errors:
+            raise TemplateValidationError("Template validation failed:\n  " + "\n  ".join(errors))
+        self._validated.add(agent)
+
+    def precompile(self) -> int:
+        """Validate and compile every template, filling the bytecode cache.
+        Returns the number of templates compiled."""
+        for agent in self.template_dirs:
+            self.validate(agent)
+        return sum(len(self.list_templates(agent)) for agent in self.template_dirs)
+
+
+@lru_cache(maxsize=1)
+def get_template_registry() -> TemplateRegistry:
+    """Process-wide registry shared by all agents"""
+    return TemplateRegistry()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Kiểm tra và biên dịch trước template Jinja2")
+    parser.add_argument(
+        "--precompile", action="store_true",
+        help="Biên dịch tất cả template vào bytecode cache (TEMPLATE_CACHE_DIR)",
+    )
+    args = parser.parse_args(argv)
+
+    registry = TemplateRegistry(auto_reload=False)
+    try:
+        if args.precompile:
+            count = registry.precompile()
+            print(f"✅ Đã biên dịch {count} template vào {CONFIG.get('TEMPLATE_CACHE_DIR')}")
+        else:
+            for agent in registry.template_dirs:
+                registry.validate(agent)
+            print("✅ Tất cả template hợp lệ")
+    except TemplateValidationError as e:
+        sys.exit(f"❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+ANN benchmark: IVF and quantized search, recall@k and latency against exact search.
+
+    python -m benchmarks.bench_ann                         # 200k x 256, clustered
+    python -m benchmarks.bench_ann --rows 1000000 --nprobe 4 8 16 32
+    python -m benchmarks.bench_ann --quant int8 pq --skip-ivf
+    python -m benchmarks.bench_ann --compare benchmarks/results/ann-<sha>.json
+
+Vectors are synthetic: normalized points scattered around random centres
+(closer to real embeddings than uniform noise, which has no neighbours).
+Queries are perturbed copies of stored rows. Exact search gives the ground
+truth; each nprobe reports recall@k and single-query latency. Each
+quantization reports the memory of its codes against the float32 matrix and
+recall with and without exact re-scoring.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.common import compare_reports, new_report, save_report, summarize
+from retriever.ann import IVFIndex
+from retriever.quantization import KINDS, QuantizedIndex
+from retriever.vector_store import VectorStore, _normalize
+
+
+def make_vectors(rows: int, dim: int, centres: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centre_vecs = rng.standard_normal((centres, dim), dtype=np.float32)
+    assign = rng.integers(centres, size=rows)
+    return _normalize(centre_vecs[assign] + 0.6 * rng.standard_normal((rows, dim), dtype=np.float32))
+
+
+def make_store(vectors: np.ndarray, index_dir: str, dtype: str = "float32") -> VectorStore:
+    store = VectorStore(index_dir=index_dir, embed_model=object(), dtype=dtype)
+    store.add([{"text": ""}] * len(vectors), vectors)
+    return store
+
+
+def time_queries(search, queries: np.ndarray, k: int):
+    """(ids (n, k), per-query latency summary)"""
+    ids, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        idx, _ = search(q, k)
+        latencies.append(time.perf_counter() - started)
+        ids.append(idx[0])
+    return np.stack(ids), summarize(latencies)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = [len(np.intersect1d(f, t)) for f, t in zip(found, truth)]
+    return round(float(np.mean(hits)) / truth.shape[1], 4)
+
+
+def _row(label: str, recall: float, lat: Dict[str, float], exact_p50: float) -> None:
+    speedup = exact_p50 / lat["p50"] if lat["p50"] else 0.0
+    print(f"{label:12s} recall {recall:6.3f}   p50 {lat['p50'] * 1e3:8.3f} ms   "
+          f"p95 {lat['p95'] * 1e3:8.3f} ms   x{speedup:5.1f}")
+
+
+def bench_ivf(args, store: VectorStore, queries: np.ndarray, truth: np.ndarray,
+          exact_lat: Dict[str, float], report: Dict[str, Any]) -> None:
+    started = time.perf_counter()
+    ivf = IVFIndex.train(store, args.nlist)
+    train_s = time.perf_counter() - started
+    ivf_bytes = ivf.centroids.nbytes + ivf.list_ptr.nbytes + np.asarray(ivf.list_ids).nbytes
+    report["results"]["ivf_build"] = {"seconds": round(train_s, 3), "nlist": ivf.nlist,
+                                      "index_mb": round(ivf_bytes / 2**20, 2)}
+    print(f"IVF nlist {ivf.nlist}: trained in {train_s:.1f}s, {ivf_bytes / 2**20:.1f} MB\n")
+
+    for nprobe in args.nprobe:
+        found, lat = time_queries(
+            lambda q, k, p=nprobe: ivf.search(store, q, k, nprobe=p), queries, args.k
+        )
+        recall = recall_at_k(found, truth)
+        report["results"][f"nprobe_{nprobe}"] = {
+            "recall": recall, "latency_s": lat,
+            "speedup_p50": round(exact_lat["p50"] / lat["p50"], 2) if lat["p50"] else None,
+        }
+        _row(f"nprobe {nprobe}", recall, lat, exact_lat["p50"])
+
+
+def bench_quant(args, kind: str, store: VectorStore, queries: np.ndarray, truth: np.ndarray,
+                exact_lat: Dict[str, float], report: Dict[str, Any]) -> None:
+    started = time.perf_counter()
+    quant = QuantizedIndex.train(store, kind, pq_m=args.pq_m, rescore=args.rescore)
+    train_s = time.perf_counter() - started
+    float_mb = len(store) * store.dim * 4 / 2**20
+    res: Dict[str, Any] = {"train_s": round(train_s, 3), "mb": round(quant.nbytes / 2**20, 2),
+                           "float32_mb": round(float_mb, 2),
+                           "compression": round(float_mb * 2**20 / quant.nbytes, 1)}
+    print(f"\n{kind}: {res['mb']} MB vs {res['float32_mb']} MB float32 "
+          f"(x{res['compression']}), trained in {train_s:.1f}s")
+    for rescore in (0, args.rescore):
+        found, lat = time_queries(
+            lambda q, k, r=rescore: quant.search(store, q, k, rescore=r), queries, args.k
+        )
+        recall = recall_at_k(found, truth)
+        res[f"rescore_{rescore}"] = {"recall": recall, "latency_s": lat}
+        _row(f"{kind} r={rescore}", recall, lat, exact_lat["p50"])
+    report["results"][kind] = res
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark IVF ANN / quantized search (recall@k vs latency, memory)")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--centres", type=int, default=2000, help="Số cụm sinh dữ liệu")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="Mặc định 4*sqrt(rows)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--skip-ivf", action="store_true", help="Bỏ qua IVF")
+    parser.add_argument("--quant", nargs="*", default=[], choices=KINDS, help="Đo thêm int8 / pq")
+    parser.add_argument("--pq-m", type=int, default=32, help="Số sub-vector PQ")
+    parser.add_argument("--rescore", type=int, default=4, help="k * rescore ứng viên được chấm lại")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    vectors = make_vectors(args.rows, args.dim, args.centres, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = _normalize(vectors[rng.integers(args.rows, size=args.queries)]
+                         + 0.3 * rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+    report = new_report("ann", rows=args.rows, dim=args.dim, centres=args.centres,
+                        queries=args.queries, k=args.k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(vectors, tmp)
+        del vectors
+
+        truth, exact_lat = time_queries(store.exact_search, queries, args.k)
+        report["results"]["exact"] = {"latency_s": exact_lat}
+        print(f"{'exact':12s} recall  1.000   p50 {exact_lat['p50'] * 1e3:8.3f} ms   "
+              f"p95 {exact_lat['p95'] * 1e3:8.3f} ms")
+
+        if not args.skip_ivf:
+            bench_ivf(args, store, queries, truth, exact_lat, report)
+        for kind in args.quant:
+            bench_quant(args, kind, store, queries, truth, exact_lat, report)
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["recall", "p50", "p95", "mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Markdown chunker benchmark: streaming throughput and memory on large inputs.
+
+    python -m benchmarks.bench_chunker                      # 256 MB corpus, 64 files
+    python -m benchmarks.bench_chunker --mb 512 --workers 1 4 8
+    python -m benchmarks.bench_chunker --compare benchmarks/results/chunker-<sha>.json
+
+A synthetic AFFINA-like corpus (##/### sections, paragraphs, tables) is
+written to a temp directory, then:
+
+    single   one file of the whole size, streamed line by line
+             (MB/s, chunks/s, peak RSS growth: stays ~flat when streaming)
+    dir      the corpus split into --files files, chunked over a process
+             pool for each --workers value (MB/s, speedup vs 1 worker)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import compare_reports, new_report, save_report
+from utils.affina_markdown import iter_markdown_file, process_markdown_files
+
+WORDS = ("bảo hiểm sức khỏe quyền lợi khách hàng AFFINA gói phí nằm viện ngoại trú tai nạn "
+         "chương trình khuyến mãi điều kiện thời gian áp dụng hợp đồng bồi thường thẻ "
+         "quà tặng đăng ký hotline doanh nghiệp nhân viên gia đình trẻ em").split()
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))).capitalize() + "."
+
+
+def _blocks(seed: int, n: int = 400) -> List[str]:
+    """Pre-rendered section blocks, reused to write large corpora quickly"""
+    rng = random.Random(seed)
+    blocks = []
+    for b in range(n):
+        lines = [f"## Chương Trình {b}", ""]
+        for s in range(rng.randint(1, 3)):
+            lines += [f"### Mục {b}.{s}", ""]
+            for _ in range(rng.randint(2, 6)):
+                lines += [" ".join(_sentence(rng) for _ in range(rng.randint(2, 6))), ""]
+            if rng.random() < 0.4:
+                lines += [f"**Bảng {b}.{s}: Quyền lợi**", "| Gói | Phí | Quyền lợi |", "|---|---|---|"]
+                lines += [f"| Gói {r} | {rng.randint(100, 999)}k | {_sentence(rng)} |"
+                          for r in range(rng.randint(5, 60))]
+                lines.append("")
+        blocks.append("\n".join(lines) + "\n")
+    return blocks
+
+
+def write_corpus(path: Path, size_bytes: int, blocks: List[str], seed: int) -> int:
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Tài liệu AFFINA\n\n")
+        while written < size_bytes:
+            block = rng.choice(blocks)
+            f.write(block)
+            written += len(block.encode("utf-8"))
+    return path.stat().st_size
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_single(path: Path, max_tokens: int, overlap: int) -> Dict[str, Any]:
+    size_mb = path.stat().st_size / 2**20
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    chunks = tables = 0
+    for node in iter_markdown_file(str(path), "bench", max_tokens, overlap):
+        chunks += 1
+        tables += node["metadata"]["chunk_type"] == "table"
+    elapsed = time.perf_counter() - started
+    return {
+        "mb": round(size_mb, 1), "seconds": round(elapsed, 3),
+        "mb_per_s": round(size_mb / elapsed, 2), "chunks": chunks, "table_chunks": tables,
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def bench_dir(files: List[Path], workers: int, max_tokens: int, overlap: int) -> Dict[str, Any]:
+    size_mb = sum(p.stat().st_size for p in files) / 2**20
+    started = time.perf_counter()
+    chunks = 0
+    for _, nodes in process_markdown_files([(p.name, p) for p in files], workers, max_tokens, overlap):
+        chunks += len(nodes)
+    elapsed = time.perf_counter() - started
+    return {"workers": workers, "seconds": round(elapsed, 3), "mb_per_s": round(size_mb / elapsed, 2),
+            "chunks": chunks}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark streaming markdown chunker (MB/s, memory, parallel)")
+    parser.add_argument("--mb", type=int, default=256, help="Kích thước corpus (MB)")
+    parser.add_argument("--files", type=int, default=64, help="Số file khi đo theo thư mục")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=64)
+    parser.add_argument("--skip-single", action="store_true", help="Bỏ qua đo một file lớn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    report = new_report("chunker", mb=args.mb, files=args.files,
+                        max_tokens=args.max_tokens, overlap=args.overlap)
+    blocks = _blocks(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        if not args.skip_single:
+            big = tmp_dir / "single.md"
+            write_corpus(big, args.mb * 2**20, blocks, args.seed)
+            res = bench_single(big, args.max_tokens, args.overlap)
+            report["results"]["single"] = res
+            print(f"single   {res['mb']:7.1f} MB  {res['seconds']:7.2f}s  {res['mb_per_s']:6.2f} MB/s  "
+                  f"{res['chunks']} chunks ({res['table_chunks']} table)  RSS +{res['rss_growth_mb']} MB")
+            big.unlink()
+
+        files = []
+        for i in range(args.files):
+            path = tmp_dir / f"doc_{i:04d}.md"
+            write_corpus(path, args.mb * 2**20 // args.files, blocks, args.seed + i)
+            files.append(path)
+        base = None
+        for workers in args.workers:
+            res = bench_dir(files, workers, args.max_tokens, args.overlap)
+            base = base or res["seconds"]
+            res["speedup"] = round(base / res["seconds"], 2)
+            report["results"][f"workers_{workers}"] = res
+            print(f"dir      workers {workers:2d}  {res['seconds']:7.2f}s  {res['mb_per_s']:6.2f} MB/s  "
+                  f"x{res['speedup']}  {res['chunks']} chunks")
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["mb_per_s", "seconds", "rss_growth_mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Exporter benchmark: tokenize and export N generated-looking posts.
+
+    python -m benchmarks.bench_export                 # 10k posts
+    python -m benchmarks.bench_export --posts 2000 --compare benchmarks/results/export-<sha>.json
+
+Measures the markdown tokenizer alone and each format streamed into one
+file (JSONL, HTML, and DOCX when python-docx is installed), reporting
+posts/s and output size.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks.common import compare_reports, new_report, save_report
+from utils.exporters import export_posts, tokenize
+
+_EMOJI = ["🥗", "💪", "🏥", "✈️", "🌿", "❤️", "⚠️", "✅"]
+_WORDS = (
+    "sức khỏe dinh dưỡng bảo hiểm gia đình nhân viên văn phòng bữa trưa "
+    "vận động giấc ngủ phòng bệnh quyền lợi chi phí điều trị AFFINA"
+).split()
+
+
+def make_post(rng: random.Random) -> str:
+    """A post shaped like the generator's output: title, paragraphs with
+    bold/italic, a bullet and a numbered list, hashtags"""
+    def sentence(n: int) -> str:
+        words = [rng.choice(_WORDS) for _ in range(n)]
+        i = rng.randrange(n)
+        words[i] = f"**{words[i]}**"
+        if n > 4:
+            j = (i + 2) % n
+            words[j] = f"*{words[j]}*"
+        return " ".join(words).capitalize() + "."
+
+    parts = [f"# {rng.choice(_EMOJI)} {sentence(6).upper()}", ""]
+    for _ in range(rng.randint(2, 4)):
+        parts += [" ".join(sentence(rng.randint(8, 16)) for _ in range(3)), ""]
+    parts += ["## " + sentence(4)]
+    parts += [f"- {rng.choice(_EMOJI)} {sentence(8)}" for _ in range(rng.randint(3, 5))]
+    parts += [""] + [f"{i}. {sentence(6)}" for i in range(1, 4)]
+    parts += ["", " ".join(f"#{rng.choice(_WORDS).capitalize()}" for _ in range(4))]
+    return "\n".join(parts)
+
+
+def iter_posts(count: int, seed: int) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {"row": i, "score": round(rng.random(), 2), "content": make_post(rng)}
+
+
+def _timed(label: str, posts: int, fn) -> Dict[str, Any]:
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    res = {"seconds": round(elapsed, 4), "posts_per_second": round(posts / elapsed, 1)}
+    if size is not None:
+        res["output_mb"] = round(size / 2**20, 2)
+    print(f"{label:10s} {elapsed:8.2f}s {res['posts_per_second']:10.1f} posts/s")
+    return res
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark exporter (tokenizer, JSONL, HTML, DOCX)")
+    parser.add_argument("--posts", type=int, default=10000, help="Số bài")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-docx", action="store_true", help="Bỏ qua DOCX (chậm nhất)")
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    # Generated up front so only the export itself is timed
+    posts = list(iter_posts(args.posts, args.seed))
+    report = new_report("export", posts=args.posts, seed=args.seed)
+    report["params"]["input_mb"] = round(sum(len(p["content"]) for p in posts) / 2**20, 2)
+
+    def tokenize_all():
+        for post in posts:
+            for _ in tokenize(post["content"]):
+                pass
+
+    formats = ["jsonl", "html"]
+    if not args.skip_docx:
+        try:
+            import docx  # noqa: F401
+            formats.append("docx")
+        except ImportError:
+            print("⚠️ python-docx chưa được cài, bỏ qua DOCX")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report["results"]["tokenize"] = _timed("tokenize", args.posts, tokenize_all)
+        for fmt in formats:
+            path = Path(tmp) / f"posts.{fmt}"
+            report["results"][fmt] = _timed(
+                fmt, args.posts,
+                lambda: export_posts(posts, path).stat().st_size,
+            )
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["posts_per_second"])
+
+
+if __name__ == "__main__":
+    main()
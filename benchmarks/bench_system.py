@@ -0,0 +1,196 @@
+"""
+MultiAgentSystem benchmarks against the stub Ollama/Tavily server.
+
+    python -m benchmarks.bench_system                          # all suites, "fast" profile
+    python -m benchmarks.bench_system --suite latency --profile gpu
+    python -m benchmarks.bench_system --compare benchmarks/results/system-abc123.json
+
+Suites:
+    latency     end-to-end latency of sequential runs
+    throughput  runs/second for a batch executed by a thread pool
+    overhead    per node: wall time minus time spent in LLM calls and
+                searches, i.e. what our own code (templates, parsing,
+                state handling, export) costs
+    memory      tracemalloc peak per run and process max RSS
+
+No real model is needed: a stub server is started in-process and the
+system is pointed at it through OLLAMA_HOST / TAVILY_API_URL.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import compare_reports, new_report, save_report, summarize
+from benchmarks.stub_server import PROFILES, start_stub_server
+
+SUITES = ("latency", "throughput", "overhead", "memory")
+
+RUN_KWARGS: Dict[str, Any] = {
+    "user_request": "Viết bài về dinh dưỡng cho nhân viên văn phòng",
+    "language": "vietnamese",
+    "topic_type": "food_nutrition",
+    "max_iterations": 2,
+    "pass_threshold": 0.75,
+    "enable_search": True,
+    "verbose": False,
+}
+
+
+def _max_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def create_system(stub_url: str):
+    """MultiAgentSystem wired to the stub; imports happen after the env is set"""
+    os.environ["OLLAMA_HOST"] = stub_url
+    os.environ["TAVILY_API_URL"] = f"{stub_url}/search"
+    from multiagent_system import MultiAgentSystem
+
+    system = MultiAgentSystem()
+    system.tavily_api_key = system.tavily_api_key or "stub"
+    return system.warm_up()
+
+
+def _run(system, run_id: str) -> float:
+    started = time.perf_counter()
+    result = system.run(**RUN_KWARGS, run_id=run_id)
+    elapsed = time.perf_counter() - started
+    if result.get("error"):
+        raise RuntimeError(f"run {run_id} failed: {result['error']}")
+    return elapsed
+
+
+def bench_latency(system, runs: int) -> Dict[str, Any]:
+    durations = [_run(system, f"latency-{i}") for i in range(runs)]
+    return {"run_seconds": summarize(durations)}
+
+
+def bench_throughput(system, runs: int, workers: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        durations = list(pool.map(lambda i: _run(system, f"throughput-{i}"), range(runs)))
+    elapsed = time.perf_counter() - started
+    return {
+        "workers": workers,
+        "runs": runs,
+        "wall_seconds": round(elapsed, 4),
+        "runs_per_second": round(runs / elapsed, 4),
+        "run_seconds": summarize(durations),
+    }
+
+
+def bench_overhead(system, runs: int) -> Dict[str, Any]:
+    from utils.tracing import get_tracer
+
+    tracer = get_tracer()
+    node_wall: Dict[str, List[float]] = defaultdict(list)
+    node_own: Dict[str, List[float]] = defaultdict(list)
+
+    for i in range(runs):
+        run_id = f"overhead-{i}"
+        _run(system, run_id)
+        spans = tracer.spans(run_id)
+        # Time inside LLM calls / searches, per node, for this run
+        external: Dict[str, float] = defaultdict(float)
+        for span in spans:
+            if span["kind"] in ("llm", "search"):
+                external[span["agent"]] += span["duration"]
+        # A node can run several times per run (revision loop); compare the
+        # node totals with the external totals of the same node
+        totals: Dict[str, float] = defaultdict(float)
+        for span in spans:
+            if span["kind"] == "node":
+                totals[span["name"]] += span["duration"]
+        for node, wall in totals.items():
+            node_wall[node].append(wall)
+            node_own[node].append(max(0.0, wall - external.get(node, 0.0)))
+
+    return {
+        node: {"wall_seconds": summarize(node_wall[node]), "own_seconds": summarize(node_own[node])}
+        for node in sorted(node_wall)
+    }
+
+
+def bench_memory(system, runs: int) -> Dict[str, Any]:
+    peaks: List[float] = []
+    retained: List[float] = []
+    tracemalloc.start()
+    try:
+        for i in range(runs):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _run(system, f"memory-{i}")
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 2**20)
+            retained.append((after - before) / 2**20)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_mb_per_run": summarize(peaks),
+        "retained_mb_per_run": summarize(retained),
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark MultiAgentSystem với stub Ollama/Tavily")
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Suite cần chạy (mặc định: tất cả)")
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES), help="Profile độ trễ của stub")
+    parser.add_argument("--recordings", default=None, help="File JSON recordings cho stub")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần chạy mỗi suite")
+    parser.add_argument("--workers", type=int, default=4, help="Số luồng cho suite throughput")
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    suites = args.suite or list(SUITES)
+    stub = start_stub_server(profile=args.profile, recordings=args.recordings)
+    report = new_report(
+        "system", profile=args.profile, runs=args.runs, workers=args.workers,
+        suites=suites, run_kwargs=RUN_KWARGS,
+    )
+
+    try:
+        system = create_system(stub.url)
+        _run(system, "warmup")  # first request pays the stub's model load
+
+        for suite in suites:
+            started = time.perf_counter()
+            if suite == "latency":
+                res = bench_latency(system, args.runs)
+            elif suite == "throughput":
+                res = bench_throughput(system, args.runs * args.workers, args.workers)
+            elif suite == "overhead":
+                res = bench_overhead(system, args.runs)
+            else:
+                res = bench_memory(system, args.runs)
+            report["results"][suite] = res
+            print(f"✅ {suite:10s} {time.perf_counter() - started:7.2f}s")
+            print(json.dumps(res, indent=2, ensure_ascii=False))
+    finally:
+        report["stub_stats"] = dict(stub.backend.stats)
+        stub.shutdown()
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["p50", "p95", "runs_per_second", "peak_mb", "max_rss_mb"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Helpers shared by the benchmark scripts (results files, percentiles)."""
+from __future__ import annotations
+
+import json
+import math
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def git_sha() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0–100); 0.0 for an empty sequence"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """count/mean/min/p50/p95/p99/max of a list of seconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 6),
+        "min": round(min(values), 6),
+        "p50": round(percentile(values, 50), 6),
+        "p95": round(percentile(values, 95), 6),
+        "p99": round(percentile(values, 99), 6),
+        "max": round(max(values), 6),
+    }
+
+
+def new_report(benchmark: str, **params: Any) -> Dict[str, Any]:
+    return {
+        "benchmark": benchmark,
+        "commit": git_sha(),
+        "python": sys.version.split()[0],
+        "timestamp": time.time(),
+        "params": params,
+        "results": {},
+    }
+
+
+def save_report(report: Dict[str, Any], out: Optional[str] = None) -> Path:
+    """Write to `out` or benchmarks/results/<benchmark>-<sha>.json"""
+    path = Path(out) if out else RESULTS_DIR / f"{report['benchmark']}-{report['commit']}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """{'a': {'b': 1}} -> {'a.b': 1} for numeric leaves"""
+    flat: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix.rstrip(".")] = data
+    return flat
+
+
+def compare_reports(current: Dict[str, Any], previous: Dict[str, Any], keys: Optional[List[str]] = None) -> None:
+    """Print numeric result deltas between two reports"""
+    print(f"\nSo với {previous.get('commit')}:")
+    old = flatten(previous.get("results", {}))
+    for key, value in flatten(current.get("results", {})).items():
+        if key not in old or (keys and not any(k in key for k in keys)):
+            continue
+        base = old[key]
+        change = f"{(value - base) / base * 100:+.1f}%" if base else "n/a"
+        print(f"  {key:50s} {base:12.4f} → {value:12.4f} ({change})")
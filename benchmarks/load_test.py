@@ -0,0 +1,223 @@
+"""
+Load test: how many concurrent posts does one backend sustain?
+
+    # closed loop: 1, 2, 4 and 8 runs in flight, 20 runs per level, stub backend
+    python -m benchmarks.load_test --concurrency 1,2,4,8 --requests 20 --profile gpu
+
+    # open loop: Poisson arrivals at 0.1 and 0.2 runs/s served by 4 workers,
+    # against the Ollama configured in OLLAMA_HOST
+    python -m benchmarks.load_test --rate 0.1,0.2 --workers 4 --requests 30 --backend real
+
+Per level it reports run latency percentiles, queueing delay (arrival until a
+worker picks the run up), per-agent node and LLM latency, the part of each
+LLM call spent waiting for a backend slot (call time minus Ollama's own
+load/prefill/generation timings), error and timeout rates and throughput.
+Together the levels form the throughput/latency curve used to size
+OLLAMA_NUM_PARALLEL and SERVER_WORKERS.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_system import RUN_KWARGS, create_system
+from benchmarks.common import compare_reports, new_report, save_report, summarize
+from benchmarks.stub_server import PROFILES, start_stub_server
+
+
+def _levels(value: str, cast) -> List:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+class LevelRecorder:
+    """Outcome and spans of every run of one load level"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.runs: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def execute(self, system, run_id: str, arrival: float) -> None:
+        from utils.tracing import get_tracer
+
+        start = time.perf_counter()
+        status, error = "ok", None
+        try:
+            result = system.run(**RUN_KWARGS, run_id=run_id)
+            if result.get("error"):
+                status, error = "error", str(result["error"])[:200]
+        except Exception as e:  # pylint: disable=broad-except
+            status, error = "error", f"{type(e).__name__}: {e}"
+        end = time.perf_counter()
+        if status == "ok" and end - start > self.timeout:
+            status = "timeout"
+
+        record = {
+            "run_id": run_id,
+            "status": status,
+            "error": error,
+            "queue_s": start - arrival,
+            "latency_s": end - start,
+            # Collected right away: the tracer keeps a bounded ring buffer
+            "spans": get_tracer().spans(run_id),
+        }
+        with self._lock:
+            self.runs.append(record)
+
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        total = len(self.runs)
+        ok = [r for r in self.runs if r["status"] == "ok"]
+        node_latency: Dict[str, List[float]] = defaultdict(list)
+        llm_latency: Dict[str, List[float]] = defaultdict(list)
+        backend_wait: Dict[str, List[float]] = defaultdict(list)
+        llm_errors = 0
+
+        for run in self.runs:
+            for span in run["spans"]:
+                if span["kind"] == "node":
+                    node_latency[span["name"]].append(span["duration"])
+                elif span["kind"] == "llm":
+                    agent = span.get("agent") or "none"
+                    llm_latency[agent].append(span["duration"])
+                    if span.get("error"):
+                        llm_errors += 1
+                    served = sum(span.get(k, 0.0) for k in (
+                        "load_duration_s", "prompt_eval_duration_s", "eval_duration_s"))
+                    if served:
+                        backend_wait[agent].append(max(0.0, span["duration"] - served))
+
+        return {
+            "runs": total,
+            "wall_seconds": round(wall_s, 4),
+            "throughput_rps": round(len(ok) / wall_s, 4) if wall_s else 0.0,
+            "error_rate": round(sum(r["status"] == "error" for r in self.runs) / total, 4) if total else 0.0,
+            "timeout_rate": round(sum(r["status"] == "timeout" for r in self.runs) / total, 4) if total else 0.0,
+            "llm_call_errors": llm_errors,
+            "latency_s": summarize([r["latency_s"] for r in self.runs if r["status"] != "error"]),
+            "queue_s": summarize([r["queue_s"] for r in self.runs]),
+            "node_latency_s": {k: summarize(v) for k, v in sorted(node_latency.items())},
+            "llm_latency_s": {k: summarize(v) for k, v in sorted(llm_latency.items())},
+            "backend_wait_s": {k: summarize(v) for k, v in sorted(backend_wait.items())},
+            "errors": sorted({r["error"] for r in self.runs if r["error"]})[:5],
+        }
+
+
+def run_closed_loop(system, concurrency: int, requests: int, timeout: float) -> Dict[str, Any]:
+    """`concurrency` clients, each starting a new run as soon as theirs ends"""
+    recorder = LevelRecorder(timeout)
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+
+    def client():
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            recorder.execute(system, f"load-c{concurrency}-{i}", time.perf_counter())
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"mode": "concurrency", "level": concurrency, **recorder.report(time.perf_counter() - started)}
+
+
+def run_open_loop(system, rate: float, requests: int, workers: int, timeout: float, seed: int) -> Dict[str, Any]:
+    """Poisson arrivals at `rate` runs/s; runs wait for one of `workers`"""
+    recorder = LevelRecorder(timeout)
+    rng = random.Random(seed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        arrival = started
+        for i in range(requests):
+            arrival += rng.expovariate(rate)
+            pause = arrival - time.perf_counter()
+            if pause > 0:
+                time.sleep(pause)
+            pool.submit(recorder.execute, system, f"load-r{rate}-{i}", arrival)
+    return {"mode": "rate", "level": rate, "workers": workers, **recorder.report(time.perf_counter() - started)}
+
+
+def print_level(res: Dict[str, Any]) -> None:
+    lat, queue = res["latency_s"], res["queue_s"]
+    print(
+        f"{res['mode']}={res['level']:<6} runs={res['runs']:<4} "
+        f"rps={res['throughput_rps']:<8} "
+        f"p50={lat.get('p50', 0):.2f}s p95={lat.get('p95', 0):.2f}s p99={lat.get('p99', 0):.2f}s "
+        f"queue p95={queue.get('p95', 0):.2f}s "
+        f"err={res['error_rate']:.0%} timeout={res['timeout_rate']:.0%}"
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test MultiAgentSystem (p50/p95/p99, throughput)")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", default=None, help="Các mức song song, vd 1,2,4,8 (closed loop)")
+    load.add_argument("--rate", default=None, help="Các tốc độ đến (run/giây), vd 0.1,0.2 (open loop)")
+    parser.add_argument("--requests", type=int, default=20, help="Số run mỗi mức")
+    parser.add_argument("--workers", type=int, default=4, help="Số worker cho chế độ --rate")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Run lâu hơn (giây) tính là timeout")
+    parser.add_argument("--backend", default="stub", choices=("stub", "real"), help="Stub server hoặc Ollama thật")
+    parser.add_argument("--profile", default="gpu", choices=sorted(PROFILES), help="Profile độ trễ của stub")
+    parser.add_argument("--recordings", default=None, help="File JSON recordings cho stub")
+    parser.add_argument("--seed", type=int, default=0, help="Seed cho thời điểm đến (--rate)")
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    concurrency = _levels(args.concurrency, int) if args.concurrency else []
+    rates = _levels(args.rate, float) if args.rate else []
+    if not concurrency and not rates:
+        concurrency = [1, 2, 4]
+    if any(r <= 0 for r in rates) or any(c < 1 for c in concurrency):
+        parser.error("--rate phải > 0 và --concurrency phải >= 1")
+
+    report = new_report(
+        "load", backend=args.backend, profile=args.profile if args.backend == "stub" else None,
+        concurrency=concurrency, rates=rates, requests=args.requests, workers=args.workers,
+        timeout=args.timeout, seed=args.seed,
+    )
+
+    stub = None
+    if args.backend == "stub":
+        stub = start_stub_server(profile=args.profile, recordings=args.recordings)
+        system = create_system(stub.url)
+    else:
+        from multiagent_system import MultiAgentSystem
+        system = MultiAgentSystem().warm_up()
+
+    try:
+        system.run(**RUN_KWARGS, run_id="load-warmup")  # model load is not part of the curve
+        for level in concurrency:
+            res = run_closed_loop(system, level, args.requests, args.timeout)
+            report["results"][f"concurrency_{level}"] = res
+            print_level(res)
+        for rate in rates:
+            res = run_open_loop(system, rate, args.requests, args.workers, args.timeout, args.seed)
+            report["results"][f"rate_{rate}"] = res
+            print_level(res)
+    finally:
+        if stub is not None:
+            report["stub_stats"] = dict(stub.backend.stats)
+            stub.shutdown()
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["throughput_rps", "latency_s.p50", "latency_s.p95", "latency_s.p99"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold-start benchmark based on `python -X importtime`.
+
+    python -m benchmarks.startup                      # measure, save JSON
+    python -m benchmarks.startup --compare OLD.json   # and diff against a run
+
+For every target it records the wall time of a fresh interpreter and the
+cumulative import time of the heaviest modules, then writes
+benchmarks/results/startup-<git sha>.json so results can be compared
+between commits.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import ROOT, compare_reports, new_report, save_report
+
+# name -> argv run in a fresh interpreter (cwd = repo root)
+TARGETS: Dict[str, List[str]] = {
+    "import_multiagent_system": ["-c", "import multiagent_system"],
+    "main_help": ["main.py", "--help"],
+    "main_usage_error": ["main.py"],
+    "import_server": ["-c", "import server"],
+}
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Parse `-X importtime` lines into {module, self_us, cumulative_us, depth}"""
+    rows = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(4),
+                "self_us": int(m.group(1)),
+                "cumulative_us": int(m.group(2)),
+                "depth": (len(m.group(3)) - 1) // 2,
+            })
+    return rows
+
+
+def measure(argv: List[str], repeat: int) -> Dict[str, Any]:
+    wall: List[float] = []
+    imports: List[Dict[str, Any]] = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        wall.append(time.perf_counter() - started)
+        imports = parse_importtime(proc.stderr)
+
+    top_level = sorted(
+        (r for r in imports if r["depth"] == 0),
+        key=lambda r: r["cumulative_us"],
+        reverse=True,
+    )
+    return {
+        "argv": argv,
+        "wall_ms_median": round(statistics.median(wall) * 1000, 1),
+        "wall_ms_min": round(min(wall) * 1000, 1),
+        "import_total_ms": round(sum(r["cumulative_us"] for r in top_level) / 1000, 1),
+        "modules_imported": len(imports),
+        "top_imports": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 1)}
+            for r in top_level[:15]
+        ],
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động (python -X importtime)")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi target")
+    parser.add_argument("--out", default=None, help="File JSON kết quả")
+    parser.add_argument("--compare", default=None, help="File JSON của lần đo trước để so sánh")
+    args = parser.parse_args(argv)
+
+    report = new_report("startup", repeat=args.repeat)
+
+    for name, target_argv in TARGETS.items():
+        res = measure(target_argv, args.repeat)
+        report["results"][name] = res
+        heaviest = ", ".join(f"{r['module']} {r['cumulative_ms']}ms" for r in res["top_imports"][:3])
+        print(f"{name:28s} {res['wall_ms_median']:8.1f} ms  ({res['modules_imported']} modules; {heaviest})")
+
+    print(f"\n💾 {save_report(report, args.out)}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        compare_reports(report, previous, keys=["wall_ms_median"])
+
+
+if __name__ == "__main__":
+    main()
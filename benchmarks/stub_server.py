@@ -0,0 +1,325 @@
+"""
+Stub backend speaking the Ollama HTTP API and the Tavily search endpoint.
+
+    python -m benchmarks.stub_server --port 11500 --profile cpu-small
+    OLLAMA_HOST=http://127.0.0.1:11500 python main.py --demo
+
+Chat replies come from a recordings file (benchmarks/recordings/default.json
+by default): each entry matches a substring of the prompt and replays its
+`responses` round-robin. Latency follows a profile: model load on the first
+request, prompt prefill at `prefill_tps`, then tokens streamed at `gen_tps`,
+with at most `num_parallel` requests generating at once (like
+OLLAMA_NUM_PARALLEL); the rest wait. /api/embed returns deterministic
+pseudo-random unit vectors (EMBED_DIM, like nomic-embed-text) per input.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_RECORDINGS = Path(__file__).resolve().parent / "recordings" / "default.json"
+
+# name -> latency profile; rates are tokens/second, 0 = instant
+PROFILES: Dict[str, Dict[str, float]] = {
+    "instant": {"load_s": 0.0, "prefill_tps": 0, "gen_tps": 0, "num_parallel": 64, "search_s": 0.0},
+    "fast": {"load_s": 0.05, "prefill_tps": 20000, "gen_tps": 2000, "num_parallel": 8, "search_s": 0.01},
+    "gpu": {"load_s": 2.0, "prefill_tps": 3000, "gen_tps": 80, "num_parallel": 4, "search_s": 0.8},
+    "cpu-small": {"load_s": 1.5, "prefill_tps": 150, "gen_tps": 15, "num_parallel": 1, "search_s": 1.2},
+}
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+EMBED_DIM = 768
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token), good enough for pacing"""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def split_tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text) or [""]
+
+
+def embed_text(text: str, dim: int = EMBED_DIM) -> List[float]:
+    """Unit vector seeded by the text: same input, same embedding"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class Recordings:
+    def __init__(self, data: Dict[str, Any]):
+        self.models: List[str] = data.get("models", ["qwen3:1.7b"])
+        self.chat: List[Dict[str, Any]] = data.get("chat", [])
+        self.search: Dict[str, Any] = data.get("search", {"answer": "", "results": []})
+        self._cursors = [itertools.count() for _ in self.chat]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Recordings":
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def reply(self, prompt: str) -> str:
+        for i, entry in enumerate(self.chat):
+            if entry.get("match", "") in prompt:
+                responses = entry["responses"]
+                with self._lock:
+                    n = next(self._cursors[i])
+                return responses[n % len(responses)]
+        return "<thinking>stub</thinking>\n<content>Stub response.</content>"
+
+
+class Backend:
+    """Shared state of the stub: recordings, profile and the parallel slots"""
+
+    def __init__(self, recordings: Recordings, profile: Dict[str, float]):
+        self.recordings = recordings
+        self.profile = profile
+        self.slots = threading.BoundedSemaphore(int(profile.get("num_parallel", 1)) or 1)
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self.stats = {"chat_requests": 0, "search_requests": 0, "max_waiting": 0}
+        self._waiting = 0
+        self._stats_lock = threading.Lock()
+
+    def _track_waiting(self, delta: int) -> None:
+        with self._stats_lock:
+            self._waiting += delta
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self._waiting)
+
+    def generate(self, prompt: str) -> Iterator[Dict[str, Any]]:
+        """Yield {"token": str} pieces then a final {"done": True, ...metrics}"""
+        with self._stats_lock:
+            self.stats["chat_requests"] += 1
+        reply = self.recordings.reply(prompt)
+        prompt_tokens = count_tokens(prompt)
+        tokens = split_tokens(reply)
+
+        queued = time.perf_counter()
+        self._track_waiting(1)
+        self.slots.acquire()
+        self._track_waiting(-1)
+        try:
+            started = time.perf_counter()
+            load_s = 0.0
+            with self._load_lock:
+                if not self._loaded:
+                    load_s = self.profile.get("load_s", 0.0)
+                    time.sleep(load_s)
+                    self._loaded = True
+
+            prefill_tps = self.profile.get("prefill_tps", 0)
+            prefill_s = prompt_tokens / prefill_tps if prefill_tps else 0.0
+            time.sleep(prefill_s)
+
+            gen_tps = self.profile.get("gen_tps", 0)
+            delay = 1.0 / gen_tps if gen_tps else 0.0
+            gen_started = time.perf_counter()
+            for i, token in enumerate(tokens):
+                if delay:
+                    # Sleep to the schedule instead of per token, so pacing does not drift
+                    target = gen_started + (i + 1) * delay
+                    pause = target - time.perf_counter()
+                    if pause > 0:
+                        time.sleep(pause)
+                yield {"token": token}
+            eval_s = time.perf_counter() - gen_started
+        finally:
+            self.slots.release()
+
+        yield {
+            "done": True,
+            "total_duration": int((time.perf_counter() - queued) * 1e9),
+            "load_duration": int(load_s * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_s * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(eval_s * 1e9),
+            "queue_duration": int((started - queued) * 1e9),
+        }
+
+    def search(self, query: str) -> Dict[str, Any]:
+        with self._stats_lock:
+            self.stats["search_requests"] += 1
+        time.sleep(self.profile.get("search_s", 0.0))
+        return {"query": query, "response_time": self.profile.get("search_s", 0.0), **self.recordings.search}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _prompt_of(body: Dict[str, Any]) -> str:
+    if "messages" in body:
+        return "\n".join(str(m.get("content", "")) for m in body["messages"])
+    return str(body.get("prompt", ""))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, backend: Backend):
+        super().__init__(address, StubRequestHandler)
+        self.backend = backend
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server: StubServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def _send_json(self, payload: Any, status: int = HTTPStatus.OK) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_ndjson(self) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunks(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self) -> None:  # noqa: N802
+        backend = self.server.backend
+        if self.path.rstrip("/") in ("", "/"):
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Length", "17")
+            self.end_headers()
+            self.wfile.write(b"Ollama is running")
+        elif self.path.startswith("/api/tags"):
+            self._send_json({"models": [
+                {"name": m, "model": m, "modified_at": _now(), "size": 0, "digest": hashlib.sha256(m.encode()).hexdigest()}
+                for m in backend.recordings.models
+            ]})
+        elif self.path.startswith("/api/version"):
+            self._send_json({"version": "0.0.0-stub"})
+        elif self.path.startswith("/stats"):
+            self._send_json(backend.stats)
+        else:
+            self._send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+
+    def do_POST(self) -> None:  # noqa: N802
+        backend = self.server.backend
+        body = self._read_json()
+        path = self.path.rstrip("/")
+
+        if path in ("/api/chat", "/api/generate"):
+            self._chat(body, chat=path == "/api/chat")
+        elif path == "/api/embed":
+            inputs = body.get("input", "")
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+            self._send_json({"model": body.get("model", "stub"),
+                             "embeddings": [embed_text(text) for text in inputs]})
+        elif path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+        elif path == "/api/pull":
+            if body.get("stream", True):
+                self._start_ndjson()
+                self._write_chunk({"status": "success"})
+                self._end_chunks()
+            else:
+                self._send_json({"status": "success"})
+        elif path == "/search":
+            self._send_json(backend.search(body.get("query", "")))
+        else:
+            self._send_json({"error": "not found"}, HTTPStatus.NOT_FOUND)
+
+    def _chat(self, body: Dict[str, Any], chat: bool) -> None:
+        model = body.get("model", "stub")
+        events = self.server.backend.generate(_prompt_of(body))
+
+        def piece(text: str, done: bool, **extra: Any) -> Dict[str, Any]:
+            base = {"model": model, "created_at": _now(), "done": done, **extra}
+            if chat:
+                base["message"] = {"role": "assistant", "content": text}
+            else:
+                base["response"] = text
+            return base
+
+        if body.get("stream", True):
+            self._start_ndjson()
+            for event in events:
+                if event.get("done"):
+                    self._write_chunk(piece("", True, done_reason="stop", **{k: v for k, v in event.items() if k != "done"}))
+                else:
+                    self._write_chunk(piece(event["token"], False))
+            self._end_chunks()
+        else:
+            text, final = [], {}
+            for event in events:
+                if event.get("done"):
+                    final = {k: v for k, v in event.items() if k != "done"}
+                else:
+                    text.append(event["token"])
+            self._send_json(piece("".join(text), True, done_reason="stop", **final))
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    profile: str | Dict[str, float] = "instant",
+    recordings: Optional[str | Path] = None,
+) -> StubServer:
+    """Start the stub in a daemon thread; port 0 picks a free port (see .url)"""
+    prof = PROFILES[profile] if isinstance(profile, str) else profile
+    backend = Backend(Recordings.load(recordings or DEFAULT_RECORDINGS), prof)
+    server = StubServer((host, port), backend)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama/Tavily server cho benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES))
+    parser.add_argument("--recordings", default=None, help="File JSON recordings")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.host, args.port, args.profile, args.recordings)
+    print(f"🧪 Stub Ollama/Tavily tại {server.url} (profile {args.profile})")
+    print(f"   OLLAMA_HOST={server.url}  TAVILY_API_URL={server.url}/search")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
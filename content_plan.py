@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from config import CONFIG
+from utils.log_service import configure_logging, get_logger
+
+logger = get_logger("content_plan")
+
+
+# Header aliases (lower-cased) for each field of MultiAgentSystem.run
+DEFAULT_COLUMN_ALIASES: Dict[str, List[str]] = {
+    "user_request": ["user_request", "chủ đề", "tiêu đề", "nội dung", "title", "topic", "request"],
+    "topic_type": ["topic_type", "loại bài", "chuyên mục", "category", "topic type"],
+    "target_audience": ["target_audience", "đối tượng", "khách hàng mục tiêu", "audience"],
+    "hashtags": ["hashtags", "hashtag"],
+}
+
+# Free-text "Loại bài" values (lower-cased) accepted for each topic type,
+# besides the topic type itself
+TOPIC_TYPE_ALIASES: Dict[str, List[str]] = {
+    "food_nutrition": ["dinh dưỡng", "ẩm thực", "ăn uống", "food", "nutrition"],
+    "disease_warning": ["cảnh báo bệnh", "bệnh", "disease"],
+    "travel_adventure": ["du lịch", "phiêu lưu", "travel", "adventure"],
+    "business_enterprise": ["doanh nghiệp", "kinh doanh", "business", "enterprise"],
+    "lifestyle_office": ["văn phòng", "lối sống", "dân văn phòng", "lifestyle", "office"],
+    "holiday_event": ["lễ", "lễ tết", "sự kiện", "ngày lễ", "holiday", "event"],
+}
+
+# How many leading rows are scanned for the header row
+HEADER_SCAN_ROWS = 10
+
+
+def _norm(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip()
+
+
+def parse_hashtags(value: Any) -> List[str]:
+    """'#a, #b c' -> ['a', 'b', 'c'] (templates add the '#' themselves)"""
+    tags = re.split(r"[\s,;]+", _norm(value))
+    return [t.lstrip("#") for t in tags if t.lstrip("#")]
+
+
+def _topic_key(value: Any) -> str:
+    return re.sub(r"[\s\-/]+", "_", _norm(value).lower())
+
+
+def match_topic_type(value: Any) -> Optional[str]:
+    """The topic type a cell names exactly or through TOPIC_TYPE_ALIASES, else None"""
+    key = _topic_key(value)
+    if not key:
+        return None
+    for topic in CONFIG.get("TOPIC_TYPES", []):
+        if key == topic or key in (_topic_key(a) for a in TOPIC_TYPE_ALIASES.get(topic, [])):
+            return topic
+    return None
+
+
+def normalize_topic_type(value: Any) -> str:
+    """Map a free-text cell to one of CONFIG['TOPIC_TYPES'] (DEFAULT_TOPIC_TYPE if none matches)"""
+    return match_topic_type(value) or CONFIG.get("DEFAULT_TOPIC_TYPE", "food_nutrition")
+
+
+def _find_header(rows: Iterator[Tuple[Any, ...]], aliases: Dict[str, List[str]]) -> Tuple[int, Dict[str, int]]:
+    """Consume rows until one looks like the header.
+    Returns (header row number, field -> column index)."""
+    for header_row, row in zip(range(1, HEADER_SCAN_ROWS + 1), rows):
+        cells = [_norm(c).lower() for c in row]
+        # first alias found wins, so a --map column beats the built-in names
+        columns = {}
+        for field, names in aliases.items():
+            idx = next((cells.index(name) for name in names if name in cells), None)
+            if idx is not None:
+                columns[field] = idx
+        if "user_request" in columns:
+            return header_row, columns
+    raise ValueError(
+        f"Không tìm thấy cột 'user_request' trong {HEADER_SCAN_ROWS} dòng đầu. "
+        "Dùng --map user_request=<tên cột> để chỉ định."
+    )
+
+
+def iter_plan_rows(
+    file_path: str | Path,
+    sheet_name: Optional[str] = None,
+    aliases: Optional[Dict[str, List[str]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream rows of the content plan as MultiAgentSystem.run kwargs.
+    Uses openpyxl read-only mode, so only the current row is held in memory.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header_row, columns = _find_header(rows, aliases or DEFAULT_COLUMN_ALIASES)
+
+        for row_number, row in enumerate(rows, start=header_row + 1):
+            def cell(field: str) -> Any:
+                idx = columns.get(field)
+                return row[idx] if idx is not None and idx < len(row) else None
+
+            user_request = _norm(cell("user_request"))
+            if not user_request:
+                continue
+            raw_topic = _norm(cell("topic_type"))
+            topic_type = normalize_topic_type(raw_topic)
+            if raw_topic and match_topic_type(raw_topic) is None:
+                logger.warning("Dòng %d: loại bài %r không khớp TOPIC_TYPES, dùng %s",
+                               row_number, raw_topic, topic_type)
+            yield {
+                "row": row_number,
+                "user_request": user_request,
+                "topic_type": topic_type,
+                "target_audience": _norm(cell("target_audience")) or None,
+                "custom_hashtags": parse_hashtags(cell("hashtags")),
+            }
+    finally:
+        wb.close()
+
+
+def row_key(row: Dict[str, Any]) -> str:
+    """Identity of a plan row, used for dedupe and resume"""
+    return json.dumps(
+        [row["user_request"].lower(), row["topic_type"], (row.get("target_audience") or "").lower(),
+         sorted(t.lower() for t in row.get("custom_hashtags") or [])],
+        ensure_ascii=False,
+    )
+
+
+def dedupe_rows(rows: Iterator[Dict[str, Any]], seen: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Drop rows whose key was already seen (identical rows or already-done rows)"""
+    seen = set() if seen is None else seen
+    for row in rows:
+        key = row_key(row)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield row
+
+
+def load_done_keys(jsonl_path: Path) -> Set[str]:
+    """Keys of rows already written successfully, so a rerun resumes"""
+    done: Set[str] = set()
+    if not jsonl_path.exists():
+        return done
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("key") and not record.get("error"):
+                done.add(record["key"])
+    return done
+
+
+def iter_result_records(jsonl_path: Path) -> Iterator[Dict[str, Any]]:
+    """Successful records of a results file (for the archive)"""
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("content") and not record.get("error"):
+                yield record
+
+
+class JsonlResultWriter:
+    """Append one JSON line per finished post, flushed immediately"""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._f = path.open("a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def write_results_sheet(jsonl_path: Path, xlsx_path: Path) -> Path:
+    """Stream the JSONL results into a 'results' sheet (write-only workbook)"""
+    from openpyxl import Workbook
+
+    columns = ["row", "user_request", "topic_type", "target_audience", "score",
+               "iterations", "success", "docx_path", "seconds", "error", "content"]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("results")
+    ws.append(columns)
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            ws.append([
+                ", ".join(v) if isinstance(v, list) else v
+                for v in (record.get(c) for c in columns)
+            ])
+    wb.save(xlsx_path)
+    return xlsx_path
+
+
+def run_content_plan(
+    rows: Iterator[Dict[str, Any]],
+    runner: Callable[..., Dict[str, Any]],
+    writer: JsonlResultWriter,
+    workers: int = 2,
+    run_options: Optional[Dict[str, Any]] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, int]:
+    """
+    Feed plan rows into `runner` on a thread pool and write each result as soon
+    as it completes. At most `workers * 2` rows are in flight, so the Excel
+    stream is never read far ahead of generation.
+    """
+    run_options = run_options or {}
+    stats = {"submitted": 0, "succeeded": 0, "failed": 0}
+
+    def generate(row: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        params = {k: v for k, v in row.items() if k != "row"}
+        record = {"key": row_key(row), **row}
+        try:
+            result = runner(**params, **run_options)
+            record.update({
+                "content": result.get("content"),
+                "score": result.get("score"),
+                "iterations": result.get("iterations"),
+                "success": result.get("success"),
+                "docx_path": result.get("docx_path"),
+                "error": result.get("error"),
+            })
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("Row %s failed", row.get("row"))
+            record["error"] = str(e)
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return record
+
+    def drain(done: Set[Future]) -> None:
+        for fut in done:
+            record = fut.result()
+            writer.write(record)
+            stats["failed" if record.get("error") else "succeeded"] += 1
+            if on_result:
+                on_result(record)
+
+    in_flight: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="content-plan") as pool:
+        for row in rows:
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                drain(done)
+            in_flight.add(pool.submit(generate, row))
+            stats["submitted"] += 1
+        drain(wait(in_flight).done)
+
+    return stats
+
+
+def _parse_column_map(pairs: List[str]) -> Dict[str, List[str]]:
+    aliases = {k: list(v) for k, v in DEFAULT_COLUMN_ALIASES.items()}
+    for pair in pairs:
+        field, _, column = pair.partition("=")
+        if field not in aliases or not column:
+            raise ValueError(f"--map phải có dạng <field>=<tên cột>, field thuộc {list(aliases)}")
+        aliases[field].insert(0, column.strip().lower())
+    return aliases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content plan (.xlsx) -> batch generation")
+    parser.add_argument("plan", help="File Excel content plan")
+    parser.add_argument("--sheet", default=None, help="Tên sheet (mặc định: sheet đầu tiên)")
+    parser.add_argument("--out", default="outputs/content_plan_results.jsonl", help="File JSONL kết quả")
+    parser.add_argument("--xlsx", default=None, help="Ghi thêm sheet kết quả ra file .xlsx khi xong")
+    parser.add_argument("--archive", default=None,
+                        help="Ghi tất cả bài vào một file .zip (thay vì một file .docx mỗi bài)")
+    parser.add_argument("--workers", type=int, default=2, help="Số bài sinh song song")
+    parser.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                        help="Chỉ định tên cột, vd. --map user_request='Chủ đề'")
+    parser.add_argument("--language", default=CONFIG.get("DEFAULT_LANGUAGE", "vietnamese"))
+    parser.add_argument("--iter", type=int, default=CONFIG.get("MAX_ITERATIONS", 3))
+    parser.add_argument("--threshold", type=float, default=CONFIG.get("PASS_THRESHOLD", 0.75))
+    parser.add_argument("--no-search", action="store_true", help="Tắt Tavily search")
+    parser.add_argument("--no-rag", action="store_true", help="Không đưa kiến thức nội bộ AFFINA (RAG) vào prompt")
+    parser.add_argument("--no-resume", action="store_true", help="Chạy lại cả các dòng đã có kết quả")
+    parser.add_argument("--log-level", default=None,
+                        help="Mức log của hệ thống (mặc định: env LOG_LEVEL, không có thì WARNING)")
+    parser.add_argument("--trace-dir", default=None, help="Ghi traces.jsonl và metrics.prom khi xong")
+    parser.add_argument(
+        "--profile", nargs="?", const="", default=None, metavar="DIR",
+        help="Chạy cProfile + tracemalloc cho từng node, ghi báo cáo vào DIR (mặc định outputs/profile/<thời gian>)",
+    )
+    args = parser.parse_args()
+
+    try:
+        aliases = _parse_column_map(args.map)
+    except ValueError as e:
+        parser.error(str(e))
+
+    configure_logging(level=args.log_level or os.environ.get("LOG_LEVEL") or "WARNING")
+
+    out_path = Path(args.out)
+    seen = set() if args.no_resume else load_done_keys(out_path)
+    if seen:
+        print(f"⏭️  Bỏ qua {len(seen)} dòng đã có kết quả trong {out_path}")
+
+    if args.profile is not None:
+        from utils.profiling import enable_profiling
+        enable_profiling(args.profile or None)
+
+    from multiagent_system import MultiAgentSystem
+    system = MultiAgentSystem().warm_up()
+    if args.archive:
+        system.export_mode = "off"
+
+    rows = dedupe_rows(iter_plan_rows(args.plan, args.sheet, aliases), seen)
+    writer = JsonlResultWriter(out_path)
+
+    def report(record: Dict[str, Any]) -> None:
+        status = "❌" if record.get("error") else "✅"
+        score = record.get("score") or 0.0
+        print(f"{status} Dòng {record['row']}: {score:.2f} ({record['seconds']}s) - {record['user_request'][:60]}")
+
+    try:
+        stats = run_content_plan(
+            rows,
+            system.run,
+            writer,
+            workers=args.workers,
+            run_options={
+                "language": args.language,
+                "max_iterations": args.iter,
+                "pass_threshold": args.threshold,
+                "enable_search": not args.no_search,
+                "enable_rag": not args.no_rag,
+                "verbose": False,
+            },
+            on_result=report,
+        )
+    finally:
+        writer.close()
+        if args.profile is not None:
+            from utils.profiling import disable_profiling
+            print(f"🔬 Profile: {disable_profiling()}")
+
+    print(f"\nKết quả: {stats['succeeded']}/{stats['submitted']} bài thành công → {out_path}")
+    if args.trace_dir:
+        from utils.tracing import get_tracer
+        tracer = get_tracer()
+        tracer.export_jsonl(Path(args.trace_dir) / "traces.jsonl")
+        tracer.write_prometheus(Path(args.trace_dir) / "metrics.prom")
+        print(f"📈 Trace/metrics: {args.trace_dir}")
+    if args.xlsx:
+        print(f"📄 Sheet kết quả: {write_results_sheet(out_path, Path(args.xlsx))}")
+    if args.archive:
+        from utils.export_queue import write_archive
+        print(f"🗜️  Archive: {write_archive(iter_result_records(out_path), args.archive)}")
+    else:
+        from utils.export_queue import get_export_queue
+        get_export_queue().flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 from __future__ import annotations
 import argparse
 import sys
+import time
 import traceback
-from multiagent_system import MultiAgentSystem
 
 
 DEMO_PROMPT = (
@@ -38,9 +38,71 @@ def pretty_print_result(res: dict):
     print("-" * 50)
     print(res["content"])
 
-    if res.get("docx_path"):
+    if res.get("docx_export"):
+        try:
+            print(f"\n📄 File Word: {res['docx_export'].result()}")
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"\n⚠️ Không lưu được file Word: {exc}")
+    elif res.get("docx_path"):
         print(f"\n📄 File Word: {res['docx_path']}")
 
+def write_traces(trace_dir: str, run_id: str | None = None) -> None:
+    from pathlib import Path
+    from utils.tracing import get_tracer
+
+    tracer = get_tracer()
+    traces = tracer.export_jsonl(Path(trace_dir) / "traces.jsonl", run_id)
+    metrics = tracer.write_prometheus(Path(trace_dir) / "metrics.prom")
+    print(f"\n📈 Trace: {traces}\n📈 Metrics: {metrics}")
+
+
+NODE_LABELS = {
+    "initialize": "⚙️  Khởi tạo",
+    "orchestrator": "🧭 Orchestrator",
+    "generator": "✍️  Generator",
+    "evaluator": "🔎 Evaluator",
+    "finalize": "🏁 Hoàn tất",
+}
+
+
+def stream_run(system, **run_kwargs) -> dict | None:
+    """Render MultiAgentSystem.stream live; returns the result or None if cancelled."""
+    started = time.perf_counter()
+    current_node = None
+    events = system.stream(**run_kwargs, verbose=False)
+
+    try:
+        for event in events:
+            elapsed = time.perf_counter() - started
+
+            if event["type"] == "token":
+                # Only the generator's draft is worth watching token by token
+                if event["node"] != "generator":
+                    continue
+                if current_node != "generator":
+                    print(f"\n[{elapsed:6.1f}s] ✍️  Generator đang viết...\n", flush=True)
+                    current_node = "generator"
+                print(event["text"], end="", flush=True)
+
+            elif event["type"] == "node":
+                current_node = None
+                update = event["update"] or {}
+                line = f"\n[{elapsed:6.1f}s] {NODE_LABELS.get(event['node'], event['node'])} xong"
+                if event["node"] == "evaluator" and update.get("evaluator_output"):
+                    line += f" - Score: {update['evaluator_output']['score']:.2f} (vòng {update.get('iteration')})"
+                print(line, flush=True)
+
+            elif event["type"] == "result":
+                return event["result"]
+
+    except KeyboardInterrupt:
+        events.close()
+        print(f"\n⏹️  Đã huỷ sau {time.perf_counter() - started:.1f}s")
+        return None
+
+    return None
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("question", nargs="?", help="Yêu cầu người dùng")
@@ -49,6 +111,28 @@ def main():
         "--threshold", type=float, default=0.8, help="Ngưỡng điểm pass (0–1)"
     )
     parser.add_argument("--demo", action="store_true", help="Chạy prompt demo B2S")
+    parser.add_argument(
+        "--stream", action="store_true", help="Hiển thị tiến trình và nội dung đang sinh theo thời gian thực"
+    )
+    parser.add_argument("--log-level", default=None, help="DEBUG, INFO, WARNING... (mặc định: LOG_LEVEL)")
+    parser.add_argument("--log-json", action="store_true", help="Ghi log dạng JSON lines")
+    parser.add_argument(
+        "--trace-dir", default=None,
+        help="Ghi trace (traces.jsonl) và metrics Prometheus (metrics.prom) vào thư mục này",
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="", default=None, metavar="DIR",
+        help="Chạy cProfile + tracemalloc cho từng node, ghi báo cáo vào DIR (mặc định outputs/profile/<thời gian>)",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record", metavar="CASSETTE", default=None,
+        help="Ghi lại mọi phản hồi LLM và kết quả tìm kiếm vào file JSONL",
+    )
+    cassette.add_argument(
+        "--replay", metavar="CASSETTE", default=None,
+        help="Phát lại một lần chạy đã ghi (không cần model hay mạng)",
+    )
     args = parser.parse_args()
 
     if args.demo:
@@ -58,22 +142,55 @@ def main():
     else:
         parser.error("Bạn phải cung cấp 'question' hoặc --demo")
 
+    if args.iter < 1:
+        parser.error("--iter phải >= 1")
+    if not 0.0 <= args.threshold <= 1.0:
+        parser.error("--threshold phải nằm trong khoảng 0–1")
+
+    # Imported after argument parsing so --help and usage errors return instantly
+    from multiagent_system import MultiAgentSystem
+    from utils.log_service import configure_logging
+
+    configure_logging(level=args.log_level, fmt="json" if args.log_json else None)
+
+    if args.record or args.replay:
+        from utils.cassette import set_cassette
+        set_cassette(args.record or args.replay, "record" if args.record else "replay")
+
+    if args.profile is not None:
+        from utils.profiling import enable_profiling
+        enable_profiling(args.profile or None)
+
     print("🚀 KHỞI ĐỘNG HỆ THỐNG MULTI-AGENT RAG")
     print("=" * 80)
 
     try:
         system = MultiAgentSystem()
-        result = system.run(
+        run_kwargs = dict(
             user_request=question,
             max_iterations=args.iter,
             pass_threshold=args.threshold,
         )
+        if args.stream:
+            result = stream_run(system, **run_kwargs)
+            if result is None:
+                sys.exit(130)
+        else:
+            result = system.run(**run_kwargs)
         pretty_print_result(result)
 
+        if args.trace_dir:
+            write_traces(args.trace_dir, result.get("run_id"))
+
     except Exception as exc:  # pylint: disable=broad-except
         print(f"❌ Lỗi: {exc}")
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if args.profile is not None:
+            from utils.profiling import disable_profiling
+            summary = disable_profiling()
+            print(f"🔬 Profile: {summary}")
 
 
 if __name__ == "__main__":
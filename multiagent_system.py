@@ -1,62 +1,110 @@
 from __future__ import annotations
 
-import json
+import logging
+import uuid
+from functools import cached_property
 from config import CONFIG
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
-from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-
-from agents import (
+from utils.llm_service import LLMCallError
+from utils.log_service import configure_logging, get_logger, log_context
+from utils.profiling import get_profiler
+from utils.tracing import get_tracer
+from agents.state import (
     AgentState,
-    OrchestratorAgent,
-    GeneratorAgent,
-    EvaluatorAgent,
+    VALID_LANGUAGES,
+    VALID_TOPIC_TYPES,
+    create_initial_agent_state,
 )
 
-from utils import get_llm
-from utils.save_to_word import save_to_word
+if TYPE_CHECKING:
+    from agents import OrchestratorAgent, GeneratorAgent, EvaluatorAgent
 
 
 class MultiAgentSystem:
+    """
+    The LLM client, the three agents and the compiled graph are built on
+    first use, so constructing the system (and importing this module) is
+    cheap. Call `warm_up()` to build everything ahead of the first run.
+    """
+
     def __init__(self):
-        self.llm = get_llm(model="qwen3:1.7b", temperature=0.7, verbose=True)
+        self.logger = get_logger("system")
         self.tavily_api_key = CONFIG.get("TAVILY_API_KEY")
         
         if not self.tavily_api_key:
-            self._log("WARNING: Tavily API key not found. Web search will be disabled.")
+            self._log("Tavily API key not found. Web search will be disabled.", "WARNING")
+
+        # "background" (default), "sync" (wait for the file in finalize) or "off"
+        self.export_mode = CONFIG.get("DOCX_EXPORT", "background")
+
+    @cached_property
+    def llm(self):
+        from utils import get_llm
+        return get_llm(model="qwen3:1.7b", temperature=0.7, verbose=True)
 
-        self.orchestrator = OrchestratorAgent(
+    @cached_property
+    def orchestrator(self) -> OrchestratorAgent:
+        from agents import OrchestratorAgent
+        return OrchestratorAgent(
             llm=self.llm,
             tavily_api_key=self.tavily_api_key
         )
-        self.generator = GeneratorAgent(llm=self.llm)
-        self.evaluator = EvaluatorAgent(self.llm)
-        self.graph = self._build_graph()
+
+    @cached_property
+    def generator(self) -> GeneratorAgent:
+        from agents import GeneratorAgent
+        return GeneratorAgent(llm=self.llm)
+
+    @cached_property
+    def evaluator(self) -> EvaluatorAgent:
+        from agents import EvaluatorAgent
+        return EvaluatorAgent(self.llm)
+
+    @cached_property
+    def graph(self):
+        return self._build_graph()
+
+    def warm_up(self) -> "MultiAgentSystem":
+        """Build the LLM client, agents and graph now instead of on first run"""
+        for name in ("orchestrator", "generator", "evaluator", "graph"):
+            getattr(self, name)
+        return self
 
     def _log(self, message: str, level: str = "INFO"):
         """Centralized logging function"""
-        print(f"[{level}] {message}")
+        self.logger.log(logging.getLevelName(level), message)
 
     def _log_json(self, data: Dict[str, Any], title: str = "Data"):
-        """Log JSON data in a formatted way"""
-        print(f"\n=== {title} ===")
-        print(json.dumps(data, indent=2, ensure_ascii=False))
-        print("=" * (len(title) + 8))
+        """Log a payload at DEBUG; it is only serialized if DEBUG is enabled"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(title, extra={"payload": data})
 
-    def _build_graph(self) -> StateGraph:
+    def _build_graph(self):
         """Build LangGraph workflow"""
+        from langgraph.graph import StateGraph, START, END
+        from langgraph.checkpoint.memory import MemorySaver
+
         workflow = StateGraph(AgentState)
 
-        workflow.add_node("initialize", self.initialize_node)
-        workflow.add_node("orchestrator", self.orchestrator_node)
-        workflow.add_node("generator", self.generator_node)
-        workflow.add_node("evaluator", self.evaluator_node)
-        workflow.add_node("finalize", self.finalize_node)
+        workflow.add_node("initialize", self._traced("initialize", self.initialize_node))
+        workflow.add_node("retrieve", self._traced("retrieve", self.retrieve_node))
+        workflow.add_node("orchestrator", self._traced("orchestrator", self.orchestrator_node))
+        workflow.add_node("generator", self._traced("generator", self.generator_node))
+        workflow.add_node("evaluator", self._traced("evaluator", self.evaluator_node))
+        workflow.add_node("finalize", self._traced("finalize", self.finalize_node))
 
         workflow.add_edge(START, "initialize")
-        workflow.add_edge("initialize", "orchestrator")
-        workflow.add_edge("orchestrator", "generator")
+        workflow.add_edge("initialize", "retrieve")
+        workflow.add_edge("retrieve", "orchestrator")
+        workflow.add_conditional_edges(
+            "orchestrator",
+            self.should_generate,
+            {
+                "generate": "generator",
+                "finalize": "finalize"
+            }
+        )
         workflow.add_edge("generator", "evaluator")
 
         workflow.add_conditional_edges(
@@ -69,8 +117,36 @@ class MultiAgentSystem:
         )
         workflow.add_edge("finalize", END)
 
-        memory = MemorySaver()
-        return workflow.compile(checkpointer=memory)
+        self.checkpointer = MemorySaver()
+        return workflow.compile(checkpointer=self.checkpointer)
+
+    @staticmethod
+    def _traced(name: str, node_fn):
+        """Wrap a graph node in a tracing span (LLM/search spans inside are
+        attributed to it), and in cProfile/tracemalloc while profiling is on"""
+        tracer = get_tracer()
+
+        def traced_node(state: AgentState) -> AgentState:
+            with tracer.node(name) as span:
+                span.set(iteration=state.get("iteration"))
+                profiler = get_profiler()
+                if profiler is None:
+                    return node_fn(state)
+                with profiler.node(name):
+                    return node_fn(state)
+
+        traced_node.__name__ = name
+        return traced_node
+
+    def _release_thread(self, thread_id: str) -> None:
+        """Drop checkpoints of a finished run so long-lived instances do not grow"""
+        delete_thread = getattr(self.checkpointer, "delete_thread", None)
+        if delete_thread is None:
+            return
+        try:
+            delete_thread(thread_id)
+        except Exception as e:
+            self._log(f"Could not release checkpoint thread {thread_id}: {e}", "WARNING")
 
     def initialize_node(self, state: AgentState) -> AgentState:
         """Initialize system state"""
@@ -90,7 +166,9 @@ class MultiAgentSystem:
             "should_continue": True,
             "enable_search": state.get("enable_search", True),
             "search_results": None,
-            "search_content": None
+            "search_content": None,
+            "enable_rag": state.get("enable_rag", True),
+            "internal_context": None
         }
 
         self._log_json({
@@ -100,11 +178,34 @@ class MultiAgentSystem:
             "target_audience": state.get("target_audience"),
             "max_iterations": initialized_state["max_iterations"],
             "pass_threshold": initialized_state["pass_threshold"],
-            "enable_search": initialized_state["enable_search"]
+            "enable_search": initialized_state["enable_search"],
+            "enable_rag": initialized_state["enable_rag"]
         }, "INITIALIZATION CONFIG")
 
         return initialized_state
 
+    def retrieve_node(self, state: AgentState) -> AgentState:
+        """Fetch AFFINA internal knowledge once per run; the orchestrator and
+        every generator iteration reuse it. A missing index only logs a warning."""
+        if not state.get("enable_rag", True) or not CONFIG.get("RAG_ENABLED", True):
+            return {**state, "internal_context": None}
+
+        self._log("Retrieving AFFINA internal knowledge")
+        try:
+            from retriever.get_context import get_context_block
+            internal_context = get_context_block(state["user_request"]) or None
+        except Exception as e:
+            self._log(f"Internal knowledge unavailable: {e}", "WARNING")
+            internal_context = None
+
+        self._log_json({
+            "query": state["user_request"],
+            "context_chars": len(internal_context or ""),
+            "context_preview": (internal_context or "")[:300]
+        }, "INTERNAL KNOWLEDGE")
+
+        return {**state, "internal_context": internal_context}
+
     def orchestrator_node(self, state: AgentState) -> AgentState:
         """Process Orchestrator with Tavily Search"""
         self._log("Running Orchestrator Agent")
@@ -116,7 +217,8 @@ class MultiAgentSystem:
                 topic_type=state.get("topic_type", "food_nutrition"),
                 target_audience=state.get("target_audience"),
                 custom_hashtags=state.get("custom_hashtags"),
-                enable_search=state.get("enable_search", True)
+                enable_search=state.get("enable_search", True),
+                internal_context=state.get("internal_context")
             )
             
             self._log("Orchestrator plan completed successfully")
@@ -153,7 +255,25 @@ class MultiAgentSystem:
                 "orchestrator_plan": plan_result,
                 "search_results": plan_result.get("search_results")
             }
-            
+
+        except LLMCallError as e:
+            # same outage would hit the generator after another full retry cycle
+            self._log(f"Orchestrator LLM unavailable ({e.kind}): {e}", "ERROR")
+            return {
+                **state,
+                "orchestrator_plan": {
+                    "plan": "",
+                    "thinking": "",
+                    "language": state.get("language", "vietnamese"),
+                    "topic_type": state.get("topic_type", "food_nutrition"),
+                    "target_audience": state.get("target_audience"),
+                    "custom_hashtags": state.get("custom_hashtags"),
+                    "search_results": None,
+                    "error": e.to_dict(),
+                },
+                "search_results": None
+            }
+
         except Exception as e:
             self._log(f"Orchestrator error: {str(e)}", "ERROR")
             fallback_plan = {
@@ -186,7 +306,8 @@ class MultiAgentSystem:
                 post_type=self._map_topic_to_post_type(state.get("topic_type", "food_nutrition")),
                 target_audience=state.get("target_audience"),
                 custom_hashtags=state.get("custom_hashtags"),
-                feedback=state["feedback"]
+                feedback=state["feedback"],
+                internal_context=state.get("internal_context")
             )
             
             self._log(f"Generator completed - Content length: {len(gen_result.get('content', ''))}")
@@ -212,7 +333,27 @@ class MultiAgentSystem:
                 "search_content": gen_result.get("search_content"),
                 "iteration": iteration
             }
-            
+
+        except LLMCallError as e:
+            # the model was unreachable: no placeholder content, the typed
+            # error travels to the evaluator and stops the loop
+            self._log(f"Generator LLM unavailable ({e.kind}): {e}", "ERROR")
+            return {
+                **state,
+                "generator_output": {
+                    "content": "",
+                    "thinking": "",
+                    "language": state.get("language", "vietnamese"),
+                    "post_type": self._map_topic_to_post_type(state.get("topic_type", "food_nutrition")),
+                    "target_audience": state.get("target_audience"),
+                    "custom_hashtags": state.get("custom_hashtags"),
+                    "search_content": None,
+                    "error": e.to_dict(),
+                },
+                "search_content": None,
+                "iteration": iteration
+            }
+
         except Exception as e:
             self._log(f"Generator error: {str(e)}", "ERROR")
             fallback_gen = {
@@ -237,7 +378,14 @@ class MultiAgentSystem:
 
         gen_output = state["generator_output"]
 
-        if not gen_output.get("content") or len(gen_output["content"].strip()) < 50:
+        if gen_output.get("error"):
+            eval_result = {
+                "score": 0.0,
+                "feedback": "",
+                "thinking": f"Generator LLM call failed: {gen_output['error']['message']}",
+                "error": gen_output["error"]
+            }
+        elif not gen_output.get("content") or len(gen_output["content"].strip()) < 50:
             eval_result = {
                 "score": 0.0,
                 "feedback": "Content is too short or lacks information. Please generate more complete content.",
@@ -257,7 +405,16 @@ class MultiAgentSystem:
                     custom_criteria=custom_criteria,
                     evaluation_focus=state.get("evaluation_focus")
                 )
-                
+
+            except LLMCallError as e:
+                self._log(f"Evaluator LLM unavailable ({e.kind}): {e}", "ERROR")
+                eval_result = {
+                    "score": 0.0,
+                    "feedback": "",
+                    "thinking": f"Evaluator LLM call failed: {e}",
+                    "error": e.to_dict()
+                }
+
             except Exception as e:
                 self._log(f"Evaluator error: {str(e)}", "ERROR")
                 eval_result = {
@@ -308,10 +465,24 @@ class MultiAgentSystem:
             "feedback": eval_result["feedback"]
         }
 
+    def should_generate(self, state: AgentState) -> str:
+        """Skip generation when the orchestrator could not reach the LLM"""
+        error = state["orchestrator_plan"].get("error")
+        if error:
+            self._log(f"LLM unavailable, stopping: {error['kind']}", "WARNING")
+            return "finalize"
+        return "generate"
+
     def should_continue_generation(self, state: AgentState) -> str:
         """Decide whether to continue generation"""
         eval_output = state["evaluator_output"]
 
+        if eval_output.get("error"):
+            # retrying the loop would only hit the same outage; call_llm has
+            # already retried with backoff
+            self._log(f"LLM unavailable, stopping: {eval_output['error']['kind']}", "WARNING")
+            return "finalize"
+
         if (eval_output["score"] >= state["pass_threshold"] and
             state["generator_output"].get("content") and
             len(state["generator_output"]["content"].strip()) > 50):
@@ -332,12 +503,19 @@ class MultiAgentSystem:
         final_result = state["best_result"]["content"]
         final_score = state["best_result"]["score"]
 
+        # The .docx is written by the background export queue; its path is
+        # derived from the content, so it is known before the file exists
         docx_path = None
-        try:
-            docx_path = save_to_word(final_result, final_score)
-            self._log(f"Saved to Word document: {docx_path}")
-        except Exception as exc:
-            self._log(f"Could not save Word document: {exc}", "WARNING")
+        if self.export_mode != "off":
+            try:
+                from utils.export_queue import get_export_queue
+                handle = get_export_queue().submit(final_result, final_score)
+                if self.export_mode == "sync":
+                    handle.result()
+                docx_path = handle.path
+                self._log(f"Word document: {docx_path} ({self.export_mode})")
+            except Exception as exc:
+                self._log(f"Could not save Word document: {exc}", "WARNING")
 
         # Log final summary
         self._log_json({
@@ -348,7 +526,8 @@ class MultiAgentSystem:
             "threshold_met": final_score >= state["pass_threshold"],
             "pass_threshold": state["pass_threshold"],
             "content_length": len(final_result),
-            "docx_saved": docx_path is not None
+            "docx_path": str(docx_path) if docx_path else None,
+            "docx_export": self.export_mode,
         }, "FINAL SUMMARY")
 
         return {
@@ -386,33 +565,34 @@ class MultiAgentSystem:
         """Get default criteria"""
         return self.evaluator.get_default_criteria()
 
-    def run(self, 
-            user_request: str,
-            language: str = "vietnamese",
-            topic_type: str = "food_nutrition",
-            target_audience: Optional[str] = None,
-            custom_hashtags: Optional[List[str]] = None,
-            custom_criteria: Optional[Dict[str, float]] = None,
-            evaluation_focus: Optional[str] = None,
-            max_iterations: int = 3,
-            pass_threshold: float = 0.75,
-            enable_search: bool = True,
-            verbose: bool = True) -> Dict[str, Any]:
-        
-        # Validate inputs
-        if language not in ["vietnamese", "english"]:
+    def _prepare_run(self,
+                     user_request: str,
+                     language: str = "vietnamese",
+                     topic_type: str = "food_nutrition",
+                     target_audience: Optional[str] = None,
+                     custom_hashtags: Optional[List[str]] = None,
+                     custom_criteria: Optional[Dict[str, float]] = None,
+                     evaluation_focus: Optional[str] = None,
+                     max_iterations: int = 3,
+                     pass_threshold: float = 0.75,
+                     enable_search: bool = True,
+                     enable_rag: bool = True,
+                     verbose: bool = True,
+                     run_id: Optional[str] = None) -> Tuple[AgentState, Dict[str, Any], Dict[str, Any]]:
+        """Validate a request, returning (initial state, graph config, request echo)"""
+
+        # Validate inputs (against static lists, so no agent is built for a bad request)
+        if language not in VALID_LANGUAGES:
             raise ValueError("Language must be 'vietnamese' or 'english'")
         
-        if topic_type not in self.get_available_topics():
-            raise ValueError(f"Topic type must be one of: {self.get_available_topics()}")
+        if topic_type not in VALID_TOPIC_TYPES:
+            raise ValueError(f"Topic type must be one of: {VALID_TOPIC_TYPES}")
         
         post_type = self._map_topic_to_post_type(topic_type)
         
         if custom_criteria is None:
             custom_criteria = self.get_default_criteria()
 
-        from agents.state import create_initial_agent_state
-        
         initial_state = create_initial_agent_state(
             user_request=user_request,
             language=language,
@@ -423,7 +603,8 @@ class MultiAgentSystem:
             evaluation_focus=evaluation_focus,
             max_iterations=max_iterations,
             pass_threshold=pass_threshold,
-            enable_search=enable_search
+            enable_search=enable_search,
+            enable_rag=enable_rag
         )
 
         if verbose:
@@ -436,53 +617,192 @@ class MultiAgentSystem:
                 "custom_hashtags": custom_hashtags,
                 "pass_threshold": pass_threshold,
                 "max_iterations": max_iterations,
-                "tavily_search": enable_search
+                "tavily_search": enable_search,
+                "internal_knowledge": enable_rag
             }, "SYSTEM CONFIGURATION")
 
-        config = {"configurable": {"thread_id": "main_thread"}}
+        # Each run gets its own checkpoint thread so concurrent runs on one
+        # instance (server workers, batch pipelines) never share state.
+        run_id = run_id or uuid.uuid4().hex
+        config = {"configurable": {"thread_id": run_id}}
+
+        request = {
+            "run_id": run_id,
+            "language": language,
+            "topic_type": topic_type,
+            "post_type": post_type,
+            "target_audience": target_audience,
+            "custom_hashtags": custom_hashtags,
+            "custom_criteria": custom_criteria,
+            "enable_search": enable_search,
+            "enable_rag": enable_rag,
+            "pass_threshold": pass_threshold,
+        }
+        return initial_state, config, request
+
+    @staticmethod
+    def _build_result(result: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape the final graph state into the public run result"""
+        return {
+            "run_id": request["run_id"],
+            "content": result["final_result"],
+            "score": result["best_result"]["score"],
+            "orchestrator_plan": result["orchestrator_plan"],
+            "search_results": result.get("search_results"),
+            "search_content": result.get("search_content"),
+            "internal_context": result.get("internal_context"),
+            "thinking_log": result["thinking_log"],
+            "iterations": result["iteration"],
+            "docx_path": result.get("docx_path"),
+            "docx_export": MultiAgentSystem._export_handle(result.get("docx_path")),
+            "best_iteration": result["best_result"].get("iteration"),
+            "language": request["language"],
+            "topic_type": request["topic_type"],
+            "post_type": request["post_type"],
+            "target_audience": request["target_audience"],
+            "custom_hashtags": request["custom_hashtags"],
+            "custom_criteria": request["custom_criteria"],
+            "enable_search": request["enable_search"],
+            "success": result["best_result"]["score"] >= request["pass_threshold"],
+            **MultiAgentSystem._llm_error(result)
+        }
+
+    @staticmethod
+    def _llm_error(result: Dict[str, Any]) -> Dict[str, Any]:
+        """{"error", "llm_error"} when an LLM outage left the run without content"""
+        error = ((result.get("evaluator_output") or {}).get("error")
+                 or (result.get("orchestrator_plan") or {}).get("error"))
+        if not error or result["final_result"]:
+            return {}
+        return {"error": f"LLM {error['kind']}: {error['message']}", "llm_error": error}
+
+    @staticmethod
+    def _export_handle(docx_path: Optional[str]):
+        """ExportHandle of a run's .docx (result() waits for the file)"""
+        if not docx_path:
+            return None
+        from utils.export_queue import get_export_queue
+        return get_export_queue().handle(docx_path)
+
+    @staticmethod
+    def _build_error_result(error: Exception, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "run_id": request["run_id"],
+            "content": f"Error: {str(error)}",
+            "score": 0.0,
+            "orchestrator_plan": {},
+            "search_results": None,
+            "search_content": None,
+            "thinking_log": [],
+            "iterations": 0,
+            "docx_path": None,
+            "docx_export": None,
+            "error": str(error),
+            "enable_search": request["enable_search"],
+            "success": False
+        }
+
+    def _stream_graph(self, initial_state: AgentState, config: Dict[str, Any], run_id: str):
+        """graph.stream with the run's log context set only while the graph executes"""
+        stream = self.graph.stream(initial_state, config=config, stream_mode=["updates", "messages"])
+        try:
+            while True:
+                with log_context(run_id):
+                    try:
+                        item = next(stream)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            stream.close()
+
+    def run(self, 
+            user_request: str,
+            language: str = "vietnamese",
+            topic_type: str = "food_nutrition",
+            target_audience: Optional[str] = None,
+            custom_hashtags: Optional[List[str]] = None,
+            custom_criteria: Optional[Dict[str, float]] = None,
+            evaluation_focus: Optional[str] = None,
+            max_iterations: int = 3,
+            pass_threshold: float = 0.75,
+            enable_search: bool = True,
+            enable_rag: bool = True,
+            verbose: bool = True,
+            run_id: Optional[str] = None) -> Dict[str, Any]:
+        
+        initial_state, config, request = self._prepare_run(
+            user_request=user_request,
+            language=language,
+            topic_type=topic_type,
+            target_audience=target_audience,
+            custom_hashtags=custom_hashtags,
+            custom_criteria=custom_criteria,
+            evaluation_focus=evaluation_focus,
+            max_iterations=max_iterations,
+            pass_threshold=pass_threshold,
+            enable_search=enable_search,
+            enable_rag=enable_rag,
+            verbose=verbose,
+            run_id=run_id
+        )
         
         try:
-            result = self.graph.invoke(initial_state, config=config)
-            
-            return {
-                "content": result["final_result"],
-                "score": result["best_result"]["score"],
-                "orchestrator_plan": result["orchestrator_plan"],
-                "search_results": result.get("search_results"),
-                "search_content": result.get("search_content"),
-                "thinking_log": result["thinking_log"],
-                "iterations": result["iteration"],
-                "docx_path": result.get("docx_path"),
-                "best_iteration": result["best_result"].get("iteration"),
-                "language": language,
-                "topic_type": topic_type,
-                "post_type": post_type,
-                "target_audience": target_audience,
-                "custom_hashtags": custom_hashtags,
-                "custom_criteria": custom_criteria,
-                "enable_search": enable_search,
-                "success": result["best_result"]["score"] >= pass_threshold
-            }
+            with log_context(request["run_id"]):
+                result = self.graph.invoke(initial_state, config=config)
+            return self._build_result(result, request)
             
         except Exception as e:
             self._log(f"System error: {str(e)}", "ERROR")
-            return {
-                "content": f"Error: {str(e)}",
-                "score": 0.0,
-                "orchestrator_plan": {},
-                "search_results": None,
-                "search_content": None,
-                "thinking_log": [],
-                "iterations": 0,
-                "docx_path": None,
-                "error": str(e),
-                "enable_search": enable_search,
-                "success": False
-            }
+            return self._build_error_result(e, request)
+
+        finally:
+            self._release_thread(request["run_id"])
+
+    def stream(self, user_request: str, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """Run the graph, yielding progress events as they happen.
+        Takes the same arguments as `run`.
+
+        Events (all dicts with a "type" key):
+            {"type": "node", "node": name, "update": state update}  after each node
+            {"type": "token", "node": name, "text": chunk}          LLM tokens
+            {"type": "result", "result": run result}                 last event
+
+        Closing the iterator early (break, Ctrl+C) stops the run at the next
+        event; no "result" event is produced in that case.
+        """
+        initial_state, config, request = self._prepare_run(user_request, **kwargs)
+
+        try:
+            # Bound per event: a generator must not leave its context set
+            # in the consumer between yields
+            for mode, chunk in self._stream_graph(initial_state, config, request["run_id"]):
+                if mode == "messages":
+                    message, metadata = chunk
+                    text = getattr(message, "content", "")
+                    if text:
+                        yield {"type": "token", "node": metadata.get("langgraph_node"), "text": text}
+                else:
+                    for node, update in chunk.items():
+                        yield {"type": "node", "node": node, "update": update}
+
+            final_state = self.graph.get_state(config).values
+            yield {"type": "result", "result": self._build_result(final_state, request)}
+
+        except GeneratorExit:
+            self._log(f"Run {request['run_id']} cancelled by consumer", "WARNING")
+            raise
+
+        except Exception as e:
+            self._log(f"System error: {str(e)}", "ERROR")
+            yield {"type": "result", "result": self._build_error_result(e, request)}
 
+        finally:
+            self._release_thread(request["run_id"])
 
 def main():
     """Main function to test the system"""
+    configure_logging()
     system = MultiAgentSystem()
     
     test_cases = [
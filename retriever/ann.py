@@ -0,0 +1,221 @@
+"""
+IVF (inverted file) approximate nearest-neighbour index over VectorStore rows.
+
+k-means (NumPy, spherical since rows are L2-normalized) splits the rows into
+`nlist` clusters. A query is scored against the centroids, the `nprobe`
+best clusters are opened and only their rows are scored exactly, so a
+search touches about nprobe / nlist of the matrix. Recall grows with
+nprobe; nprobe == nlist is exact search.
+"""
+from __future__ import annotations
+
+import json
+import math
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from retriever.vector_store import BLOCK_ROWS, VectorStore, _normalize
+from utils.log_service import get_logger
+
+logger = get_logger("ann")
+
+# Rows per block when scoring rows against all centroids: bounds the
+# temporary to ASSIGN_ROWS x nlist floats
+ASSIGN_ROWS = 8192
+# k-means++ seeding is sequential (one pass per centroid); above this many
+# row x centroid products the seeds are sampled uniformly instead
+KMEANSPP_MAX_WORK = 50_000_000
+
+
+def nearest_centroid(data: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(cluster id, cosine to it) per row, computed in ASSIGN_ROWS blocks"""
+    assign = np.empty(len(data), dtype=np.int64)
+    best = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), ASSIGN_ROWS):
+        sims = np.asarray(data[start:start + ASSIGN_ROWS], dtype=np.float32) @ centroids.T
+        assign[start:start + len(sims)] = sims.argmax(axis=1)
+        best[start:start + len(sims)] = sims.max(axis=1)
+    return assign, best
+
+
+def kmeans(data: np.ndarray,
+           k: int,
+           iters: int = 20,
+           seed: int = 0,
+           tol: float = 1e-4) -> np.ndarray:
+    """
+    Spherical k-means (cosine) on normalized rows; returns normalized (k, dim)
+    centroids. k-means++ seeding (uniform for large n * k); empty clusters
+    are re-seeded from the rows farthest from their centroid.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    n = len(data)
+    k = min(k, n)
+
+    if n * k > KMEANSPP_MAX_WORK:
+        centroids = data[rng.choice(n, size=k, replace=False)].copy()
+    else:
+        # k-means++ (cosine distance 1 - sim)
+        centroids = np.empty((k, data.shape[1]), dtype=np.float32)
+        centroids[0] = data[rng.integers(n)]
+        dist = 1.0 - data @ centroids[0]
+        for c in range(1, k):
+            p = np.clip(dist, 0, None)
+            total = float(p.sum())
+            idx = rng.choice(n, p=p / total) if total > 0 else rng.integers(n)
+            centroids[c] = data[idx]
+            np.minimum(dist, 1.0 - data @ centroids[c], out=dist)
+
+    prev = -np.inf
+    for _ in range(iters):
+        assign, best = nearest_centroid(data, centroids)
+        objective = float(best.mean())
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            far = np.argsort(best)[:len(empty)]
+            sums[empty] = data[far]
+        centroids = _normalize(sums)
+
+        if objective - prev < tol:
+            break
+        prev = objective
+    return centroids
+
+
+class IVFIndex:
+    """
+    Centroids plus CSR inverted lists:
+
+        centroids  float32[nlist, dim]
+        list_ptr   int64[nlist+1]   rows of list c are list_ids[list_ptr[c]:list_ptr[c+1]]
+        list_ids   int64[N]         VectorStore row ids, ascending within a list
+
+    Saved as ivf_*.npy next to vectors.npy (memory-mapped on load). Rows
+    appended to the store later are assigned to their nearest centroid by
+    add(); `generation` ties the ids to the store's row numbering.
+    """
+
+    FILES = ("centroids", "list_ptr", "list_ids")
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.list_ptr = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        self.list_ids = np.zeros(0, dtype=np.int64)
+        self.generation = 0
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.list_ids)
+
+    @staticmethod
+    def default_nlist(n_rows: int) -> int:
+        return max(1, min(65536, int(4 * math.sqrt(n_rows))))
+
+    @classmethod
+    def train(cls,
+              store: VectorStore,
+              nlist: Optional[int] = None,
+              nprobe: int = 8,
+              sample: int = 100_000,
+              iters: int = 20,
+              seed: int = 0) -> "IVFIndex":
+        """k-means on a sample of the store's rows, then assign every row"""
+        t0 = time.perf_counter()
+        n = len(store)
+        nlist = nlist or cls.default_nlist(n)
+        rng = np.random.default_rng(seed)
+        pick = np.sort(rng.choice(n, size=min(n, max(sample, nlist * 8)), replace=False))
+        train = np.asarray(store.vectors[pick], dtype=np.float32)
+        index = cls(kmeans(train, nlist, iters=iters, seed=seed), nprobe=nprobe)
+        index.add(store, 0)
+        index.generation = store.generation
+        logger.info("IVF trained: %d rows, nlist %d, %.2fs", n, index.nlist, time.perf_counter() - t0)
+        return index
+
+    def add(self, store: VectorStore, start: Optional[int] = None) -> None:
+        """Assign store rows [start, len(store)) to lists (default: rows not indexed yet)"""
+        start = self.num_rows if start is None else start
+        new_ids = np.arange(start, len(store), dtype=np.int64)
+        if not len(new_ids):
+            return
+        new_lists = np.concatenate([
+            nearest_centroid(store.vectors[s:s + BLOCK_ROWS], self.centroids)[0]
+            for s in range(start, len(store), BLOCK_ROWS)
+        ])
+        old_lists = np.repeat(np.arange(self.nlist, dtype=np.int64), np.diff(self.list_ptr))
+        all_lists = np.concatenate([old_lists, new_lists])
+        all_ids = np.concatenate([np.asarray(self.list_ids), new_ids])
+        order = np.lexsort((all_ids, all_lists))
+        self.list_ids = all_ids[order]
+        self.list_ptr = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_lists, minlength=self.nlist), out=self.list_ptr[1:])
+
+    def candidates(self, query_vector: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row ids in the nprobe clusters closest to one normalized query"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe, _ = VectorStore.top_k(self.centroids @ query_vector, nprobe)
+        starts, ends = self.list_ptr[probe[0]], self.list_ptr[probe[0] + 1]
+        return np.concatenate([self.list_ids[s:e] for s, e in zip(starts, ends)])
+
+    def search(self,
+               store: VectorStore,
+               query_vectors: np.ndarray,
+               k: int = 5,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Same contract as VectorStore.search: (indices, scores), each
+        (n_queries, min(k, live rows)). A query whose probed lists hold fewer
+        than k live rows falls back to exact search."""
+        q = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, store.num_live)
+        out_idx = np.empty((len(q), k), dtype=np.int64)
+        out_scores = np.empty((len(q), k), dtype=np.float32)
+        for row, qv in enumerate(q):
+            # ascending ids: the gather from the memory map reads forward
+            ids = np.sort(self.candidates(qv, nprobe))
+            if store.deleted.any():
+                ids = ids[~store.deleted[ids]]
+            if len(ids) < k:
+                out_idx[row], out_scores[row] = (a[0] for a in store.exact_search(qv, k))
+                continue
+            scores = np.asarray(store.vectors[ids], dtype=np.float32) @ qv
+            top, top_scores = VectorStore.top_k(scores, k)
+            out_idx[row] = ids[top[0]]
+            out_scores[row] = top_scores[0]
+        return out_idx, out_scores
+
+    # persistence
+    def save(self, index_dir: str | Path, prefix: str = "ivf") -> None:
+        index_dir = Path(index_dir)
+        for name in self.FILES:
+            np.save(index_dir / f"{prefix}_{name}.npy", np.asarray(getattr(self, name)))
+        (index_dir / f"{prefix}.json").write_text(json.dumps({
+            "nlist": self.nlist, "nprobe": self.nprobe,
+            "num_rows": self.num_rows, "generation": self.generation,
+        }, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, index_dir: str | Path, prefix: str = "ivf") -> "IVFIndex":
+        index_dir = Path(index_dir)
+        header = json.loads((index_dir / f"{prefix}.json").read_text(encoding="utf-8"))
+        index = cls(np.load(index_dir / f"{prefix}_centroids.npy"), nprobe=header["nprobe"])
+        index.list_ptr = np.load(index_dir / f"{prefix}_list_ptr.npy")
+        index.list_ids = np.load(index_dir / f"{prefix}_list_ids.npy", mmap_mode="r")
+        index.generation = header.get("generation", 0)
+        return index
+
+    @staticmethod
+    def exists(index_dir: str | Path, prefix: str = "ivf") -> bool:
+        return (Path(index_dir) / f"{prefix}.json").exists()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from retriever.vector_store import VectorStore, _BlobColumn
+from utils.log_service import get_logger
+
+logger = get_logger("bm25")
+
+_WORD = re.compile(r"\w+")
+_COMBINING = re.compile(r"[\u0300-\u036f]")
+
+
+def fold_vietnamese(text: str) -> str:
+    """Lowercase and strip diacritics: "Bảo hiểm Đà Nẵng" -> "bao hiem da nang" """
+    text = text.lower().replace("đ", "d")
+    return _COMBINING.sub("", unicodedata.normalize("NFD", text))
+
+
+def tokenize_vi(text: str, ngram: int = 2) -> List[str]:
+    """
+    Folded syllables plus joined syllable n-grams up to `ngram`. Vietnamese
+    words span several space-separated syllables, so "bảo hiểm sức khỏe"
+    also yields "bao_hiem", "hiem_suc", "suc_khoe".
+    """
+    syllables = _WORD.findall(fold_vietnamese(text))
+    terms = list(syllables)
+    for n in range(2, ngram + 1):
+        terms.extend("_".join(syllables[i:i + n]) for i in range(len(syllables) - n + 1))
+    return terms
+
+
+class BM25Index:
+    """
+    BM25 over array-backed postings (CSR layout):
+
+        term_ptr   int64[V+1]  postings of term t are [term_ptr[t], term_ptr[t+1])
+        post_docs  int32[P]    doc ids, ascending within a term
+        post_tf    float32[P]  term frequency in that doc
+        doc_len    float32[N]  terms per doc
+
+    `generation` records the VectorStore generation the doc ids refer to.
+
+    All four are saved as .npy and memory-mapped on load; the vocabulary is a
+    blob of terms in id order. Scoring gathers the postings of the query
+    terms and accumulates them into one score per doc with np.bincount.
+    add() buffers new docs and folds them into the arrays on the next search
+    or save, so documents can be added incrementally.
+    """
+
+    FILES = ("term_ptr", "post_docs", "post_tf", "doc_len")
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, ngram: int = 2):
+        self.k1 = k1
+        self.b = b
+        self.ngram = ngram
+        self.vocab: Dict[str, int] = {}
+        self.term_ptr = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.generation = 0
+        self._pending: List[Tuple[int, Counter]] = []
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add(texts)
+        index.commit()
+        return index
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_len) + len(self._pending)
+
+    def add(self, texts: Iterable[str], doc_ids: Optional[Sequence[int]] = None) -> None:
+        """Queue docs; ids default to the next free ids (aligned with VectorStore rows)"""
+        texts = list(texts)
+        if doc_ids is None:
+            doc_ids = range(self.num_docs, self.num_docs + len(texts))
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id < len(self.doc_len):
+                raise ValueError(f"Doc {doc_id} is already indexed (postings are append-only)")
+            self._pending.append((int(doc_id), Counter(tokenize_vi(text, self.ngram))))
+
+    def commit(self) -> None:
+        """Merge queued docs into the posting arrays"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        n_docs = max(len(self.doc_len), max(d for d, _ in pending) + 1)
+        doc_len = np.zeros(n_docs, dtype=np.float32)
+        doc_len[:len(self.doc_len)] = self.doc_len
+
+        terms, docs, tfs = [], [], []
+        for doc_id, counts in pending:
+            doc_len[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.vocab)
+                terms.append(term_id)
+                docs.append(doc_id)
+                tfs.append(tf)
+
+        old_terms = np.repeat(np.arange(len(self.term_ptr) - 1, dtype=np.int64), np.diff(self.term_ptr))
+        all_terms = np.concatenate([old_terms, np.asarray(terms, dtype=np.int64)])
+        all_docs = np.concatenate([np.asarray(self.post_docs), np.asarray(docs, dtype=np.int32)])
+        all_tf = np.concatenate([np.asarray(self.post_tf), np.asarray(tfs, dtype=np.float32)])
+        order = np.lexsort((all_docs, all_terms))
+
+        self.post_docs = all_docs[order]
+        self.post_tf = all_tf[order]
+        self.term_ptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=len(self.vocab)), out=self.term_ptr[1:])
+        self.doc_len = doc_len
+
+    def _term_ids(self, query: str) -> Counter:
+        return Counter(
+            self.vocab[t] for t in tokenize_vi(query, self.ngram) if t in self.vocab
+        )
+
+    def scores(self, query: str, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """BM25 score of every doc (float32[N]); docs where mask is False score 0"""
+        self.commit()
+        n = len(self.doc_len)
+        term_ids = self._term_ids(query)
+        if not n or not term_ids:
+            return np.zeros(n, dtype=np.float32)
+
+        avgdl = float(self.doc_len.mean()) or 1.0
+        doc_norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len) / avgdl)
+
+        docs_parts, weight_parts = [], []
+        for term_id, qtf in term_ids.items():
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            docs = np.asarray(self.post_docs[start:end])
+            tf = np.asarray(self.post_tf[start:end])
+            docs_parts.append(docs)
+            weight_parts.append(qtf * idf * tf * (self.k1 + 1) / (tf + doc_norm[docs]))
+
+        scores = np.bincount(
+            np.concatenate(docs_parts), weights=np.concatenate(weight_parts), minlength=n
+        ).astype(np.float32)
+        if mask is not None:
+            scores[~mask] = 0.0
+        return scores
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc ids, scores) of the k best docs with a positive score"""
+        scores = self.scores(query, mask)
+        ids, top = VectorStore.top_k(scores, k)
+        keep = top[0] > 0
+        return ids[0][keep], top[0][keep]
+
+    # persistence
+    def save(self, index_dir: str | Path, prefix: str = "bm25") -> None:
+        self.commit()
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        for name in self.FILES:
+            np.save(index_dir / f"{prefix}_{name}.npy", np.asarray(getattr(self, name)))
+        terms = sorted(self.vocab, key=self.vocab.__getitem__)
+        _BlobColumn.from_strings(terms).save(index_dir, f"{prefix}_terms")
+        (index_dir / f"{prefix}.json").write_text(json.dumps({
+            "k1": self.k1, "b": self.b, "ngram": self.ngram, "generation": self.generation,
+            "num_docs": len(self.doc_len), "num_terms": len(terms), "num_postings": len(self.post_docs),
+        }, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, index_dir: str | Path, prefix: str = "bm25") -> "BM25Index":
+        index_dir = Path(index_dir)
+        header = json.loads((index_dir / f"{prefix}.json").read_text(encoding="utf-8"))
+        index = cls(k1=header["k1"], b=header["b"], ngram=header["ngram"])
+        index.generation = header.get("generation", 0)
+        for name in cls.FILES:
+            setattr(index, name, np.load(index_dir / f"{prefix}_{name}.npy", mmap_mode="r"))
+        terms = _BlobColumn.load(index_dir, f"{prefix}_terms")
+        blob = bytes(terms.blob)
+        offsets = np.asarray(terms.offsets)
+        index.vocab = {blob[offsets[i]:offsets[i + 1]].decode("utf-8"): i for i in range(len(terms))}
+        logger.info("Loaded BM25 index: %d docs, %d terms", header["num_docs"], header["num_terms"])
+        return index
+
+    @staticmethod
+    def exists(index_dir: str | Path, prefix: str = "bm25") -> bool:
+        return (Path(index_dir) / f"{prefix}.json").exists()
@@ -1,23 +1,135 @@
-# from __future__ import annotations
-# from typing import List
-# from llama_index.core.schema import QueryBundle
-# from retriever.query_engine import build_query_engine
-# from retriever.vector_store import VectorStore
-# from config import CONFIG
-
-# # build global engine (lazy) để tái sử dụng
-# _vector_store = VectorStore()
-# _query_engine = build_query_engine(
-#     _vector_store,
-#     alpha=0.5,
-#     top_k=10,
-#     rerank_top_n=5,
-# )
-
-# def get_context(query: str, top_k: int = 5) -> List[str]:
-#     """
-#     Trả về list[str] context (đã rerank), dài top_k.
-#     """
-#     bundle = QueryBundle(query_str=query)
-#     nodes = _query_engine.retrieve(bundle)[:top_k]
-#     return [n.node.text for n in nodes]
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CONFIG
+from retriever.hybrid_retriever import HybridRetriever
+from retriever.query_engine import build_query_engine
+from utils.cassette import get_cassette
+from utils.text_utils import CHARS_PER_TOKEN, estimate_tokens
+
+# build global engine (lazy) để tái sử dụng
+_query_engine: Optional[HybridRetriever] = None
+_lock = threading.Lock()
+_SPACES = re.compile(r"\s+")
+
+
+def get_query_engine() -> HybridRetriever:
+    global _query_engine
+    if _query_engine is None:
+        with _lock:
+            if _query_engine is None:
+                _query_engine = build_query_engine()
+    return _query_engine
+
+
+class QueryCache:
+    """
+    Thread-safe LRU of retrieval results keyed by (normalized query, top_k,
+    index generation): a rebuilt or compacted index never serves stale rows.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, int, int], Tuple[Dict[str, Any], ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_cache = QueryCache(int(CONFIG.get("RAG_CACHE_SIZE", 256)))
+
+
+def get_query_cache() -> QueryCache:
+    return _cache
+
+
+def retrieve(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """Hits of the hybrid retriever ({"id", "score", "text", "metadata"}), served from the LRU when possible"""
+    engine = get_query_engine()
+    if not engine.vector_store.num_live:
+        return []                       # no index built: don't embed the query at all
+    key = (_SPACES.sub(" ", query).strip().lower(), top_k, engine.vector_store.generation)
+    hits = _cache.get(key)
+    if hits is None:
+        hits = tuple(engine.retrieve(query, top_k))
+        _cache.put(key, hits)
+    return [dict(hit) for hit in hits]
+
+
+def get_context(query: str, top_k: int = 5) -> List[str]:
+    """
+    Trả về list[str] context (đã fuse + MMR), dài tối đa top_k.
+    """
+    return [hit["text"] for hit in retrieve(query, top_k)]
+
+
+def format_context(hits: List[Dict[str, Any]], max_tokens: int) -> str:
+    """
+    Numbered context block, best hit first, cut to `max_tokens`. A hit that
+    does not fit whole is truncated if a useful part of it fits, then packing stops.
+    """
+    parts: List[str] = []
+    budget = max_tokens
+    for n, hit in enumerate(hits, 1):
+        meta = hit.get("metadata") or {}
+        source = " › ".join(str(meta[k]) for k in ("source_file", "title") if meta.get(k))
+        header = f"[{n}] {source}\n" if source else f"[{n}]\n"
+        block = header + hit["text"].strip()
+        cost = estimate_tokens(block)
+        if cost > budget:
+            room = (budget - estimate_tokens(header)) * CHARS_PER_TOKEN
+            if room >= 200:
+                parts.append(header + hit["text"].strip()[:room].rstrip() + " …")
+            break
+        parts.append(block)
+        budget -= cost + 1
+    return "\n\n".join(parts)
+
+
+def get_context_block(query: str,
+                      top_k: Optional[int] = None,
+                      max_tokens: Optional[int] = None) -> str:
+    """
+    Cached retrieval for `query`, formatted for a prompt within RAG_CONTEXT_TOKENS.
+    With a cassette the block itself is recorded/replayed, so a replayed run
+    neither embeds the query nor depends on the current index.
+    """
+    top_k = top_k or int(CONFIG.get("RAG_TOP_K", 5))
+    max_tokens = max_tokens or int(CONFIG.get("RAG_CONTEXT_TOKENS", 1200))
+    cassette = get_cassette()
+    if cassette is None:
+        return format_context(retrieve(query, top_k), max_tokens)
+    request = {"query": query, "top_k": top_k, "max_tokens": max_tokens}
+    return cassette.call("rag", request, lambda: format_context(retrieve(query, top_k), max_tokens))
@@ -1,45 +1,147 @@
-# # retriever/hybrid_retriever.py
-# from __future__ import annotations
-# from typing import List
-# from llama_index.core.retrievers import BaseRetriever
-# from llama_index.core.schema import QueryBundle, NodeWithScore
-
-
-# class HybridRetriever(BaseRetriever):
-#     def __init__(
-#         self,
-#         vector_retriever: BaseRetriever,
-#         keyword_retriever: BaseRetriever,
-#         alpha: float = 0.5,
-#         top_k: int = 3,
-#     ):
-#         super().__init__()
-#         assert 0.0 <= alpha <= 1.0, "alpha must be between 0 and 1"
-#         self.vector_retriever = vector_retriever
-#         self.keyword_retriever = keyword_retriever
-#         self.alpha = alpha
-#         self.top_k = top_k
-
-#     def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
-#         # lấy node & score
-#         vector_nodes = self.vector_retriever.retrieve(query_bundle)
-#         keyword_nodes = self.keyword_retriever.retrieve(query_bundle)
-
-#         # gộp score theo công thức alpha
-#         score_map: dict[str, float] = {}
-
-#         for n in vector_nodes:
-#             score_map[n.node.node_id] = self.alpha * (n.score or 0.0)
-
-#         for n in keyword_nodes:
-#             base = score_map.get(n.node.node_id, 0.0)
-#             score_map[n.node.node_id] = base + (1 - self.alpha) * (n.score or 0.0)
-
-#         # gom node, giữ unique, sort và lấy top_k
-#         unique_nodes = {n.node.node_id: n.node for n in (vector_nodes + keyword_nodes)}
-#         combined = [
-#             NodeWithScore(node=unique_nodes[nid], score=s) for nid, s in score_map.items()
-#         ]
-#         combined.sort(key=lambda x: x.score, reverse=True)
-        
-#         return combined[:self.top_k]
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from retriever.bm25 import BM25Index
+from retriever.vector_store import VectorStore
+
+FUSIONS = ("rrf", "score")
+
+
+def rrf_fuse(rankings: List[np.ndarray], rrf_k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reciprocal rank fusion: score(d) = sum over lists of 1 / (rrf_k + rank).
+    Only ranks are used, so lists on different scales (cosine, BM25) mix
+    without normalization. Returns (unique ids, fused scores).
+    """
+    ids = np.concatenate(rankings)
+    weights = np.concatenate([1.0 / (rrf_k + np.arange(1, len(r) + 1)) for r in rankings])
+    return _sum_by_id(ids, weights)
+
+
+def score_fuse(lists: List[Tuple[np.ndarray, np.ndarray]], weights: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted sum of min-max normalized scores (a doc missing from a list gets 0 there)"""
+    ids, fused = [], []
+    for (list_ids, scores), w in zip(lists, weights):
+        if not len(list_ids):
+            continue
+        lo, hi = float(scores.min()), float(scores.max())
+        norm = (scores - lo) / (hi - lo) if hi > lo else np.ones_like(scores)
+        ids.append(list_ids)
+        fused.append(w * norm)
+    if not ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    return _sum_by_id(np.concatenate(ids), np.concatenate(fused))
+
+
+def _sum_by_id(ids: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    unique, inverse = np.unique(ids.astype(np.int64), return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.float32)
+
+
+def mmr_select(vectors: np.ndarray,
+               relevance: np.ndarray,
+               k: int,
+               lambda_: float = 0.7,
+               dup_threshold: Optional[float] = 0.95) -> np.ndarray:
+    """
+    Maximal marginal relevance over candidate rows (best-first positions).
+
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max cosine to
+    the picked rows). The candidate similarity matrix is computed once and the
+    running max is updated with one vectorized np.maximum per pick.
+    Candidates with cosine >= dup_threshold to a picked row are dropped.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    sim = vectors @ vectors.T
+    rel = np.asarray(relevance, dtype=np.float32)
+    span = float(rel.max() - rel.min())
+    rel = (rel - rel.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked: List[int] = []
+    while len(picked) < k and available.any():
+        penalty = np.where(np.isinf(max_sim), 0.0, max_sim)
+        mmr = np.where(available, lambda_ * rel - (1 - lambda_) * penalty, -np.inf)
+        best = int(np.argmax(mmr))
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_sim, sim[best], out=max_sim)
+        if dup_threshold is not None:
+            available &= sim[best] < dup_threshold
+    return np.asarray(picked, dtype=np.int64)
+
+
+class HybridRetriever:
+    """
+    Vector + BM25 retrieval, fused and diversified locally:
+
+        1. candidate_k best rows from each retriever (argpartition)
+        2. fusion: "rrf" (rank based) or "score" (alpha * normalized cosine
+           + (1 - alpha) * normalized BM25)
+        3. MMR over the fused candidates using the stored vectors, dropping
+           near-duplicate chunks (cosine >= dup_threshold)
+    """
+
+    def __init__(self,
+                 vector_store: VectorStore,
+                 keyword_index: Optional[BM25Index] = None,
+                 fusion: str = "rrf",
+                 alpha: float = 0.5,
+                 rrf_k: int = 60,
+                 top_k: int = 5,
+                 candidate_k: int = 50,
+                 mmr_lambda: float = 0.7,
+                 dup_threshold: Optional[float] = 0.95):
+        if fusion not in FUSIONS:
+            raise ValueError(f"fusion must be one of {FUSIONS}, got {fusion!r}")
+        assert 0.0 <= alpha <= 1.0, "alpha must be between 0 and 1"
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.fusion = fusion
+        self.alpha = alpha
+        self.rrf_k = rrf_k
+        self.top_k = top_k
+        self.candidate_k = candidate_k
+        self.mmr_lambda = mmr_lambda
+        self.dup_threshold = dup_threshold
+
+    def _candidates(self, query: str, query_vector: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, fused scores) of the fused candidates, best first"""
+        vec_ids, vec_scores = self.vector_store.search(query_vector, self.candidate_k)
+        lists = [(vec_ids[0], vec_scores[0])]
+        if self.keyword_index is not None:
+            lists.append(self.keyword_index.search(query, self.candidate_k, self.vector_store.live_mask()))
+
+        if self.fusion == "rrf":
+            ids, fused = rrf_fuse([ids for ids, _ in lists], self.rrf_k)
+        else:
+            ids, fused = score_fuse(lists, [self.alpha, 1 - self.alpha])
+        order, _ = VectorStore.top_k(fused, self.candidate_k)
+        return ids[order[0]], fused[order[0]]
+
+    def retrieve_ids(self, query: str, top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, fused scores) of the final top_k chunks"""
+        top_k = top_k or self.top_k
+        query_vector = self.vector_store.embed_queries([query])
+        ids, fused = self._candidates(query, query_vector)
+        if self.mmr_lambda >= 1.0 and self.dup_threshold is None:
+            return ids[:top_k], fused[:top_k]
+        vectors = np.asarray(self.vector_store.vectors[ids], dtype=np.float32)
+        picked = mmr_select(vectors, fused, top_k, self.mmr_lambda, self.dup_threshold)
+        return ids[picked], fused[picked]
+
+    def retrieve(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Hits: [{"id", "score", "text", "metadata"}], best first"""
+        ids, scores = self.retrieve_ids(query, top_k)
+        store = self.vector_store
+        return [
+            {"id": int(i), "score": float(s), "text": store.text(i), "metadata": store.metadata(i)}
+            for i, s in zip(ids, scores)
+        ]
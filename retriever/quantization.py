@@ -0,0 +1,282 @@
+"""
+Compressed copies of the vector matrix for search, with exact re-scoring.
+
+    int8   per-dimension symmetric scale: x ≈ scale * code, 1 byte / dim
+           (4x smaller than float32)
+    pq     product quantization: dim split into m sub-vectors, each stored as
+           the id of its nearest of 256 sub-centroids, 1 byte / sub-vector
+           (dim / m x 4 times smaller)
+
+Search scores every row on the codes, keeps the best k * rescore candidates
+and re-scores those exactly from the memory-mapped float vectors.npy, so
+only the candidate rows of the full-precision file are paged in; the codes
+are what a worker keeps resident.
+"""
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from retriever.vector_store import BLOCK_ROWS, VectorStore
+from utils.log_service import get_logger
+
+logger = get_logger("quantization")
+
+KINDS = ("int8", "pq")
+# int8 rows converted to float32 per block: small enough to stay in cache,
+# which is what keeps the conversion close to a float32 matmul
+QUANT_BLOCK_ROWS = 2048
+# 256 centroids per sub-quantizer need far fewer rows than the int8 peaks
+PQ_TRAIN_ROWS = 32768
+
+
+def kmeans_l2(data: np.ndarray, k: int, iters: int = 15, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd k-means (squared L2), uniform seeding; returns (k, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iters):
+        # ||x||^2 is the same for every centroid, so argmin needs only -2 x.c + ||c||^2
+        dist = data @ centroids.T
+        dist *= -2
+        dist += (centroids * centroids).sum(axis=1)
+        assign = dist.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack([np.bincount(assign, weights=data[:, d], minlength=k)
+                         for d in range(data.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        if not filled.all():
+            far = np.argsort(dist[np.arange(len(data)), assign])[::-1][:int((~filled).sum())]
+            centroids[~filled] = data[far]
+    return centroids
+
+
+class ScalarQuantizer:
+    """int8 codes with a per-dimension scale (max |x| / 127)"""
+
+    kind = "int8"
+
+    def __init__(self, scale: np.ndarray):
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def train(cls, sample: np.ndarray) -> "ScalarQuantizer":
+        peak = np.abs(np.asarray(sample, dtype=np.float32)).max(axis=0)
+        return cls(np.where(peak > 0, peak / 127.0, 1.0))
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint(np.asarray(vectors, dtype=np.float32) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def scores(self, q: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate scores (n_queries, N): (q * scale) · code, in row blocks"""
+        qs = q * self.scale
+        out = np.empty((len(q), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), QUANT_BLOCK_ROWS):
+            block = np.asarray(codes[start:start + QUANT_BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = qs @ block.T
+        return out
+
+    @staticmethod
+    def layout(codes: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(codes)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"scale": self.scale}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], header: dict) -> "ScalarQuantizer":
+        return cls(arrays["scale"])
+
+
+class ProductQuantizer:
+    """
+    m sub-quantizers of 256 centroids each; codes are uint8 (N, m) kept
+    column-major. A query is scored with a lookup table
+    lut[j, c] = q_j · centroid_j[c], summed over the m sub-vectors
+    (asymmetric distance computation): one contiguous gather per column.
+    """
+
+    kind = "pq"
+    KSUB = 256
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)     # (m, 256, dsub)
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def dsub(self) -> int:
+        return self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, sample: np.ndarray, m: int = 32, seed: int = 0) -> "ProductQuantizer":
+        sample = np.asarray(sample, dtype=np.float32)
+        dim = sample.shape[1]
+        if dim % m:
+            raise ValueError(f"PQ_M={m} must divide the embedding dim {dim}")
+        dsub = dim // m
+        books = np.zeros((m, cls.KSUB, dsub), dtype=np.float32)
+        for j in range(m):
+            c = kmeans_l2(sample[:, j * dsub:(j + 1) * dsub], cls.KSUB, seed=seed + j)
+            books[j, :len(c)] = c
+        return cls(books)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = vectors[:, j * self.dsub:(j + 1) * self.dsub]
+            book = self.codebooks[j]
+            dist = -2 * sub @ book.T + (book * book).sum(axis=1)
+            codes[:, j] = dist.argmin(axis=1)
+        return codes
+
+    def scores(self, q: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        out = np.zeros((len(q), len(codes)), dtype=np.float32)
+        for qi, qv in enumerate(q):
+            lut = np.einsum("jcd,jd->jc", self.codebooks, qv.reshape(self.m, self.dsub))
+            for j in range(self.m):
+                out[qi] += lut[j][codes[:, j]]
+        return out
+
+    @staticmethod
+    def layout(codes: np.ndarray) -> np.ndarray:
+        return np.asfortranarray(codes)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], header: dict) -> "ProductQuantizer":
+        return cls(arrays["codebooks"])
+
+
+_QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+class QuantizedIndex:
+    """
+    Codes for every store row plus their quantizer; saved as
+    quant_codes.npy (memory-mapped on load), quant_<array>.npy, quant.json.
+    """
+
+    def __init__(self, quantizer, codes: np.ndarray, rescore: int = 4):
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rescore = rescore
+        self.generation = 0
+
+    @property
+    def kind(self) -> str:
+        return self.quantizer.kind
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        extra = sum(a.nbytes for a in self.quantizer.arrays().values())
+        return int(np.asarray(self.codes).nbytes) + extra
+
+    @classmethod
+    def train(cls,
+              store: VectorStore,
+              kind: str = "int8",
+              pq_m: int = 32,
+              rescore: int = 4,
+              sample: int = 100_000,
+              seed: int = 0) -> "QuantizedIndex":
+        if kind not in KINDS:
+            raise ValueError(f"QUANTIZATION must be one of {KINDS}, got {kind!r}")
+        t0 = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        if kind == "pq":
+            sample = min(sample, PQ_TRAIN_ROWS)
+        pick = np.sort(rng.choice(len(store), size=min(len(store), sample), replace=False))
+        train = np.asarray(store.vectors[pick], dtype=np.float32)
+        quantizer = ScalarQuantizer.train(train) if kind == "int8" else ProductQuantizer.train(train, pq_m, seed)
+        index = cls(quantizer, np.zeros((0,), dtype=np.int8), rescore)
+        index.codes = quantizer.layout(index._encode_rows(store, 0))
+        index.generation = store.generation
+        logger.info("%s codes for %d rows in %.2fs (%.1f MB)",
+                    kind, len(store), time.perf_counter() - t0, index.nbytes / 2**20)
+        return index
+
+    def _encode_rows(self, store: VectorStore, start: int) -> np.ndarray:
+        return np.concatenate([
+            self.quantizer.encode(store.vectors[s:s + BLOCK_ROWS])
+            for s in range(start, len(store), BLOCK_ROWS)
+        ])
+
+    def add(self, store: VectorStore) -> None:
+        """Encode rows appended to the store since the codes were built"""
+        if self.num_rows < len(store):
+            self.codes = self.quantizer.layout(
+                np.concatenate([np.asarray(self.codes), self._encode_rows(store, self.num_rows)])
+            )
+
+    def approx_scores(self, query_vectors: np.ndarray) -> np.ndarray:
+        return self.quantizer.scores(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)), self.codes)
+
+    def search(self,
+               store: VectorStore,
+               query_vectors: np.ndarray,
+               k: int = 5,
+               rescore: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Same contract as VectorStore.search. rescore=0 returns the
+        approximate ranking without touching the float vectors."""
+        q = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, store.num_live)
+        rescore = self.rescore if rescore is None else rescore
+        approx = self.approx_scores(q)
+        if store.deleted.any():
+            approx[:, store.deleted] = -np.inf
+        if not rescore:
+            return VectorStore.top_k(approx, k)
+
+        cand, _ = VectorStore.top_k(approx, min(k * rescore, store.num_live))
+        out_idx = np.empty((len(q), k), dtype=np.int64)
+        out_scores = np.empty((len(q), k), dtype=np.float32)
+        for row, (qv, ids) in enumerate(zip(q, cand)):
+            ids = np.sort(ids)
+            exact = np.asarray(store.vectors[ids], dtype=np.float32) @ qv
+            top, top_scores = VectorStore.top_k(exact, k)
+            out_idx[row] = ids[top[0]]
+            out_scores[row] = top_scores[0]
+        return out_idx, out_scores
+
+    # persistence
+    def save(self, index_dir: str | Path, prefix: str = "quant") -> None:
+        index_dir = Path(index_dir)
+        np.save(index_dir / f"{prefix}_codes.npy", np.asarray(self.codes))
+        arrays = self.quantizer.arrays()
+        for name, arr in arrays.items():
+            np.save(index_dir / f"{prefix}_{name}.npy", arr)
+        (index_dir / f"{prefix}.json").write_text(json.dumps({
+            "kind": self.kind, "arrays": sorted(arrays), "rescore": self.rescore,
+            "num_rows": self.num_rows, "generation": self.generation,
+        }, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, index_dir: str | Path, prefix: str = "quant") -> "QuantizedIndex":
+        index_dir = Path(index_dir)
+        header = json.loads((index_dir / f"{prefix}.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(index_dir / f"{prefix}_{name}.npy") for name in header["arrays"]}
+        quantizer = _QUANTIZERS[header["kind"]].from_arrays(arrays, header)
+        index = cls(quantizer, np.load(index_dir / f"{prefix}_codes.npy", mmap_mode="r"), header["rescore"])
+        index.generation = header.get("generation", 0)
+        return index
+
+    @staticmethod
+    def exists(index_dir: str | Path, prefix: str = "quant") -> bool:
+        return (Path(index_dir) / f"{prefix}.json").exists()
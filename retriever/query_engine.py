@@ -1,41 +1,28 @@
-# from __future__ import annotations
-# from llama_index.core.retrievers import VectorIndexRetriever, KeywordTableSimpleRetriever
-# from llama_index.core.query_engine import RetrieverQueryEngine
-# from llama_index.postprocessor.cohere_rerank import CohereRerank
-# from config import CONFIG
-# from .vector_store import VectorStore
-# from .hybrid_retriever import HybridRetriever
+from __future__ import annotations
 
+from typing import Optional
 
-# def build_query_engine(
-#     vector_store: VectorStore,
-#     alpha: float = 0.5,
-#     top_k: int = 10,
-#     rerank_model: str = "rerank-v3.5",
-#     rerank_top_n: int = 5,
-# ) -> RetrieverQueryEngine:
+from config import CONFIG
+from .hybrid_retriever import HybridRetriever
+from .vector_store import VectorStore
 
-#     # 2 retriever
-#     vector_ret = VectorIndexRetriever(
-#         index=vector_store._index, similarity_top_k=top_k  # pylint: disable=protected-access
-#     )
-#     keyword_ret = KeywordTableSimpleRetriever(
-#         index=vector_store.build_keyword_index([]), similarity_top_k=top_k
-#     )
 
-#     # Hybrid
-#     hybrid_ret = HybridRetriever(
-#         vector_retriever=vector_ret,
-#         keyword_retriever=keyword_ret,
-#         alpha=alpha,
-#         top_k=top_k,
-#     )
-
-#     # Cohere rerank post-processor
-#     reranker = CohereRerank(model=rerank_model, top_n=rerank_top_n)
-
-#     # QueryEngine
-#     return RetrieverQueryEngine.from_args(
-#         retriever=hybrid_ret,
-#         node_postprocessors=[reranker],
-#     )
+def build_query_engine(
+    vector_store: Optional[VectorStore] = None,
+    fusion: Optional[str] = None,
+    alpha: Optional[float] = None,
+    top_k: Optional[int] = None,
+    candidate_k: Optional[int] = None,
+) -> HybridRetriever:
+    """Hybrid retriever (vector + BM25, fusion, MMR) configured from config.yaml"""
+    vector_store = vector_store or VectorStore()
+    return HybridRetriever(
+        vector_store=vector_store,
+        keyword_index=vector_store.keyword_index(),
+        fusion=fusion or CONFIG.get("RAG_FUSION", "rrf"),
+        alpha=alpha if alpha is not None else float(CONFIG.get("RAG_ALPHA", 0.5)),
+        top_k=top_k or int(CONFIG.get("RAG_TOP_K", 5)),
+        candidate_k=candidate_k or int(CONFIG.get("RAG_CANDIDATE_K", 50)),
+        mmr_lambda=float(CONFIG.get("RAG_MMR_LAMBDA", 0.7)),
+        dup_threshold=CONFIG.get("RAG_DUP_THRESHOLD", 0.95),
+    )
@@ -1,49 +1,402 @@
-# from pathlib import Path
-# from typing import List
-# from llama_index.core import (
-#     VectorStoreIndex, SimpleKeywordTableIndex,
-#     StorageContext, load_index_from_storage,
-# )
-# from llama_index.core.schema import TextNode
-# from utils.embedding_service import get_embed_model
-# from config import CONFIG
-
-# class VectorStore:
-#     def __init__(self, dataset_dir: str | None = None):
-#         self.dataset_dir = Path(dataset_dir or CONFIG["DATASET_PATH"])
-#         self.index_dir = self.dataset_dir / ".index"
-#         self.embed_model = get_embed_model()
-#         self._index = None
-#         if self.index_dir.exists():
-#             self._load()
-#         else:
-#             self._index = VectorStoreIndex([], embed_model=self.embed_model)
-
-#     # build - load - save
-#     def build_index(self, nodes: List[TextNode], rebuild=False):
-#         if rebuild and self.index_dir.exists():
-#             for p in self.index_dir.glob("*"):
-#                 p.unlink()
-#             self.index_dir.rmdir()
-#         self._index = VectorStoreIndex(nodes, embed_model=self.embed_model)
-
-#     def _load(self):
-#         ctx = StorageContext.from_defaults(persist_dir=str(self.index_dir))
-#         self._index = load_index_from_storage(ctx, embed_model=self.embed_model)
-
-#     def save(self):
-#         if not self._index:
-#             raise RuntimeError("Index chưa build.")
-#         self.index_dir.mkdir(exist_ok=True)
-#         self._index.storage_context.persist(persist_dir=str(self.index_dir))
-
-#     # retrieve
-#     def retrieve(self, query: str, k: int = 5) -> List[str]:
-#         if not self._index:
-#             raise RuntimeError("Index chưa build.")
-#         retriever = self._index.as_retriever(similarity_top_k=k)
-#         return [r.text for r in retriever.retrieve(query)]
-
-#     # keyword index
-#     def build_keyword_index(self, nodes: List[TextNode]):
-#         return SimpleKeywordTableIndex(nodes)
\ No newline at end of file
+from __future__ import annotations
+
+import json
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import CONFIG
+from utils.log_service import get_logger
+
+logger = get_logger("vector_store")
+
+# Rows scored per block when the matrix is float16: bounds the float32
+# temporary to BLOCK_ROWS x dim
+BLOCK_ROWS = 65536
+
+
+def _node_fields(node: Any) -> Tuple[str, Dict[str, Any]]:
+    """(text, metadata) of a {"text", "metadata"} dict or a TextNode-like object"""
+    if isinstance(node, dict):
+        return node["text"], dict(node.get("metadata") or {})
+    return node.text, dict(getattr(node, "metadata", None) or {})
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _BlobColumn:
+    """
+    Variable-length UTF-8 strings as one blob plus an int64 offsets array.
+    Opening maps both files; a string is only decoded when it is read.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def empty(cls) -> "_BlobColumn":
+        return cls(np.zeros(0, dtype=np.uint8), np.zeros(1, dtype=np.int64))
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "_BlobColumn":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def load(cls, path: Path, name: str) -> "_BlobColumn":
+        blob_path = path / f"{name}.bin"
+        blob = (np.memmap(blob_path, dtype=np.uint8, mode="r")
+                if blob_path.stat().st_size else np.zeros(0, dtype=np.uint8))
+        return cls(blob, np.load(path / f"{name}_offsets.npy", mmap_mode="r"))
+
+    def save(self, path: Path, name: str) -> None:
+        (path / f"{name}.bin").write_bytes(np.asarray(self.blob).tobytes())
+        np.save(path / f"{name}_offsets.npy", np.asarray(self.offsets))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def extend(self, other: "_BlobColumn") -> "_BlobColumn":
+        blob = np.concatenate([np.asarray(self.blob), np.asarray(other.blob)])
+        offsets = np.concatenate([np.asarray(self.offsets), np.asarray(other.offsets[1:]) + self.offsets[-1]])
+        return _BlobColumn(blob, offsets)
+
+
+class VectorStore:
+    """
+    Local vector store: L2-normalized embeddings in an (N, dim) float32 or
+    float16 matrix, texts and per-chunk metadata (JSON) in blob sidecars.
+
+    On disk (<dataset>/.index):
+        vectors.npy                      memory-mapped on load
+        texts.bin, texts_offsets.npy     chunk texts
+        meta.bin,  meta_offsets.npy      one JSON object per chunk, parsed
+                                         only for returned hits
+        deleted.npy                      tombstone mask (bool per row)
+        index.json                       header: count, dim, dtype, model,
+                                         generation (bumped by compaction)
+
+    Loading maps the files and reads the small header, so it takes the same
+    time for 100 or 1M chunks. Search is a dot product against all rows with
+    argpartition for the top-k; several queries are scored in one matmul.
+
+    Rows are append-only: delete() only sets a tombstone, so row ids stay
+    valid for the BM25 index and the build manifest until compact() drops
+    the dead rows and renumbers the rest.
+    """
+
+    def __init__(self,
+                 dataset_dir: Optional[str] = None,
+                 index_dir: Optional[str] = None,
+                 embed_model=None,
+                 dtype: Optional[str] = None):
+        self.dataset_dir = Path(dataset_dir or CONFIG.get("DATASET_PATH", "data_campaign"))
+        self.index_dir = Path(index_dir) if index_dir else self.dataset_dir / ".index"
+        self._embed_model = embed_model
+        self.dtype = np.dtype(dtype or CONFIG.get("VECTOR_DTYPE", "float32"))
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"VECTOR_DTYPE must be float32 or float16, got {self.dtype}")
+
+        self.vectors: Optional[np.ndarray] = None
+        self._texts = _BlobColumn.empty()
+        self._meta = _BlobColumn.empty()
+        self.deleted = np.zeros(0, dtype=bool)
+        self.model_id: Optional[str] = None
+        self.generation = 0
+        self.ann = None          # IVFIndex used by search() when set
+        self.quantized = None    # QuantizedIndex used by search() when set (and no ann)
+        if (self.index_dir / "index.json").exists():
+            self._load()
+
+    @property
+    def embed_model(self):
+        if self._embed_model is None:
+            from utils.embedding_service import get_embed_model
+            self._embed_model = get_embed_model()
+        return self._embed_model
+
+    def __len__(self) -> int:
+        return 0 if self.vectors is None else len(self.vectors)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    @property
+    def num_live(self) -> int:
+        return len(self) - int(self.deleted.sum())
+
+    def live_mask(self) -> Optional[np.ndarray]:
+        """False for tombstoned rows; None when nothing is deleted"""
+        return ~self.deleted if self.deleted.any() else None
+
+    # build - load - save
+    def build_index(self, nodes: Sequence[Any], rebuild: bool = False) -> None:
+        """Embed `nodes` ({"text", "metadata"} dicts or TextNode-like) and
+        replace the in-memory index; rebuild=True also clears index_dir"""
+        if rebuild and self.index_dir.exists():
+            shutil.rmtree(self.index_dir)
+        self.vectors = None
+        self._texts = _BlobColumn.empty()
+        self._meta = _BlobColumn.empty()
+        self.deleted = np.zeros(0, dtype=bool)
+        self.generation += 1
+        self.ann = self.quantized = None
+        self.add(nodes)
+
+    def add(self, nodes: Sequence[Any], vectors: Optional[np.ndarray] = None) -> np.ndarray:
+        """Append nodes (embedding them unless `vectors` is given); returns their row ids"""
+        fields = [_node_fields(n) for n in nodes]
+        if not fields:
+            return np.zeros(0, dtype=np.int64)
+        texts = [t for t, _ in fields]
+        if vectors is None:
+            vectors = self.embed_model.embed(texts)
+            self.model_id = getattr(self.embed_model, "model_id", None)
+        vectors = _normalize(vectors).astype(self.dtype)
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} != index dim {self.dim}")
+
+        start = len(self)
+        self.vectors = vectors if self.vectors is None else np.concatenate([np.asarray(self.vectors), vectors])
+        self._texts = self._texts.extend(_BlobColumn.from_strings(texts))
+        self._meta = self._meta.extend(_BlobColumn.from_strings(
+            json.dumps(m, ensure_ascii=False, default=str) for _, m in fields
+        ))
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(fields), dtype=bool)])
+        return np.arange(start, len(self), dtype=np.int64)
+
+    def _load(self) -> None:
+        header = json.loads((self.index_dir / "index.json").read_text(encoding="utf-8"))
+        self.vectors = np.load(self.index_dir / "vectors.npy", mmap_mode="r")
+        self.dtype = self.vectors.dtype
+        self._texts = _BlobColumn.load(self.index_dir, "texts")
+        self._meta = _BlobColumn.load(self.index_dir, "meta")
+        self.model_id = header.get("model_id")
+        self.generation = header.get("generation", 0)
+        deleted_path = self.index_dir / "deleted.npy"
+        self.deleted = np.load(deleted_path) if deleted_path.exists() else np.zeros(len(self), dtype=bool)
+        if CONFIG.get("ANN_ENABLED", True):
+            self.ann = self.ann_index(train=False)
+        if CONFIG.get("QUANTIZATION"):
+            self.quantized = self.quantized_index(train=False)
+        logger.info("Loaded %d vectors (%s, dim %s) from %s", len(self), self.dtype, self.dim, self.index_dir)
+
+    def save(self) -> None:
+        if self.vectors is None:
+            raise RuntimeError("Index chưa build.")
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # Write to temporary names first: the current files may be the
+        # memory maps this store is reading from
+        tmp = self.index_dir / ".tmp"
+        tmp.mkdir(exist_ok=True)
+        np.save(tmp / "vectors.npy", np.asarray(self.vectors))
+        self._texts.save(tmp, "texts")
+        self._meta.save(tmp, "meta")
+        np.save(tmp / "deleted.npy", self.deleted)
+        (tmp / "index.json").write_text(json.dumps({
+            "count": len(self),
+            "dim": self.dim,
+            "dtype": str(self.dtype),
+            "model_id": self.model_id,
+            "generation": self.generation,
+        }, indent=2), encoding="utf-8")
+        for f in tmp.iterdir():
+            f.replace(self.index_dir / f.name)
+        tmp.rmdir()
+        self._load()
+
+    def delete(self, ids: Iterable[int]) -> None:
+        """Tombstone rows; they stop matching immediately and are dropped by compact()"""
+        ids = np.fromiter(ids, dtype=np.int64)
+        if len(ids):
+            self.deleted[ids] = True
+
+    def compact(self) -> np.ndarray:
+        """
+        Drop tombstoned rows. Returns the old -> new row id map (-1 for dropped
+        rows) so callers can renumber what refers to rows; bumps generation so
+        an index built on the old numbering (BM25) is rebuilt.
+        """
+        keep = np.flatnonzero(~self.deleted)
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        self.vectors = np.asarray(self.vectors)[keep]
+        self._texts = _BlobColumn.from_strings(self._texts[i] for i in keep)
+        self._meta = _BlobColumn.from_strings(self._meta[i] for i in keep)
+        self.deleted = np.zeros(len(keep), dtype=bool)
+        self.generation += 1
+        self.ann = self.quantized = None
+        return remap
+
+    # access
+    def text(self, i: int) -> str:
+        return self._texts[i]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        return json.loads(self._meta[i])
+
+    # search
+    def embed_queries(self, queries: Sequence[str]) -> np.ndarray:
+        return _normalize(self.embed_model.embed(list(queries)))
+
+    def scores(self, query_vectors: np.ndarray) -> np.ndarray:
+        """Cosine scores (n_queries, N) of normalized query vectors"""
+        q = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if self.dtype == np.float32:
+            return q @ np.asarray(self.vectors).T
+        out = np.empty((len(q), len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = q @ block.T
+        return out
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, scores) of the k best columns per row, best first"""
+        scores = np.atleast_2d(scores)
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            empty = np.zeros((len(scores), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+    def search(self, query_vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Batch search: (indices, scores), each (n_queries, k); approximate
+        when an IVF index or quantized codes are attached (IVF first)"""
+        if not self.num_live:
+            raise RuntimeError("Index chưa build.")
+        if self.ann is not None:
+            return self.ann.search(self, query_vectors, k)
+        if self.quantized is not None:
+            return self.quantized.search(self, query_vectors, k)
+        return self.exact_search(query_vectors, k)
+
+    def exact_search(self, query_vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.scores(query_vectors)
+        if self.deleted.any():
+            scores[:, self.deleted] = -np.inf
+        return self.top_k(scores, min(k, self.num_live))
+
+    def retrieve_batch(self, queries: Sequence[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Hits per query: [{"id", "score", "text", "metadata"}]"""
+        indices, scores = self.search(self.embed_queries(queries), k)
+        return [
+            [{"id": int(i), "score": float(s), "text": self.text(i), "metadata": self.metadata(i)}
+             for i, s in zip(row_idx, row_scores)]
+            for row_idx, row_scores in zip(indices, scores)
+        ]
+
+    # keyword index
+    def build_keyword_index(self, nodes: Optional[Sequence[Any]] = None):
+        """BM25 index over `nodes`, or over this store's chunks (doc id = row id)"""
+        from retriever.bm25 import BM25Index
+
+        if nodes is not None:
+            return BM25Index.from_texts(_node_fields(n)[0] for n in nodes)
+        return BM25Index.from_texts(self.text(i) for i in range(len(self)))
+
+    def keyword_index(self):
+        """
+        BM25 index saved next to the vectors. Rows appended since it was saved
+        are added incrementally; it is rebuilt when missing or built for
+        another generation (before a compaction or full build).
+        """
+        from retriever.bm25 import BM25Index
+
+        index = None
+        if BM25Index.exists(self.index_dir):
+            index = BM25Index.load(self.index_dir)
+            if index.generation != self.generation or index.num_docs > len(self):
+                index = None
+        if index is not None and index.num_docs == len(self):
+            return index
+        if index is None:
+            index = self.build_keyword_index()
+        else:
+            index.add(self.text(i) for i in range(index.num_docs, len(self)))
+        index.generation = self.generation
+        if (self.index_dir / "index.json").exists():
+            index.save(self.index_dir)
+        return index
+
+    # ANN index
+    def ann_index(self, train: bool = True, nlist: Optional[int] = None, nprobe: Optional[int] = None):
+        """
+        IVF index saved next to the vectors; rows appended since it was saved
+        are assigned to their clusters. With train=False returns None instead
+        of training when there is no usable index (or the store is smaller
+        than ANN_MIN_ROWS, where exact search is fast enough).
+        """
+        from retriever.ann import IVFIndex
+
+        nprobe = nprobe or int(CONFIG.get("ANN_NPROBE", 8))
+        index = None
+        if IVFIndex.exists(self.index_dir):
+            index = IVFIndex.load(self.index_dir)
+            if index.generation != self.generation or index.num_rows > len(self):
+                index = None
+        if index is not None:
+            index.nprobe = nprobe
+            if index.num_rows == len(self):
+                return index
+            index.add(self)
+        elif not train or len(self) < int(CONFIG.get("ANN_MIN_ROWS", 50_000)):
+            return None
+        else:
+            index = IVFIndex.train(self, nlist or CONFIG.get("ANN_NLIST") or None, nprobe)
+        if train and (self.index_dir / "index.json").exists():
+            index.save(self.index_dir)
+        return index
+
+    def quantized_index(self, train: bool = True, kind: Optional[str] = None):
+        """
+        int8 / PQ codes saved next to the vectors (QUANTIZATION), extended for
+        appended rows; trained when missing or stale unless train=False.
+        """
+        from retriever.quantization import QuantizedIndex
+
+        kind = kind or CONFIG.get("QUANTIZATION")
+        if not kind or not len(self):
+            return None
+        index = None
+        if QuantizedIndex.exists(self.index_dir):
+            index = QuantizedIndex.load(self.index_dir)
+            if index.generation != self.generation or index.num_rows > len(self) or index.kind != kind:
+                index = None
+        if index is not None:
+            if index.num_rows == len(self):
+                return index
+            index.add(self)
+        elif not train:
+            return None
+        else:
+            index = QuantizedIndex.train(self, kind, int(CONFIG.get("PQ_M", 32)),
+                                         int(CONFIG.get("RESCORE_FACTOR", 4)))
+        if train and (self.index_dir / "index.json").exists():
+            index.save(self.index_dir)
+        return index
+
+    # retrieve
+    def retrieve(self, query: str, k: int = 5) -> List[str]:
+        if not self.num_live:
+            raise RuntimeError("Index chưa build.")
+        indices, _ = self.search(self.embed_queries([query]), k)
+        return [self.text(i) for i in indices[0]]
@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from config import CONFIG
+from utils.log_service import configure_logging, get_logger
+
+logger = get_logger("server")
+
+
+# Keyword arguments of MultiAgentSystem.run a client is allowed to set
+RUN_PARAMS = {
+    "user_request",
+    "language",
+    "topic_type",
+    "target_audience",
+    "custom_hashtags",
+    "custom_criteria",
+    "evaluation_focus",
+    "max_iterations",
+    "pass_threshold",
+    "enable_search",
+    "enable_rag",
+}
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# How often an idle worker re-checks whether the pool is stopping
+WORKER_POLL_S = 0.5
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slot (mapped to HTTP 429)"""
+
+
+class Job:
+    def __init__(self, params: Dict[str, Any], priority: int = 0):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.priority = priority
+        self.status = JOB_QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status view of the job (without the result payload)"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": (self.started_at or time.time()) - self.created_at,
+            "run_seconds": (
+                (self.finished_at or time.time()) - self.started_at
+                if self.started_at else None
+            ),
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded priority queue plus an index of known jobs.
+
+    Higher ``priority`` runs first; equal priorities run in submission order.
+    Finished jobs are kept for polling until ``max_finished`` is exceeded,
+    then the oldest ones are evicted.
+    """
+
+    def __init__(self, maxsize: int = 32, max_finished: int = 500):
+        self._queue: "queue.PriorityQueue[tuple]" = queue.PriorityQueue(maxsize=maxsize)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self.max_finished = max_finished
+        self.maxsize = maxsize
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def submit(self, params: Dict[str, Any], priority: int = 0) -> Job:
+        job = Job(params, priority)
+        # Register before enqueueing so a fast worker never finishes an unknown job
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait((-priority, next(self._seq), job))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                self.counters["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.maxsize} pending jobs)")
+        with self._lock:
+            self.counters["submitted"] += 1
+        return job
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Job]:
+        try:
+            return self._queue.get(timeout=timeout)[2]
+        except queue.Empty:
+            return None
+
+    def put_sentinel(self) -> None:
+        """Wake one blocked worker so it can exit (never blocks: workers also poll)"""
+        try:
+            self._queue.put_nowait((float("inf"), next(self._seq), None))
+        except queue.Full:
+            pass
+
+    def cancel_pending(self, reason: str = "Server shutting down") -> int:
+        """Mark every queued job cancelled and remove it from the queue"""
+        cancelled = 0
+        while True:
+            try:
+                job = self._queue.get_nowait()[2]
+            except queue.Empty:
+                return cancelled
+            if job is None:
+                self._queue.task_done()
+                continue
+            job.status = JOB_CANCELLED
+            job.error = reason
+            job.finished_at = time.time()
+            self.task_done(job)
+            cancelled += 1
+
+    def task_done(self, job: Job) -> None:
+        counter = {JOB_DONE: "completed", JOB_CANCELLED: "cancelled"}.get(job.status, "failed")
+        with self._lock:
+            self.counters[counter] += 1
+            self._finished[job.id] = None
+            while len(self._finished) > self.max_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+        self._queue.task_done()
+
+    def lookup(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == JOB_RUNNING)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.maxsize,
+                "running": running,
+                "retained_jobs": len(self._jobs),
+                **self.counters,
+            }
+
+
+class WorkerPool:
+    """Fixed number of threads draining a JobQueue into one shared runner.
+
+    Size the pool to what the backend can serve concurrently
+    (OLLAMA_NUM_PARALLEL); extra workers only add queueing inside Ollama.
+    """
+
+    def __init__(self, jobs: JobQueue, runner: Callable[..., Dict[str, Any]], workers: int = 2):
+        self.jobs = jobs
+        self.runner = runner
+        self.size = max(1, workers)
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        for i in range(self.size):
+            t = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Cancel queued jobs, let running ones finish (up to `timeout` each)"""
+        self._stopping.set()
+        cancelled = self.jobs.cancel_pending()
+        if cancelled:
+            logger.warning("Huỷ %d job đang chờ", cancelled)
+        for _ in self._threads:
+            self.jobs.put_sentinel()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self.jobs.get(timeout=WORKER_POLL_S)
+            if job is None:
+                continue
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = self.runner(**job.params, run_id=job.id, verbose=False)
+                if job.result.get("error"):
+                    job.status = JOB_FAILED
+                    job.error = job.result["error"]
+                else:
+                    job.status = JOB_DONE
+            except Exception as e:  # pylint: disable=broad-except
+                job.status = JOB_FAILED
+                job.error = str(e)
+                logger.exception("Job %s failed", job.id)
+            finally:
+                job.finished_at = time.time()
+                self.jobs.task_done(job)
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, jobs: JobQueue, pool: WorkerPool):
+        super().__init__(address, JobRequestHandler)
+        self.jobs = jobs
+        self.pool = pool
+        self.started_at = time.time()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs              -> 202 {"job_id"} | 400 | 429
+    GET  /jobs/<id>         -> job status
+    GET  /jobs/<id>/result  -> 200 result | 202 still pending | 404
+    GET  /metrics           -> queue depth, running jobs, counters
+    GET  /metrics/prometheus -> span latency histograms and counters (text format)
+    GET  /health            -> liveness
+    """
+
+    server: JobServer
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        # Keep stdout for the system's own logs instead of per-request access lines
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            self.send_header("Retry-After", "5")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object")
+        return data
+
+    def do_POST(self) -> None:  # noqa: N802
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+
+        try:
+            body = self._read_json()
+            priority = int(body.pop("priority", 0))
+            params = validate_job_params(body)
+        except (ValueError, TypeError) as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+
+        try:
+            job = self.server.jobs.submit(params, priority=priority)
+        except QueueFullError as e:
+            self._send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": str(e)})
+            return
+
+        self._send_json(HTTPStatus.ACCEPTED, {
+            "job_id": job.id,
+            "status": job.status,
+            "queue_depth": self.server.jobs.depth(),
+        })
+
+    def do_GET(self) -> None:  # noqa: N802
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+
+        if parts == ["health"]:
+            self._send_json(HTTPStatus.OK, {"status": "ok"})
+        elif parts == ["metrics", "prometheus"]:
+            from utils.tracing import get_tracer
+            body = get_tracer().prometheus_text().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ["metrics"]:
+            self._send_json(HTTPStatus.OK, {
+                **self.server.jobs.snapshot(),
+                "workers": self.server.pool.size,
+                "uptime_seconds": time.time() - self.server.started_at,
+            })
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.server.jobs.lookup(parts[1])
+            if job is None:
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown job {parts[1]}"})
+            elif len(parts) == 2:
+                self._send_json(HTTPStatus.OK, job.to_dict())
+            elif parts[2] != "result":
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            elif job.status in (JOB_QUEUED, JOB_RUNNING):
+                self._send_json(HTTPStatus.ACCEPTED, job.to_dict())
+            else:
+                self._send_json(HTTPStatus.OK, {**job.to_dict(), "result": job.result})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+
+
+def validate_job_params(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Check a job body before it is queued, so bad requests fail with 400"""
+    languages = CONFIG.get("SUPPORTED_LANGUAGES", ["vietnamese", "english"])
+    topic_types = CONFIG.get("TOPIC_TYPES", [])
+
+    unknown = set(body) - RUN_PARAMS
+    if unknown:
+        raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+    if not isinstance(body.get("user_request"), str) or not body["user_request"].strip():
+        raise ValueError("'user_request' is required")
+    if body.get("language", "vietnamese") not in languages:
+        raise ValueError(f"Language must be one of: {languages}")
+    if body.get("topic_type", "food_nutrition") not in topic_types:
+        raise ValueError(f"Topic type must be one of: {topic_types}")
+    return body
+
+
+def create_server(
+    host: str,
+    port: int,
+    workers: int,
+    queue_size: int,
+    runner: Optional[Callable[..., Dict[str, Any]]] = None,
+) -> JobServer:
+    """Build the HTTP server and worker pool around one warmed runner.
+
+    ``runner`` defaults to ``MultiAgentSystem().run``; pass another callable
+    with the same signature to serve a different backend.
+    """
+    if runner is None:
+        from multiagent_system import MultiAgentSystem
+        runner = MultiAgentSystem().warm_up().run
+
+    jobs = JobQueue(maxsize=queue_size, max_finished=CONFIG.get("SERVER_MAX_FINISHED_JOBS", 500))
+    pool = WorkerPool(jobs, runner, workers=workers)
+    pool.start()
+    return JobServer((host, port), jobs, pool)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local job server for MultiAgentSystem")
+    parser.add_argument("--host", default=CONFIG.get("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=CONFIG.get("SERVER_PORT", 8080))
+    parser.add_argument(
+        "--workers", type=int, default=CONFIG.get("SERVER_WORKERS", 2),
+        help="Số job chạy song song (nên bằng OLLAMA_NUM_PARALLEL)",
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=CONFIG.get("SERVER_QUEUE_SIZE", 32),
+        help="Số job chờ tối đa trước khi trả 429",
+    )
+    parser.add_argument("--log-json", action="store_true", help="Ghi log dạng JSON lines")
+    args = parser.parse_args()
+
+    configure_logging(fmt="json" if args.log_json else None)
+    print("🚀 Khởi động MultiAgentSystem...")
+    server = create_server(args.host, args.port, args.workers, args.queue_size)
+    print(f"✅ Server chạy tại http://{args.host}:{args.port} ({args.workers} workers)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Đang dừng server...")
+    finally:
+        server.server_close()
+        server.pool.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
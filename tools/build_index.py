@@ -1,14 +1,271 @@
-# # tools/build_index.py
-# import argparse, json
-# from utils.affina_markdown import process_markdown_file
-# from retriever.vector_store import VectorStore
-
-# p = argparse.ArgumentParser()
-# p.add_argument("dataset", help="Thư mục chứa .md (vd. data_campaign)")
-# args = p.parse_args()
-
-# vs = VectorStore(args.dataset, auto_build=False)   # chỉ load rỗng
-# nodes = process_markdown_file(f"{args.dataset}/Campaign.md")  # hoặc glob toàn thư mục
-# vs.build_index(nodes)
-# vs.save()
-# print("✔ Vector index saved to", vs.index_dir)
+"""
+Incremental RAG index build.
+
+    python -m tools.build_index data_campaign            # index every .md under it
+    python -m tools.build_index data_campaign --rebuild  # from scratch
+    python -m tools.build_index data_campaign --compact  # force compaction
+
+Every changed file is chunked by utils.affina_markdown (streaming, heading
+hierarchy, token-bounded with overlap, tables as row groups), files in
+parallel over --chunk-workers processes.
+
+Chunks are identified by a hash of their text and metadata. The manifest
+(<index>/manifest.json) records, per source file, its size/mtime and the
+vector-store row of each chunk hash, so a run:
+
+    • skips files whose size and mtime did not change,
+    • re-chunks changed files and embeds only chunks with a new hash,
+    • tombstones rows whose chunk (or whole file) disappeared,
+    • compacts the store once tombstones exceed COMPACT_RATIO of the rows.
+
+The BM25 index is updated after the vectors, and a report is written to
+<index>/build_report.json.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CONFIG
+from retriever.vector_store import VectorStore
+from utils.affina_markdown import process_markdown_files
+from utils.embedding_service import (
+    EmbeddingCache,
+    EmbeddingService,
+    embed_batches,
+    make_embedder,
+)
+from utils.log_service import get_logger
+
+logger = get_logger("build_index")
+
+MANIFEST_VERSION = 1
+
+
+def chunk_hash(node: Dict[str, Any]) -> str:
+    # chunk_index shifts when a chunk is inserted above; it does not change the chunk
+    meta = {k: v for k, v in node["metadata"].items() if k != "chunk_index"}
+    payload = node["text"] + "\0" + json.dumps(meta, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_dir: Path) -> Dict[str, Any]:
+    path = index_dir / "manifest.json"
+    if path.exists():
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return {"version": MANIFEST_VERSION, "model_id": None, "files": {}}
+
+
+def save_manifest(index_dir: Path, manifest: Dict[str, Any]) -> None:
+    tmp = index_dir / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(index_dir / "manifest.json")
+
+
+def embed_texts(embedder, texts: List[str], batch_size: int, workers: int) -> np.ndarray:
+    """Through the service (dedupe + cache) when there is one, else straight batches"""
+    if isinstance(embedder, EmbeddingService):
+        return embedder.embed(texts, batch_size, workers)
+    return embed_batches(embedder, texts, batch_size, workers)
+
+
+def scan(dataset_dir: Path, pattern: str) -> Dict[str, Path]:
+    """relative posix path -> file, skipping the index directory"""
+    return {
+        p.relative_to(dataset_dir).as_posix(): p
+        for p in sorted(dataset_dir.glob(pattern))
+        if p.is_file() and ".index" not in p.parts
+    }
+
+
+def build(dataset_dir: str,
+          index_dir: Optional[str] = None,
+          pattern: str = "**/*.md",
+          rebuild: bool = False,
+          compact: Optional[bool] = None,
+          batch_size: int = 32,
+          workers: int = 1,
+          embed_model=None,
+          chunk_workers: int = 1) -> Dict[str, Any]:
+    """Bring the index in line with `dataset_dir`; returns the build report"""
+    t_start = time.perf_counter()
+    store = VectorStore(dataset_dir, index_dir, embed_model=embed_model)
+    manifest = load_manifest(store.index_dir)
+    model_id = getattr(store.embed_model, "model_id", None)
+
+    if rebuild or (len(store) and store.model_id != model_id) or (len(store) and not manifest["files"]):
+        store.build_index([], rebuild=True)
+        manifest = load_manifest(store.index_dir)
+    report: Dict[str, Any] = {
+        "dataset": str(dataset_dir), "index": str(store.index_dir), "model_id": model_id,
+        "files": {"scanned": 0, "unchanged": 0, "changed": 0, "added": 0, "removed": 0, "failed": 0},
+        "chunks": {"kept": 0, "added": 0, "deleted": 0},
+    }
+
+    # 1) diff files and chunks against the manifest
+    t0 = time.perf_counter()
+    files = scan(Path(dataset_dir), pattern)
+    report["files"]["scanned"] = len(files)
+    to_delete: List[int] = []
+    new_nodes: List[Tuple[str, str, Dict[str, Any]]] = []     # (file, hash, node)
+    new_entries: Dict[str, Dict[str, Any]] = {}
+
+    for rel, old in list(manifest["files"].items()):
+        if rel not in files:
+            to_delete.extend(old["chunks"].values())
+            del manifest["files"][rel]
+            report["files"]["removed"] += 1
+
+    changed: Dict[str, os.stat_result] = {}
+    for rel, path in files.items():
+        st = path.stat()
+        old = manifest["files"].get(rel)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            report["files"]["unchanged"] += 1
+            report["chunks"]["kept"] += len(old["chunks"])
+            continue
+        report["files"]["changed" if old else "added"] += 1
+        changed[rel] = st
+
+    # changed files are chunked in parallel, results come back in order
+    max_tokens = int(CONFIG.get("CHUNK_MAX_TOKENS", 512))
+    overlap_tokens = int(CONFIG.get("CHUNK_OVERLAP_TOKENS", 64))
+    for rel, nodes in process_markdown_files([(rel, files[rel]) for rel in changed], chunk_workers,
+                                             max_tokens, overlap_tokens, return_exceptions=True):
+        if isinstance(nodes, Exception):
+            # unreadable file: keep its old rows and manifest entry, so the
+            # next run retries it instead of seeing it as unchanged
+            logger.error("Bỏ qua %s: %s", rel, nodes)
+            report["files"]["failed"] += 1
+            report.setdefault("errors", []).append({"file": rel, "error": f"{type(nodes).__name__}: {nodes}"})
+            old = manifest["files"].get(rel)
+            report["chunks"]["kept"] += len(old["chunks"]) if old else 0
+            continue
+        st = changed[rel]
+        old = manifest["files"].get(rel)
+        old_chunks: Dict[str, int] = old["chunks"] if old else {}
+        chunks: Dict[str, int] = {}
+        for node in nodes:
+            h = chunk_hash(node)
+            if h in chunks:
+                continue                 # identical chunk twice in one file: index once
+            if h in old_chunks:
+                chunks[h] = old_chunks[h]
+                report["chunks"]["kept"] += 1
+            else:
+                chunks[h] = -1
+                new_nodes.append((rel, h, node))
+        to_delete.extend(row for h, row in old_chunks.items() if h not in chunks)
+        new_entries[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "chunks": chunks}
+    report["scan_s"] = round(time.perf_counter() - t0, 3)
+
+    # 2) tombstone, embed, append
+    store.delete(to_delete)
+    report["chunks"]["deleted"] = len(to_delete)
+    t0 = time.perf_counter()
+    if new_nodes:
+        texts = [node["text"] for _, _, node in new_nodes]
+        vectors = embed_texts(store.embed_model, texts, batch_size, workers)
+        rows = store.add([node for _, _, node in new_nodes], vectors)
+        store.model_id = model_id
+        for (rel, h, _), row in zip(new_nodes, rows):
+            new_entries[rel]["chunks"][h] = int(row)
+    embed_s = time.perf_counter() - t0
+    report["chunks"]["added"] = len(new_nodes)
+    report["embed_s"] = round(embed_s, 3)
+    report["embed_chunks_per_s"] = round(len(new_nodes) / embed_s, 1) if new_nodes and embed_s else None
+    if isinstance(store.embed_model, EmbeddingService):
+        report["embedding"] = store.embed_model.stats()
+    manifest["files"].update(new_entries)
+    manifest["model_id"] = model_id
+
+    # 3) compaction
+    ratio = float(CONFIG.get("COMPACT_RATIO", 0.2))
+    dead = len(store) - store.num_live
+    if compact or (compact is None and len(store) and dead / len(store) > ratio):
+        remap = store.compact()
+        for entry in manifest["files"].values():
+            entry["chunks"] = {h: int(remap[row]) for h, row in entry["chunks"].items()}
+        report["compacted_rows"] = dead
+
+    # 4) save vectors, BM25, manifest
+    t0 = time.perf_counter()
+    if len(store):
+        store.save()
+        store.keyword_index()
+        ann = store.ann_index()
+        if ann is not None:
+            report["ann"] = {"nlist": ann.nlist, "nprobe": ann.nprobe, "rows": ann.num_rows}
+        quant = store.quantized_index()
+        if quant is not None:
+            report["quantization"] = {"kind": quant.kind, "mb": round(quant.nbytes / 2**20, 2),
+                                      "float_mb": round(np.asarray(store.vectors).nbytes / 2**20, 2)}
+    else:
+        store.build_index([], rebuild=True)     # nothing left: drop the old files
+    store.index_dir.mkdir(parents=True, exist_ok=True)
+    save_manifest(store.index_dir, manifest)
+    report["save_s"] = round(time.perf_counter() - t0, 3)
+
+    report["rows"] = {"total": len(store), "live": store.num_live, "deleted": len(store) - store.num_live}
+    report["total_s"] = round(time.perf_counter() - t_start, 3)
+    (store.index_dir / "build_report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Build / cập nhật RAG index (incremental)")
+    p.add_argument("dataset", nargs="?", default=CONFIG.get("DATASET_PATH", "data_campaign"),
+                   help="Thư mục chứa .md (vd. data_campaign)")
+    p.add_argument("--index-dir", default=None, help="Mặc định <dataset>/.index")
+    p.add_argument("--pattern", default="**/*.md", help="Glob các file nguồn (mặc định **/*.md)")
+    p.add_argument("--rebuild", action="store_true", help="Xoá index cũ và build lại từ đầu")
+    p.add_argument("--compact", action="store_true", default=None,
+                   help="Compact ngay (mặc định: khi tombstone > COMPACT_RATIO)")
+    p.add_argument("--batch-size", type=int, default=int(CONFIG.get("EMBED_BATCH_SIZE", 32)))
+    p.add_argument("--provider", choices=["ollama", "hashing"], default=None,
+                   help="Embedder (mặc định EMBED_PROVIDER); 'hashing' chạy offline")
+    p.add_argument("--workers", type=int, default=int(CONFIG.get("EMBED_WORKERS", os.cpu_count() or 1)),
+                   help="Số worker embed (process cho embedder CPU, thread cho Ollama)")
+    p.add_argument("--chunk-workers", type=int, default=int(CONFIG.get("CHUNK_WORKERS", os.cpu_count() or 1)),
+                   help="Số process chunk file .md song song")
+    args = p.parse_args()
+
+    embed_model = None                          # VectorStore -> get_embed_model()
+    if args.provider:
+        embedder = make_embedder(args.provider)
+        cache_dir = CONFIG.get("EMBED_CACHE_DIR", ".cache/embeddings")
+        embed_model = EmbeddingService(embedder, EmbeddingCache(cache_dir, embedder.model_id) if cache_dir else None)
+    report = build(args.dataset, args.index_dir, args.pattern, args.rebuild, args.compact,
+                   args.batch_size, args.workers, embed_model, args.chunk_workers)
+    f, c, rows = report["files"], report["chunks"], report["rows"]
+    print(f"✔ Vector index saved to {report['index']}")
+    print(f"  files : {f['scanned']} scanned, {f['added']} new, {f['changed']} changed, "
+          f"{f['unchanged']} unchanged, {f['removed']} removed, {f['failed']} failed")
+    print(f"  chunks: {c['added']} embedded, {c['kept']} kept, {c['deleted']} deleted"
+          + (f", compacted {report['compacted_rows']} rows" if "compacted_rows" in report else ""))
+    print(f"  rows  : {rows['live']} live / {rows['total']} total")
+    rate = f" ({report['embed_chunks_per_s']} chunks/s)" if report["embed_chunks_per_s"] else ""
+    print(f"  time  : scan {report['scan_s']}s, embed {report['embed_s']}s{rate}, "
+          f"save {report['save_s']}s, total {report['total_s']}s")
+    if "embedding" in report:
+        e = report["embedding"]
+        print(f"  embed : {e['unique']} unique texts, {e['cache_hits']} from cache, "
+              f"{e['embedded']} embedded in {e['batches']} batches")
+    for err in report.get("errors", []):
+        print(f"✘ {err['file']}: {err['error']}")
+    if f["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
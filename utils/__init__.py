@@ -5,7 +5,24 @@
 #     process_affina_markdown,
 # )
 #from .embedding_service import get_embed_model
-from .llm_service import get_llm, call_llm
+from importlib import import_module
+from typing import Any
+
+# get_llm/call_llm live in llm_service, which imports langchain; load it on
+# first use so `import utils.<module>` stays cheap.
+_LAZY_ATTRS = {
+    "get_llm": ".llm_service",
+    "call_llm": ".llm_service",
+    "LLMCallError": ".llm_service",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRS:
+        value = getattr(import_module(_LAZY_ATTRS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # __all__ = [
 #     "normalize_title",
@@ -15,4 +32,4 @@ from .llm_service import get_llm, call_llm
 #     "process_affina_markdown",
 #     "get_embed_model",
 # ]
-__all__ = ["get_llm", "call_llm"]
+__all__ = ["get_llm", "call_llm", "LLMCallError"]
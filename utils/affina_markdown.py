@@ -1,170 +1,400 @@
-# from __future__ import annotations
-# import os
-# import re
-# from typing import List, Dict
-# from llama_index.core.schema import TextNode
-
-# # Re-use helpers đã khai báo sẵn trong utils.text_utils
-# from .text_utils import normalize_title, parse_markdown_table
-
-
-# class AFFINAMarkdownChunker:
-#     """
-#     Chia cấu trúc tài liệu AFFINA thành 3 tầng:
-#         • Root  (preview)
-#         • Parent-section (Chương Trình – Dữ Liệu – Theo dõi)
-#         • *Không tạo* child_section/table để đơn giản hoá
-#     """
-
-#     def __init__(self, markdown_content: str):
-#         self.content = markdown_content
-#         self.chunk_counter = 0
-
-#     def generate_chunk_id(self, prefix: str = "chunk") -> str:
-#         """Tạo ID duy nhất cho mỗi chunk."""
-#         self.chunk_counter += 1
-#         return f"{prefix}_{self.chunk_counter}"
-
-#     @staticmethod
-#     def extract_section(content: str, start_marker: str, end_marker: str | None = None) -> str:
-#         """Lấy phần nội dung giữa hai marker '## ...' (không bao gồm end_marker)."""
-#         start_idx = content.find(start_marker)
-#         if start_idx == -1:
-#             return ""
-
-#         if end_marker:
-#             end_idx = content.find(end_marker, start_idx + len(start_marker))
-#             if end_idx == -1:
-#                 return content[start_idx:]
-#             return content[start_idx:end_idx]
-
-#         return content[start_idx:]
-
-#     def hierarchical_chunking_markdown(self) -> List[Dict]:
-#         """
-#         Trả về list[dict] chunk:
-#             • Root
-#             • 3 parent section: Chương Trình, Dữ Liệu, Theo dõi
-#         """
-#         chunks: List[Dict] = []
-
-#         # 1) Root preview
-#         preview = self.content[:1000] + "..." if len(self.content) > 1000 else self.content
-#         chunks.append({
-#             "title": "AFFINA Promotion Program Document",
-#             "content": preview,
-#             "type": "root",
-#             "level": "high",
-#             "section": "root",
-#         })
-
-#         # 2) Ba section chính
-#         sections = [
-#             ("Chương Trình", "## Chương Trình", "## Dữ Liệu"),
-#             ("Dữ Liệu",      "## Dữ Liệu",      "## Theo dõi"),
-#             ("Theo dõi",     "## Theo dõi",     None),
-#         ]
-
-#         for name, start, end in sections:
-#             sec_content = self.extract_section(self.content, start, end)
-#             if not sec_content:
-#                 continue
-
-#             chunks.append({
-#                 "title": name,
-#                 "content": sec_content,
-#                 "type": "parent_section",
-#                 "level": "high",
-#                 "section": name.lower().replace(" ", "_"),
-#             })
-
-#         return chunks
-
-#     def create_nodes_from_chunks(
-#         self,
-#         chunks: List[Dict],
-#         source_file: str = "affina_doc",
-#     ) -> List[TextNode]:
-#         """Convert chunks → list TextNode (LlamaIndex)."""
-#         nodes: List[TextNode] = []
-
-#         for idx, chunk in enumerate(chunks):
-#             chunk_id = f"{source_file}_{chunk['type']}_{normalize_title(chunk['title'])}"
-
-#             metadata = {
-#                 "source_file": source_file,
-#                 "chunk_type": chunk["type"],
-#                 "title": chunk["title"],
-#                 "level": chunk.get("level", "medium"),
-#                 "chunk_id": chunk_id,
-#                 "chunk_index": idx,
-#                 "section": chunk.get("section", "unknown"),
-#             }
-
-#             # Giữ compat với child_section/table (nếu muốn mở rộng sau)
-#             if "roman_section" in chunk:
-#                 metadata["roman_section"] = chunk["roman_section"]
-#             if "table_title" in chunk:
-#                 metadata["table_title"] = chunk["table_title"]
-
-#             nodes.append(TextNode(text=chunk["content"], metadata=metadata))
-
-#         return nodes
-
-#     def process_document(self, source_file: str = "affina_doc") -> List[TextNode]:
-#         chunks = self.hierarchical_chunking_markdown()
-#         return self.create_nodes_from_chunks(chunks, source_file)
-
-#     def print_chunks_structure(self, chunks: List[Dict]):
-#         """In cấu trúc phân mảnh (debug)."""
-#         print("Document Chunks Structure")
-#         print("=" * 40)
-#         for chunk in chunks:
-#             indent = "  " if chunk["type"].startswith("child_") else ""
-#             print(f"{indent}- {chunk['title']} ({chunk['type']})")
-#             print(f"{indent}  length: {len(chunk['content'])} chars\n")
-            
-
-# def process_affina_markdown(
-#     markdown_content: str,
-#     source_file: str = "affina_doc",
-# ) -> List[TextNode]:
-#     """Xử lý chuỗi markdown AFFINA, trả về list TextNode."""
-#     return AFFINAMarkdownChunker(markdown_content).process_document(source_file)
-
-# def process_markdown_file(md_file_path: str) -> List[TextNode]:
-#     """Đọc file .md rồi gọi `process_affina_markdown`."""
-#     try:
-#         with open(md_file_path, "r", encoding="utf-8") as f:
-#             md_content = f.read()
-#         src = os.path.splitext(os.path.basename(md_file_path))[0]
-#         return process_affina_markdown(md_content, source_file=src)
-#     except Exception as exc:  # pylint: disable=broad-except
-#         print(f"Lỗi xử lý {md_file_path}: {exc}")
-#         return []
-
-# def save_nodes_to_json(nodes: List[TextNode], filename: str):
-#     """Lưu list TextNode → JSON (content + metadata)."""
-#     import json
-
-#     data = [{"text": n.text, "metadata": n.metadata} for n in nodes]
-#     with open(filename, "w", encoding="utf-8") as f:
-#         json.dump(data, f, ensure_ascii=False, indent=2)
-
-# def load_nodes_from_json(filename: str) -> List[TextNode]:
-#     """Đọc JSON đã lưu thành list TextNode."""
-#     import json
-
-#     with open(filename, "r", encoding="utf-8") as f:
-#         data = json.load(f)
-
-#     return [TextNode(text=d["text"], metadata=d["metadata"]) for d in data]
-
-
-# __all__ = [
-#     "AFFINAMarkdownChunker",
-#     "process_affina_markdown",
-#     "process_markdown_file",
-#     "save_nodes_to_json",
-#     "load_nodes_from_json",
-# ]
+from __future__ import annotations
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .log_service import get_logger
+# Re-use helpers đã khai báo sẵn trong utils.text_utils
+from .text_utils import CHARS_PER_TOKEN, estimate_tokens, normalize_title, parse_markdown_table
+
+logger = get_logger("chunker")
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_TABLE_ROW = re.compile(r"^\s*\|")
+_TABLE_SEP = re.compile(r"^\s*\|[\s:|-]*-[\s:|-]*$")
+
+DOC_TITLE = "AFFINA Promotion Program Document"
+DEFAULT_MAX_TOKENS = 512
+DEFAULT_OVERLAP_TOKENS = 64
+# a table caption is the short line right above the table ("**Bảng 2: ...**")
+CAPTION_MAX_CHARS = 150
+
+
+def _split_long(line: str, max_chars: int) -> List[str]:
+    """Cut a line longer than max_chars at whitespace (hard cut if there is none)"""
+    pieces = []
+    while len(line) > max_chars:
+        cut = line.rfind(" ", 0, max_chars)
+        cut = cut if cut > max_chars // 2 else max_chars
+        pieces.append(line[:cut].rstrip())
+        line = line[cut:].lstrip()
+    if line:
+        pieces.append(line)
+    return pieces
+
+
+def _tail_text(text: str, max_chars: int) -> str:
+    """The last ≤ max_chars of text, starting at a word boundary"""
+    if len(text) <= max_chars:
+        return text
+    cut = len(text) - max_chars
+    if not text[cut - 1].isspace():
+        cut = text.find(" ", cut)
+        if cut == -1:
+            return ""
+    return text[cut:].strip()
+
+
+class AFFINAMarkdownChunker:
+    """
+    Chunker markdown dạng streaming (đọc từng dòng, bộ nhớ ~ một chunk):
+        • Root            preview đầu tài liệu
+        • parent_section  nội dung dưới heading '#' / '##'
+        • child_section   nội dung dưới heading '###' trở xuống
+        • table           bảng markdown, cắt thành nhóm dòng (lặp lại header)
+    Mỗi chunk ≤ max_tokens (ước lượng, kể cả dòng breadcrumb heading đứng
+    đầu); chunk văn bản liền nhau trong cùng section chồng lên nhau
+    overlap_tokens. Node là dict {"text", "metadata"} (VectorStore nhận trực tiếp).
+    """
+
+    def __init__(self,
+                 markdown_content: str = "",
+                 max_tokens: Optional[int] = None,
+                 overlap_tokens: Optional[int] = None,
+                 preview_chars: int = 1000):
+        self.content = markdown_content
+        self.max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+        overlap = DEFAULT_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        # an overlap of half a chunk or more would re-emit most of the buffer
+        self.overlap_tokens = max(0, min(overlap, self.max_tokens // 4))
+        self.preview_chars = preview_chars
+
+    def iter_chunks(self, lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Chunk dicts in document order (root preview first), from an iterable of lines"""
+        path: List[Tuple[int, str]] = []            # heading stack: (level, title)
+        buf: List[str] = []
+        buf_tokens = 0
+        fresh = False                               # buf holds more than the overlap tail
+        tail_lines = 0                              # leading lines of buf carried as overlap
+        part = 0
+        table_header: Optional[str] = None
+        table_rows: List[str] = []
+        table_tokens = 0
+        table_caption = ""
+        row_no = 0
+        in_fence = False
+
+        preview: List[str] = []
+        preview_len = 0
+        pending: List[Dict[str, Any]] = []          # held back until the preview is complete
+        crumb = DOC_TITLE                           # breadcrumb of `path`, and the room left by it
+        budget = max(16, self.max_tokens - estimate_tokens(crumb) - 1)
+
+        def section_info() -> Dict[str, Any]:
+            top = [title for level, title in path if level <= 2]
+            name = top[-1] if top else DOC_TITLE
+            deep = bool(path) and path[-1][0] > 2
+            return {
+                "title": path[-1][1] if path else DOC_TITLE,
+                "type": "child_section" if deep else "parent_section",
+                "level": "medium" if deep else "high",
+                "section": name.lower().replace(" ", "_"),
+                "headings": [title for _, title in path],
+            }
+
+        def text_chunk(lines_: List[str]) -> Dict[str, Any]:
+            nonlocal part
+            chunk = {**section_info(), "content": crumb + "\n" + "\n".join(lines_).strip(), "part": part}
+            part += 1
+            return chunk
+
+        def flush_text(keep_overlap: bool) -> List[Dict[str, Any]]:
+            nonlocal buf, buf_tokens, fresh, tail_lines
+            if not fresh:
+                buf, buf_tokens, tail_lines = [], 0, 0
+                return []
+            out = [text_chunk(buf)]
+            tail: List[str] = []
+            tail_tokens = 0
+            if keep_overlap:
+                for line in reversed(buf):
+                    cost = estimate_tokens(line) + 1
+                    if tail_tokens + cost > self.overlap_tokens:
+                        # a line too long to carry whole (e.g. one-line
+                        # paragraph): carry its end instead
+                        room = (self.overlap_tokens - tail_tokens - 1) * CHARS_PER_TOKEN
+                        end = _tail_text(line, room) if room > 0 else ""
+                        if end:
+                            tail.insert(0, end)
+                            tail_tokens += estimate_tokens(end) + 1
+                        break
+                    tail.insert(0, line)
+                    tail_tokens += cost
+            buf, buf_tokens, fresh, tail_lines = tail, tail_tokens, False, len(tail)
+            return out
+
+        def add_text(line: str) -> List[Dict[str, Any]]:
+            nonlocal buf_tokens, fresh
+            out: List[Dict[str, Any]] = []
+            # pieces leave room for the overlap carried in front of them
+            piece_tokens = max(budget - self.overlap_tokens - 1, budget // 2)
+            for piece in _split_long(line, piece_tokens * CHARS_PER_TOKEN) if line else [line]:
+                cost = estimate_tokens(piece) + 1
+                if buf_tokens + cost > budget:
+                    out.extend(flush_text(keep_overlap=True))
+                buf.append(piece)
+                buf_tokens += cost
+                fresh = fresh or bool(piece.strip())
+            return out
+
+        def table_chunk() -> Dict[str, Any]:
+            nonlocal part, table_rows, table_tokens
+            info = section_info()
+            head = crumb + ("\n" + table_caption if table_caption and table_caption != info["title"] else "")
+            first = row_no - len(table_rows) + 1
+            chunk = {
+                **info,
+                "type": "table",
+                "level": "medium",
+                "content": head + "\n" + parse_markdown_table([table_header] + table_rows),
+                "table_title": table_caption or info["title"],
+                "row_start": first,
+                "row_end": row_no,
+                "part": part,
+            }
+            part += 1
+            table_rows, table_tokens = [], 0
+            return chunk
+
+        def add_table_row(line: str) -> List[Dict[str, Any]]:
+            nonlocal table_header, table_tokens, row_no
+            if table_header is None:
+                table_header = line
+                return []
+            if _TABLE_SEP.match(line):
+                return []                           # |---|---| separator
+            cost = estimate_tokens(line) + 1
+            room = budget - estimate_tokens(table_header) - estimate_tokens(table_caption) - 2
+            out = [table_chunk()] if table_rows and table_tokens + cost > room else []
+            table_rows.append(line)
+            table_tokens += cost
+            row_no += 1
+            return out
+
+        def flush_table() -> List[Dict[str, Any]]:
+            nonlocal table_header, table_caption, row_no
+            if table_header is None:
+                return []
+            out = [table_chunk()] if table_rows or row_no == 0 else []
+            table_header, table_caption, row_no = None, "", 0
+            return out
+
+        def emit(chunks: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            if preview_len < self.preview_chars:
+                pending.extend(chunks)
+            else:
+                yield from chunks
+
+        def root_chunk(truncated: bool) -> Dict[str, Any]:
+            text = "\n".join(preview)[:self.preview_chars]
+            return {"title": DOC_TITLE, "content": text + ("..." if truncated else ""),
+                    "type": "root", "level": "high", "section": "root", "headings": [], "part": 0}
+
+        for raw in lines:
+            line = raw.rstrip("\r\n")
+            if preview_len < self.preview_chars:
+                preview.append(line)
+                preview_len += len(line) + 1
+                if preview_len >= self.preview_chars:
+                    yield root_chunk(truncated=True)
+                    yield from pending
+                    pending.clear()
+
+            if _FENCE.match(line):
+                in_fence = not in_fence
+            heading = None if in_fence else _HEADING.match(line)
+            is_row = not in_fence and _TABLE_ROW.match(line)
+
+            if table_header is not None and not is_row:
+                yield from emit(flush_table())
+
+            if heading:
+                yield from emit(flush_text(keep_overlap=False))
+                level = len(heading.group(1))
+                while path and path[-1][0] >= level:
+                    path.pop()
+                path.append((level, heading.group(2)))
+                crumb = " › ".join(title for _, title in path)
+                budget = max(16, self.max_tokens - estimate_tokens(crumb) - 1)
+                part = 0
+            elif is_row:
+                if table_header is None:
+                    last = next((l.strip() for l in reversed(buf) if l.strip()), "")
+                    if last and len(last) <= CAPTION_MAX_CHARS and not _TABLE_ROW.match(last):
+                        at = max(i for i, l in enumerate(buf) if l.strip())
+                        buf.pop(at)
+                        tail_lines -= at < tail_lines
+                        table_caption = last.strip("*_ :")
+                        # the caption may have been the only new text
+                        fresh = fresh and any(l.strip() for l in buf[tail_lines:])
+                    yield from emit(flush_text(keep_overlap=False))
+                yield from emit(add_table_row(line.strip()))
+            else:
+                yield from emit(add_text(line))
+
+        yield from emit(flush_table())
+        yield from emit(flush_text(keep_overlap=False))
+        if preview_len < self.preview_chars and any(l.strip() for l in preview):
+            yield root_chunk(truncated=False)
+        yield from pending
+
+    def hierarchical_chunking_markdown(self) -> List[Dict]:
+        """Toàn bộ chunk của `self.content` (xem iter_chunks)"""
+        return list(self.iter_chunks(self.content.splitlines()))
+
+    @staticmethod
+    def iter_nodes(chunks: Iterable[Dict], source_file: str = "affina_doc") -> Iterator[Dict[str, Any]]:
+        """Convert chunks → node {"text", "metadata"}, lazily."""
+        for idx, chunk in enumerate(chunks):
+            chunk_id = f"{source_file}_{chunk['type']}_{normalize_title(chunk['title'])}"
+            if chunk.get("part"):
+                chunk_id += f"_{chunk['part']}"
+
+            metadata = {
+                "source_file": source_file,
+                "chunk_type": chunk["type"],
+                "title": chunk["title"],
+                "level": chunk.get("level", "medium"),
+                "chunk_id": chunk_id,
+                "chunk_index": idx,
+                "section": chunk.get("section", "unknown"),
+                "headings": chunk.get("headings", []),
+            }
+            for key in ("roman_section", "table_title", "row_start", "row_end"):
+                if key in chunk:
+                    metadata[key] = chunk[key]
+
+            yield {"text": chunk["content"], "metadata": metadata}
+
+    def create_nodes_from_chunks(
+        self,
+        chunks: List[Dict],
+        source_file: str = "affina_doc",
+    ) -> List[Dict[str, Any]]:
+        """Convert chunks → list node {"text", "metadata"}."""
+        return list(self.iter_nodes(chunks, source_file))
+
+    def process_document(self, source_file: str = "affina_doc") -> List[Dict[str, Any]]:
+        chunks = self.hierarchical_chunking_markdown()
+        return self.create_nodes_from_chunks(chunks, source_file)
+
+
+def process_affina_markdown(
+    markdown_content: str,
+    source_file: str = "affina_doc",
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Xử lý chuỗi markdown AFFINA, trả về list node."""
+    return AFFINAMarkdownChunker(markdown_content, max_tokens, overlap_tokens).process_document(source_file)
+
+
+def iter_markdown_file(md_file_path: str,
+                       source_file: str | None = None,
+                       max_tokens: Optional[int] = None,
+                       overlap_tokens: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Node của một file .md, đọc từng dòng (không nạp cả file vào bộ nhớ)."""
+    src = source_file or os.path.splitext(os.path.basename(md_file_path))[0]
+    chunker = AFFINAMarkdownChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    with open(md_file_path, "r", encoding="utf-8") as f:
+        yield from chunker.iter_nodes(chunker.iter_chunks(f), src)
+
+
+def process_markdown_file(md_file_path: str,
+                          source_file: str | None = None,
+                          max_tokens: Optional[int] = None,
+                          overlap_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Đọc file .md (streaming), trả về list node. Lỗi đọc/parse được raise lại."""
+    try:
+        return list(iter_markdown_file(md_file_path, source_file, max_tokens, overlap_tokens))
+    except Exception as exc:
+        logger.error("Lỗi xử lý %s: %s", md_file_path, exc)
+        raise
+
+
+def _process_file_job(job: Tuple[str, str, Optional[int], Optional[int]]) -> List[Dict[str, Any]]:
+    path, source_file, max_tokens, overlap_tokens = job
+    return process_markdown_file(path, source_file, max_tokens, overlap_tokens)
+
+
+def _result(future, return_exceptions: bool):
+    if not return_exceptions:
+        return future.result()
+    try:
+        return future.result()
+    except Exception as exc:  # pylint: disable=broad-except
+        return exc
+
+
+def process_markdown_files(files: Sequence[Tuple[str, str]],
+                           workers: int = 1,
+                           max_tokens: Optional[int] = None,
+                           overlap_tokens: Optional[int] = None,
+                           return_exceptions: bool = False) -> Iterator[Tuple[str, Any]]:
+    """
+    (source_file, nodes) cho từng (source_file, path), theo đúng thứ tự vào.
+    workers > 1: chia file cho một process pool; chỉ giữ tối đa 2 * workers
+    file đang xử lý để bộ nhớ không tăng theo số file.
+    return_exceptions: file lỗi trả về (source_file, exception) thay vì raise.
+    """
+    jobs = [(str(path), src, max_tokens, overlap_tokens) for src, path in files]
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            try:
+                nodes = _process_file_job(job)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not return_exceptions:
+                    raise
+                nodes = exc
+            yield job[1], nodes
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        inflight: Deque = deque()
+        queue = iter(jobs)
+        for job in queue:
+            inflight.append((job[1], pool.submit(_process_file_job, job)))
+            if len(inflight) >= 2 * workers:
+                break
+        while inflight:
+            src, future = inflight.popleft()
+            nxt = next(queue, None)
+            if nxt is not None:
+                inflight.append((nxt[1], pool.submit(_process_file_job, nxt)))
+            yield src, _result(future, return_exceptions)
+
+
+def save_nodes_to_json(nodes: List[Dict[str, Any]], filename: str):
+    """Lưu list node → JSON (content + metadata)."""
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(nodes, f, ensure_ascii=False, indent=2)
+
+
+def load_nodes_from_json(filename: str) -> List[Dict[str, Any]]:
+    """Đọc JSON đã lưu thành list node."""
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+__all__ = [
+    "AFFINAMarkdownChunker",
+    "process_affina_markdown",
+    "iter_markdown_file",
+    "process_markdown_file",
+    "process_markdown_files",
+    "save_nodes_to_json",
+    "load_nodes_from_json",
+]
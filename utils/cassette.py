@@ -0,0 +1,180 @@
+"""
+Record/replay of LLM calls, web searches and RAG context.
+
+    record  every call_llm() response, Tavily search and retrieved context
+            block is appended to a JSONL cassette together with its timings
+    replay  the same calls are answered from the cassette, in recorded
+            order, without touching the network or the model
+
+Replaying a cassette reproduces a run exactly, so the Python-side cost
+(template rendering, parsing, state handling, export) can be profiled
+without the LLM latency. Enable with CASSETTE_MODE / CASSETTE_PATH in
+config.yaml, the env vars of the same name, or main.py --record/--replay.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import CONFIG
+from utils.log_service import get_logger
+
+logger = get_logger("cassette")
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMissError(LookupError):
+    """Replay mode got a request that is not on the cassette"""
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    payload = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    One JSONL file of {"kind", "key", "request", "response", "meta"} entries.
+
+    Identical requests (same prompt twice in a run, or several runs recorded
+    back to back) are replayed in the order they were recorded; once those
+    are used up the last one is repeated, so a single recorded run can be
+    replayed any number of times.
+    """
+
+    def __init__(self, path: str | Path, mode: str = "replay"):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {MODES}, got {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._file = None
+
+        if mode == "replay":
+            self._load()
+        elif mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.path.open("w", encoding="utf-8")
+            logger.info("Recording LLM/search calls to %s", self.path)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+        count = 0
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+                    count += 1
+        logger.info("Replaying %d recorded calls from %s", count, self.path)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def play(self, kind: str, request: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+        """Recorded (response, meta) for a request"""
+        key = request_key(kind, request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                preview = json.dumps(request, ensure_ascii=False, default=str)[:200]
+                raise CassetteMissError(f"No recorded {kind} call in {self.path} for {preview}")
+            index = min(self._cursors[key], len(entries) - 1)
+            self._cursors[key] += 1
+        entry = entries[index]
+        return entry["response"], entry.get("meta", {})
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, meta: Optional[Dict[str, Any]] = None) -> None:
+        if self._file is None:
+            return
+        entry = {
+            "kind": kind,
+            "key": request_key(kind, request),
+            "request": request,
+            "response": response,
+            "meta": {"recorded_at": round(time.time(), 3), **(meta or {})},
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            # Flushed per call so a crashed or interrupted run is still replayable
+            self._file.write(line)
+            self._file.flush()
+
+    def call(self, kind: str, request: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+        """Replay `request`, or run `fn` (recording its result when recording)"""
+        if self.replaying:
+            return self.play(kind, request)[0]
+        started = time.perf_counter()
+        response = fn()
+        self.record(kind, request, response, {"duration_s": round(time.perf_counter() - started, 6)})
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_active: Optional[Cassette] = None
+_configured = False
+_config_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Active cassette, set up from env/config on first use; None when off"""
+    global _active, _configured
+    if _configured:
+        return _active
+    with _config_lock:
+        if not _configured:
+            mode = (os.environ.get("CASSETTE_MODE") or CONFIG.get("CASSETTE_MODE") or "off").lower()
+            path = os.environ.get("CASSETTE_PATH") or CONFIG.get("CASSETTE_PATH")
+            if mode != "off" and path:
+                _active = Cassette(path, mode)
+            _configured = True
+    return _active
+
+
+def set_cassette(path: Optional[str | Path], mode: str = "replay") -> Optional[Cassette]:
+    """Replace the active cassette (path None or mode "off" disables it)"""
+    global _active, _configured
+    with _config_lock:
+        if _active is not None:
+            _active.close()
+        _active = Cassette(path, mode) if path and mode != "off" else None
+        _configured = True
+    return _active
+
+
+@contextmanager
+def use_cassette(path: str | Path, mode: str = "replay") -> Iterator[Cassette]:
+    """Temporarily record to / replay from `path`; the previous cassette is
+    restored afterwards"""
+    global _active, _configured
+    cassette = Cassette(path, mode)
+    with _config_lock:
+        previous, was_configured = _active, _configured
+        _active, _configured = cassette, True
+    try:
+        yield cassette
+    finally:
+        cassette.close()
+        with _config_lock:
+            _active, _configured = previous, was_configured
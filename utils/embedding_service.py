@@ -1,18 +1,302 @@
-# from functools import lru_cache
-# from llama_index.embeddings.openai import OpenAIEmbedding
-# from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-# from config import CONFIG
+"""
+Embedding backends plus a caching, batching front-end.
 
-# @lru_cache(maxsize=1)
-# def get_embed_model():
-#     provider = CONFIG.get("EMBED_PROVIDER", "openai").lower()
+    get_embed_model()  -> EmbeddingService(OllamaEmbedder | HashingEmbedder)
 
-#     if provider == "openai":
-#         model = CONFIG.get("OPENAI_EMBED_MODEL", "text-embedding-3-small")
-#         return OpenAIEmbedding(model=model)
+EmbeddingService.embed(texts) dedupes the texts, serves repeats from an
+on-disk cache keyed by (model id, text hash) and sends only the misses to the
+backend, in batches (optionally on a worker pool). Backends only need
+`model_id` and `embed(texts) -> float32 (n, dim)`.
+"""
+from __future__ import annotations
 
-#     if provider == "huggingface":
-#         model = CONFIG.get("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-#         return HuggingFaceEmbedding(model_name=model)
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
 
-#     raise ValueError(f"Unsupported EMBED_PROVIDER: {provider}")
+import numpy as np
+
+from config import CONFIG
+from utils.log_service import get_logger
+
+logger = get_logger("embedding")
+
+KEY_BYTES = 16
+_WORD = re.compile(r"\w+")
+
+
+class OllamaEmbedder:
+    """Embeddings from the local Ollama daemon (POST /api/embed)"""
+
+    def __init__(self, model: Optional[str] = None, host: Optional[str] = None, timeout: int = 120):
+        from utils.ollama_manager import HOST
+
+        self.model = model or CONFIG.get("EMBED_MODEL", "nomic-embed-text")
+        self.host = (host or HOST).rstrip("/")
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def model_id(self) -> str:
+        return f"ollama:{self.model}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """float32 matrix (len(texts), dim)"""
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        resp = self._session.post(
+            f"{self.host}/api/embed",
+            json={"model": self.model, "input": list(texts)},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        return np.asarray(resp.json()["embeddings"], dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    Deterministic feature-hashing embedder: words and character trigrams are
+    hashed (crc32) into `dim` signed buckets. No model and no network, so it
+    suits tests, benchmarks and offline builds; quality is lexical only.
+    """
+
+    cpu_bound = True
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    @property
+    def model_id(self) -> str:
+        return f"hashing:{self.dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        grams = [w[i:i + 3] for w in words for i in range(max(1, len(w) - 2))]
+        return words + grams
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            h = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in self._features(text)), dtype=np.uint32)
+            if len(h):
+                sign = np.where(h & 0x80000000, -1.0, 1.0).astype(np.float32)
+                np.add.at(out[row], h % self.dim, sign)
+        return out
+
+
+def _embed_batch(embedder, texts: List[str]) -> np.ndarray:
+    return embedder.embed(texts)
+
+
+def embed_batches(embedder, texts: Sequence[str], batch_size: int = 32, workers: int = 1) -> np.ndarray:
+    """
+    Embed in batches. CPU-bound embedders (`cpu_bound = True`) are spread
+    over a process pool; HTTP embedders (Ollama) use threads so the daemon's
+    parallel slots are kept busy.
+    """
+    texts = list(texts)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return np.zeros((0, 0), dtype=np.float32)
+    if workers <= 1 or len(batches) == 1:
+        return np.concatenate([embedder.embed(b) for b in batches])
+    pool_cls = ProcessPoolExecutor if getattr(embedder, "cpu_bound", False) else ThreadPoolExecutor
+    with pool_cls(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(_embed_batch, [embedder] * len(batches), batches)))
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """
+    Append-only binary cache for one model (<cache_dir>/<model>/):
+
+        keys.bin       16-byte blake2b digests of the texts, one per row
+        vectors.f32    raw float32 rows, dim given in cache.json
+
+    Vectors are written before keys, so a row only becomes visible once both
+    are on disk; a torn write at the end is truncated on the next open.
+    """
+
+    def __init__(self, cache_dir: str | Path, model_id: str):
+        safe = re.sub(r"[^\w.-]+", "_", model_id)
+        self.dir = Path(cache_dir) / safe
+        self.model_id = model_id
+        self.dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._appended: List[np.ndarray] = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        header = self.dir / "cache.json"
+        if not header.exists():
+            return
+        meta = json.loads(header.read_text(encoding="utf-8"))
+        if meta.get("model_id") != self.model_id:
+            logger.warning("Embedding cache %s belongs to %s, ignoring it", self.dir, meta.get("model_id"))
+            return
+        self.dim = int(meta["dim"])
+        keys = (self.dir / "keys.bin").read_bytes()
+        vec_path = self.dir / "vectors.f32"
+        n_vec = vec_path.stat().st_size // (4 * self.dim) if vec_path.exists() else 0
+        n = min(len(keys) // KEY_BYTES, n_vec)
+        # cut a torn tail so later appends stay aligned
+        if len(keys) != n * KEY_BYTES:
+            os.truncate(self.dir / "keys.bin", n * KEY_BYTES)
+        if vec_path.exists() and vec_path.stat().st_size != n * 4 * self.dim:
+            os.truncate(vec_path, n * 4 * self.dim)
+        if n:
+            self._vectors = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        self._index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n)}
+        logger.info("Embedding cache %s: %d vectors", self.dir, n)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _row(self, i: int) -> np.ndarray:
+        base = len(self._vectors)
+        if i < base:
+            return self._vectors[i]
+        for block in self._appended:
+            if i < base + len(block):
+                return block[i - base]
+            base += len(block)
+        raise IndexError(i)
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            return [None if (i := self._index.get(k)) is None else np.asarray(self._row(i)) for k in keys]
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            fresh = [(k, v) for k, v in zip(keys, vectors) if k not in self._index]
+            if not fresh:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.dir.mkdir(parents=True, exist_ok=True)
+                (self.dir / "cache.json").write_text(
+                    json.dumps({"model_id": self.model_id, "dim": self.dim}), encoding="utf-8"
+                )
+            block = np.stack([v for _, v in fresh])
+            with open(self.dir / "vectors.f32", "ab") as f:
+                f.write(block.tobytes())
+            with open(self.dir / "keys.bin", "ab") as f:
+                f.write(b"".join(k for k, _ in fresh))
+            start = len(self._index)
+            for offset, (k, _) in enumerate(fresh):
+                self._index[k] = start + offset
+            self._appended.append(block)
+
+
+class EmbeddingService:
+    """
+    Dedupe -> cache lookup -> batched backend calls -> cache write.
+    Exposes the backend's `model_id` / `cpu_bound`, so it can stand in for
+    the backend anywhere (VectorStore, tools.build_index).
+    """
+
+    def __init__(self, embedder, cache: Optional[EmbeddingCache] = None, batch_size: int = 32, workers: int = 1):
+        self.embedder = embedder
+        self.cache = cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self._stats = {"calls": 0, "texts": 0, "unique": 0, "cache_hits": 0,
+                       "embedded": 0, "batches": 0, "embed_s": 0.0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        return self.embedder.model_id
+
+    @property
+    def cpu_bound(self) -> bool:
+        return getattr(self.embedder, "cpu_bound", False)
+
+    def embed(self, texts: Sequence[str], batch_size: Optional[int] = None, workers: Optional[int] = None) -> np.ndarray:
+        texts = list(texts)
+        batch_size = batch_size or self.batch_size
+        unique: Dict[str, int] = {}
+        positions = np.fromiter((unique.setdefault(t, len(unique)) for t in texts), dtype=np.int64, count=len(texts))
+        unique_texts = list(unique)
+
+        keys = [text_key(t) for t in unique_texts]
+        cached = self.cache.get_many(keys) if self.cache is not None else [None] * len(unique_texts)
+        misses = [i for i, v in enumerate(cached) if v is None]
+
+        t0 = time.perf_counter()
+        fresh = None
+        if misses:
+            fresh = embed_batches(self.embedder, [unique_texts[i] for i in misses],
+                                  batch_size, workers or self.workers)
+            if self.cache is not None:
+                self.cache.put_many([keys[i] for i in misses], fresh)
+        elapsed = time.perf_counter() - t0
+
+        dim = fresh.shape[1] if fresh is not None else (len(cached[0]) if cached else 0)
+        out = np.empty((len(unique_texts), dim), dtype=np.float32)
+        for i, v in enumerate(cached):
+            if v is not None:
+                out[i] = v
+        if misses:
+            out[misses] = fresh
+
+        with self._stats_lock:
+            s = self._stats
+            s["calls"] += 1
+            s["texts"] += len(texts)
+            s["unique"] += len(unique_texts)
+            s["cache_hits"] += len(unique_texts) - len(misses)
+            s["embedded"] += len(misses)
+            s["batches"] += -(-len(misses) // batch_size)
+            s["embed_s"] += elapsed
+        return out[positions]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus backend throughput (texts/s) and cache hit rate"""
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["embed_s"] = round(s["embed_s"], 4)
+        s["embedded_per_s"] = round(s["embedded"] / s["embed_s"], 1) if s["embed_s"] else None
+        s["cache_hit_rate"] = round(s["cache_hits"] / s["unique"], 4) if s["unique"] else None
+        s["model_id"] = self.model_id
+        return s
+
+
+def make_embedder(provider: Optional[str] = None):
+    provider = (provider or CONFIG.get("EMBED_PROVIDER", "ollama")).lower()
+
+    if provider == "ollama":
+        return OllamaEmbedder()
+    if provider == "hashing":
+        return HashingEmbedder(int(CONFIG.get("EMBED_DIM", 256)))
+
+    raise ValueError(f"Unsupported EMBED_PROVIDER: {provider}")
+
+
+@lru_cache(maxsize=1)
+def get_embed_model() -> EmbeddingService:
+    embedder = make_embedder()
+    cache_dir = CONFIG.get("EMBED_CACHE_DIR", ".cache/embeddings")
+    cache = EmbeddingCache(cache_dir, embedder.model_id) if cache_dir else None
+    return EmbeddingService(
+        embedder,
+        cache,
+        batch_size=int(CONFIG.get("EMBED_BATCH_SIZE", 32)),
+        workers=int(CONFIG.get("EMBED_WORKERS", 1)),
+    )
@@ -0,0 +1,167 @@
+"""
+Word export off the graph's critical path.
+
+finalize_node submits the post to the ExportQueue and returns at once; a
+background thread builds and writes the .docx. The file name is derived
+from a hash of the content, so the path is known before the file exists
+(it goes into the run state as docx_path) and concurrent runs never
+overwrite each other. The run result carries an ExportHandle whose
+result() waits for the file.
+
+write_archive() is the batch mode: many posts into one .zip.
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from config import CONFIG
+from utils.log_service import current_run_id, get_logger, log_context
+from utils.save_to_word import build_document, content_filename, save_to_word
+from utils.tracing import get_tracer
+
+logger = get_logger("export")
+
+
+class ExportHandle:
+    """Path of a (possibly still running) export; str() / os.fspath() give the path"""
+
+    def __init__(self, path: Path, future: Optional[Future] = None):
+        self.path = path
+        self._future = future
+
+    def done(self) -> bool:
+        return self._future is None or self._future.done()
+
+    def failed(self) -> bool:
+        return self.done() and self._future is not None and self._future.exception() is not None
+
+    def result(self, timeout: Optional[float] = None) -> Path:
+        """Wait for the file to be written; re-raises the export error"""
+        if self._future is not None:
+            self._future.result(timeout)
+        return self.path
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+    def __repr__(self) -> str:
+        return f"ExportHandle({str(self.path)!r}, done={self.done()})"
+
+
+class ExportQueue:
+    """Background .docx writer; identical content is exported once"""
+
+    def __init__(self, out_dir: str | Path = "outputs", workers: int = 1, max_handles: int = 1000):
+        self.out_dir = Path(out_dir)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._handles: "OrderedDict[Path, ExportHandle]" = OrderedDict()
+        self._max_handles = max_handles
+        self._lock = threading.Lock()
+
+    def path_for(self, content: str) -> Path:
+        return self.out_dir / content_filename(content)
+
+    def submit(self, content: str, score: Optional[float] = None) -> ExportHandle:
+        path = self.path_for(content)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and not handle.failed():
+                self._handles.move_to_end(path)
+                return handle
+            if path.exists():
+                handle = ExportHandle(path)
+            else:
+                future = self._executor.submit(self._export, content, score, path, current_run_id())
+                handle = ExportHandle(path, future)
+            self._handles[path] = handle
+            while len(self._handles) > self._max_handles:
+                self._handles.popitem(last=False)
+        return handle
+
+    def handle(self, path: str | Path) -> Optional[ExportHandle]:
+        """Handle of a submitted export, or a finished one if the file exists"""
+        path = Path(path)
+        with self._lock:
+            handle = self._handles.get(path)
+        if handle is None and path.exists():
+            handle = ExportHandle(path)
+        return handle
+
+    @staticmethod
+    def _export(content: str, score: Optional[float], path: Path, run_id: Optional[str]) -> Path:
+        with log_context(run_id):
+            try:
+                with get_tracer().span("docx.export", kind="export", agent="finalize",
+                                       content_chars=len(content)):
+                    save_to_word(content, score, out_dir=path.parent, filename=path.name)
+            except Exception:
+                logger.exception("Could not save Word document %s", path)
+                raise
+            logger.info("Saved to Word document: %s", path)
+            return path
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait for all submitted exports (errors are already logged)"""
+        with self._lock:
+            handles = list(self._handles.values())
+        for handle in handles:
+            try:
+                handle.result(timeout)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+@lru_cache(maxsize=1)
+def get_export_queue() -> ExportQueue:
+    """Process-wide export queue (EXPORT_DIR / EXPORT_WORKERS in config)"""
+    return ExportQueue(
+        out_dir=CONFIG.get("EXPORT_DIR", "outputs"),
+        workers=CONFIG.get("EXPORT_WORKERS", 1),
+    )
+
+
+def write_archive(posts: Iterable[Dict[str, Any]], archive_path: str | Path) -> Path:
+    """
+    Batch mode: write every post ({"content", "score", ...}) as a .docx into
+    one zip, plus manifest.json mapping file names to the other fields.
+    Posts with identical content are stored once.
+    """
+    archive_path = Path(archive_path)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = archive_path.with_name(f".{archive_path.name}.{os.getpid()}.tmp")
+
+    manifest = []
+    seen = set()
+    # .docx is already deflated: store it as-is
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for post in posts:
+            content = post.get("content") or ""
+            if not content:
+                continue
+            name = content_filename(content)
+            manifest.append({"file": name, **{k: v for k, v in post.items() if k != "content"}})
+            if name in seen:
+                continue
+            seen.add(name)
+            buffer = io.BytesIO()
+            build_document(content).save(buffer)
+            zf.writestr(name, buffer.getvalue())
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2, default=str),
+                    compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_path, archive_path)
+    return archive_path
@@ -0,0 +1,81 @@
+"""
+Exporters for finished posts: one markdown tokenizing pass (markdown.py)
+feeds the DOCX, HTML and JSONL writers.
+
+    export_post(content, "outputs/post.html")
+    export_posts(records, "outputs/posts.jsonl")   # many posts, one file
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from utils.exporters.docx_writer import render_docx
+from utils.exporters.html_writer import HTML_HEAD, HTML_TAIL, render_html, write_html
+from utils.exporters.jsonl_writer import post_record, write_jsonl_record
+from utils.exporters.markdown import Token, tokenize
+
+FORMATS = ("docx", "html", "jsonl")
+
+
+def _format_of(path: Path, fmt: Optional[str]) -> str:
+    fmt = (fmt or path.suffix.lstrip(".")).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {FORMATS}")
+    return fmt
+
+
+def export_posts(posts: Iterable[Dict[str, Any]], path: str | Path, fmt: Optional[str] = None) -> Path:
+    """
+    Write posts ({"content", ...metadata}) into one file, streaming post by
+    post: JSONL = one record per line (metadata kept), HTML = one <article>
+    per post, DOCX = one document with a page break between posts.
+    """
+    path = Path(path)
+    fmt = _format_of(path, fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if fmt == "docx":
+        from docx import Document
+        doc = Document()
+        first = True
+        for post in posts:
+            if not first:
+                doc.add_page_break()
+            render_docx(tokenize(post.get("content") or ""), doc)
+            first = False
+        doc.save(path)
+        return path
+
+    with path.open("w", encoding="utf-8") as out:
+        if fmt == "html":
+            out.write(HTML_HEAD.format(title="AFFINA posts"))
+        for post in posts:
+            tokens = tokenize(post.get("content") or "")
+            if fmt == "jsonl":
+                meta = {k: v for k, v in post.items() if k != "content"}
+                write_jsonl_record({**meta, **post_record(tokens)}, out)
+            else:
+                out.write("<article>\n")
+                write_html(tokens, out)
+                out.write("</article>\n")
+        if fmt == "html":
+            out.write(HTML_TAIL)
+    return path
+
+
+def export_post(content: str, path: str | Path, fmt: Optional[str] = None) -> Path:
+    return export_posts([{"content": content}], path, fmt)
+
+
+__all__ = [
+    "FORMATS",
+    "Token",
+    "tokenize",
+    "render_docx",
+    "render_html",
+    "write_html",
+    "post_record",
+    "export_post",
+    "export_posts",
+]
@@ -0,0 +1,34 @@
+"""python -m utils.exporters results.jsonl --out outputs/posts.html"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+from utils.exporters import FORMATS, export_posts
+
+
+def _read_records(path: Path):
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("content") and not record.get("error"):
+                yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất bài viết (JSONL kết quả) sang DOCX / HTML / JSONL")
+    parser.add_argument("results", help="File JSONL có trường 'content' (vd. kết quả content_plan.py)")
+    parser.add_argument("--out", required=True, help="File đích (.docx, .html hoặc .jsonl)")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Mặc định: theo đuôi file --out")
+    args = parser.parse_args()
+
+    path = export_posts(_read_records(Path(args.results)), args.out, args.format)
+    print(f"✅ Đã xuất: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""DOCX writer: token stream -> python-docx Document, run by run."""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from utils.exporters.markdown import Token
+
+if TYPE_CHECKING:
+    from docx.document import Document
+
+_LIST_STYLES = {"bullet": "List Bullet", "ordered": "List Number"}
+
+
+def render_docx(tokens: Iterable[Token], doc: Optional["Document"] = None) -> "Document":
+    """Append the tokens to `doc` (a new Document by default)"""
+    if doc is None:
+        # python-docx is only needed once something is exported
+        from docx import Document
+        doc = Document()
+
+    paragraph = None
+    bold = italic = False
+    for tok in tokens:
+        kind = tok.kind
+        if kind == "text" or kind == "hashtag":
+            run = paragraph.add_run(tok.text)
+            if bold:
+                run.bold = True
+            if italic:
+                run.italic = True
+        elif kind == "bold" or kind == "/bold":
+            bold = kind == "bold"
+        elif kind == "italic" or kind == "/italic":
+            italic = kind == "italic"
+        elif kind == "break":
+            paragraph.add_run().add_break()
+        elif kind == "paragraph":
+            paragraph = doc.add_paragraph()
+        elif kind == "heading":
+            paragraph = doc.add_heading(level=min(tok.level, 9))
+        elif kind in _LIST_STYLES:
+            paragraph = doc.add_paragraph(style=_LIST_STYLES[kind])
+        elif kind == "rule":
+            paragraph = doc.add_paragraph()
+        elif kind == "end":
+            paragraph = None
+            bold = italic = False
+    return doc
@@ -0,0 +1,70 @@
+"""HTML writer: token stream -> HTML fragments written straight to a file."""
+from __future__ import annotations
+
+import io
+from html import escape
+from typing import Iterable, TextIO
+
+from utils.exporters.markdown import Token, tokenize
+
+_LIST_TAGS = {"bullet": "ul", "ordered": "ol"}
+_INLINE_TAGS = {
+    "bold": "<strong>", "/bold": "</strong>",
+    "italic": "<em>", "/italic": "</em>",
+    "break": "<br>\n",
+}
+
+HTML_HEAD = (
+    '<!DOCTYPE html>\n<html lang="vi">\n<head>\n<meta charset="utf-8">\n'
+    "<title>{title}</title>\n"
+    "<style>body{{font-family:sans-serif;max-width:48rem;margin:auto}}"
+    " article{{margin:2rem 0}} .hashtag{{color:#1a73e8}}</style>\n"
+    "</head>\n<body>\n"
+)
+HTML_TAIL = "</body>\n</html>\n"
+
+
+def write_html(tokens: Iterable[Token], out: TextIO) -> None:
+    """Write the post's HTML (without <html>/<body>) to `out`"""
+    write = out.write
+    list_tag = None
+    closing = ""
+    for tok in tokens:
+        kind = tok.kind
+        if kind == "text":
+            write(escape(tok.text, quote=False))
+        elif kind == "hashtag":
+            write(f'<span class="hashtag">{escape(tok.text, quote=False)}</span>')
+        elif kind in _INLINE_TAGS:
+            write(_INLINE_TAGS[kind])
+        elif kind == "end":
+            write(closing)
+            closing = ""
+        else:
+            wanted = _LIST_TAGS.get(kind)
+            if list_tag and list_tag != wanted:
+                write(f"</{list_tag}>\n")
+                list_tag = None
+            if wanted and not list_tag:
+                write(f"<{wanted}>\n")
+                list_tag = wanted
+            if kind == "paragraph":
+                write("<p>")
+                closing = "</p>\n"
+            elif kind == "heading":
+                level = min(tok.level, 6)
+                write(f"<h{level}>")
+                closing = f"</h{level}>\n"
+            elif kind == "rule":
+                write("<hr>\n")
+            else:
+                write("<li>")
+                closing = "</li>\n"
+    if list_tag:
+        write(f"</{list_tag}>\n")
+
+
+def render_html(content: str) -> str:
+    buffer = io.StringIO()
+    write_html(tokenize(content), buffer)
+    return buffer.getvalue()
@@ -0,0 +1,68 @@
+"""JSONL writer: token stream -> one plain-text record per post."""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+from utils.exporters.markdown import Token
+
+
+def post_record(tokens: Iterable[Token]) -> Dict[str, Any]:
+    """
+    {"title", "text", "blocks": [{"type", "text"}], "hashtags"}: markdown
+    markers removed, blocks separated by blank lines in "text", list items
+    prefixed with "• " / "n. "
+    """
+    blocks: List[Dict[str, Any]] = []
+    hashtags: List[str] = []
+    title: Optional[str] = None
+    parts: List[str] = []
+    current: Optional[Token] = None
+
+    for tok in tokens:
+        kind = tok.kind
+        if kind == "text":
+            parts.append(tok.text)
+        elif kind == "hashtag":
+            parts.append(tok.text)
+            hashtags.append(tok.text)
+        elif kind == "break":
+            parts.append("\n")
+        elif kind == "end":
+            if current is not None and current.kind != "rule":
+                text = "".join(parts)
+                block: Dict[str, Any] = {"type": current.kind, "text": text}
+                if current.kind == "ordered":
+                    block["number"] = current.level
+                elif current.kind == "heading":
+                    block["level"] = current.level
+                    if title is None:
+                        title = text
+                blocks.append(block)
+            parts = []
+            current = None
+        elif kind not in ("bold", "/bold", "italic", "/italic"):
+            current = tok
+
+    text_blocks = []
+    for b in blocks:
+        if b["type"] == "bullet":
+            text_blocks.append(f"• {b['text']}")
+        elif b["type"] == "ordered":
+            text_blocks.append(f"{b['number']}. {b['text']}")
+        else:
+            text_blocks.append(b["text"])
+    if title is None and blocks:
+        title = blocks[0]["text"].split("\n", 1)[0]
+
+    return {
+        "title": title,
+        "text": "\n\n".join(text_blocks),
+        "blocks": blocks,
+        "hashtags": list(dict.fromkeys(hashtags)),
+    }
+
+
+def write_jsonl_record(record: Dict[str, Any], out: TextIO) -> None:
+    out.write(json.dumps(record, ensure_ascii=False, default=str))
+    out.write("\n")
@@ -0,0 +1,121 @@
+"""
+Single-pass tokenizer for the markdown the generator writes.
+
+tokenize() walks the text once, line by line, and yields a flat stream of
+tokens that every writer (DOCX, HTML, JSONL) consumes:
+
+    block opens   heading(level) | paragraph | bullet | ordered(level=number) | rule
+    block close   end
+    inline        text | hashtag | bold | /bold | italic | /italic | break
+
+Blocks never nest; inline tokens only appear between a block open and its
+end. ** / * only toggle emphasis when paired on the same line; an unpaired
+marker ("5*3 = 15") stays literal text.
+"""
+from __future__ import annotations
+
+import io
+import re
+from typing import Iterator, NamedTuple
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str = ""
+    level: int = 0
+
+
+END = Token("end")
+BREAK = Token("break")
+RULE = Token("rule")
+_BOLD, _BOLD_END = Token("bold"), Token("/bold")
+_ITALIC, _ITALIC_END = Token("italic"), Token("/italic")
+
+_HEADING = re.compile(r"(#{1,6})\s+(.*?)\s*#*$")
+_BULLET = re.compile(r"[-*+•]\s+(.*)$")
+_ORDERED = re.compile(r"(\d{1,3})[.)]\s+(.*)$")
+_RULE = re.compile(r"(?:-{3,}|\*{3,}|_{3,}|━{3,}|═{3,})$")
+# ** toggles bold; * toggles italic when it touches a word; hashtags start
+# at the beginning of the text or after whitespace / an opening bracket
+_INLINE = re.compile(r"\*\*|\*(?=\S)|(?<=\S)\*|(?<![^\s(\[])#[^\s#.,!?;:()\[\]]+")
+
+
+def _pair_markers(text: str, matches: list) -> dict:
+    """
+    Index of each paired ** / * match -> its token. A marker opens when text
+    follows it and closes an open one of the same kind when text precedes it.
+    """
+    paired = {}
+    open_at = {}
+    for i, m in enumerate(matches):
+        marker = m.group()
+        if marker[0] != "*":
+            continue
+        before = text[m.start() - 1] if m.start() else " "
+        after = text[m.end()] if m.end() < len(text) else " "
+        if marker in open_at and not before.isspace():
+            start = open_at.pop(marker)
+            paired[start], paired[i] = (_BOLD, _BOLD_END) if marker == "**" else (_ITALIC, _ITALIC_END)
+        elif not after.isspace():
+            open_at[marker] = i
+    return paired
+
+
+def tokenize_inline(text: str) -> Iterator[Token]:
+    matches = list(_INLINE.finditer(text))
+    paired = _pair_markers(text, matches)
+    pos = 0
+    for i, m in enumerate(matches):
+        marker = m.group()
+        if marker[0] == "*" and i not in paired:
+            continue  # unpaired: left in the surrounding text
+        if m.start() > pos:
+            yield Token("text", text[pos:m.start()])
+        yield paired[i] if i in paired else Token("hashtag", marker)
+        pos = m.end()
+    if pos < len(text):
+        yield Token("text", text[pos:])
+
+
+def tokenize(text: str) -> Iterator[Token]:
+    """Token stream of a markdown post (see module docstring)"""
+    in_paragraph = False
+    for line in io.StringIO(text):
+        stripped = line.strip()
+
+        if not stripped:
+            if in_paragraph:
+                yield END
+                in_paragraph = False
+            continue
+
+        block = None
+        if stripped[0] == "#" and (m := _HEADING.match(stripped)):
+            block, body = Token("heading", level=len(m.group(1))), m.group(2)
+        elif _RULE.match(stripped):
+            block, body = RULE, None
+        elif (m := _BULLET.match(stripped)) and not stripped.startswith("**"):
+            block, body = Token("bullet"), m.group(1)
+        elif stripped[0].isdigit() and (m := _ORDERED.match(stripped)):
+            block, body = Token("ordered", level=int(m.group(1))), m.group(2)
+
+        if block is None:
+            # Consecutive lines form one paragraph, separated by line breaks
+            if in_paragraph:
+                yield BREAK
+            else:
+                yield Token("paragraph")
+                in_paragraph = True
+            yield from tokenize_inline(stripped)
+            continue
+
+        if in_paragraph:
+            yield END
+            in_paragraph = False
+        yield block
+        if body:
+            yield from tokenize_inline(body)
+        yield END
+
+    if in_paragraph:
+        yield END
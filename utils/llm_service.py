@@ -1,63 +1,145 @@
 from __future__ import annotations
+import contextvars
+import threading
 import time
 import warnings
-from typing import Any
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, List, Tuple
+
+from config import CONFIG
+from utils.cassette import get_cassette
+from utils.log_service import get_logger
+from utils.resilience import backoff_delay, get_breaker, get_latency_window
+from utils.tracing import current_node, get_tracer
 
 # Suppress deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# Try to import from new package first, fallback to old one
-try:
+if TYPE_CHECKING:
     from langchain_ollama import ChatOllama
-    print("Sử dụng langchain_ollama package")
-except ImportError:
+
+logger = get_logger("llm")
+
+_chat_ollama_cls = None
+
+
+def _chat_ollama():
+    """Import ChatOllama on first use (langchain is slow to import)"""
+    global _chat_ollama_cls
+    if _chat_ollama_cls is not None:
+        return _chat_ollama_cls
+
+    # Try to import from new package first, fallback to old one
     try:
-        from langchain_community.chat_models import ChatOllama
-        print("Sử dụng langchain_community.chat_models")
-        print("Khuyến nghị cập nhật: pip install -U langchain-ollama")
+        from langchain_ollama import ChatOllama
     except ImportError:
-        raise ImportError("Không thể import ChatOllama")
+        try:
+            from langchain_community.chat_models import ChatOllama
+            logger.warning("Sử dụng langchain_community.chat_models - khuyến nghị: pip install -U langchain-ollama")
+        except ImportError:
+            raise ImportError("Không thể import ChatOllama")
+
+    _chat_ollama_cls = ChatOllama
+    return ChatOllama
+
+class LLMPool:
+    """
+    One chat client per supervised Ollama instance (OLLAMA_INSTANCES).
+    invoke() goes to the ready instance with the fewest in-flight requests
+    per parallel slot; the lease lets shutdown drain it.
+    """
+
+    def __init__(self, backends: List[Tuple[Any, "ChatOllama"]]):
+        self._backends = backends
+
+    @property
+    def model(self) -> str:
+        return self._backends[0][1].model
+
+    @property
+    def backends(self) -> List[Tuple[Any, "ChatOllama"]]:
+        """(instance, client) of the instances currently ready"""
+        return [(inst, llm) for inst, llm in self._backends if inst.state == "ready"]
+
+    def pick(self) -> Tuple[Any, "ChatOllama"]:
+        ready = self.backends
+        if not ready:
+            raise RuntimeError("Không có Ollama instance nào sẵn sàng")
+        return min(ready, key=lambda b: b[0].inflight / b[0].num_parallel)
+
+    def invoke(self, prompt: Any, **kwargs: Any) -> Any:
+        inst, llm = self.pick()
+        inst.acquire()
+        try:
+            return llm.invoke(prompt, **kwargs)
+        finally:
+            inst.release()
 
-from utils.ollama_manager import ensure_ollama_ready
-from config import CONFIG
+
+def _build_llm(model: str, temperature: float, timeout: int, verbose: bool) -> Any:
+    """ChatOllama on HOST, or an LLMPool over the supervised instances"""
+    from utils.ollama_manager import HOST, ensure_ollama_ready, get_supervisor
+
+    hosts = ensure_ollama_ready(model)
+    supervisor = get_supervisor()
+    if supervisor is None:
+        return _chat_ollama()(
+            model=model,
+            base_url=hosts[0] if hosts else HOST,
+            temperature=temperature,
+            request_timeout=timeout,
+            verbose=verbose,
+        )
+    return LLMPool([
+        (inst, _chat_ollama()(
+            model=model,
+            base_url=inst.host,
+            temperature=temperature,
+            request_timeout=timeout,
+            num_thread=inst.num_threads,
+            verbose=verbose,
+        ))
+        for inst in supervisor.instances
+    ])
 
 def get_llm(
     model: str | None = None,
     temperature: float = 0.3,
     timeout: int = 60,
     verbose: bool = False,
-) -> ChatOllama:
-    """Tạo LLM instance với fallback models"""
-    
+) -> ChatOllama | LLMPool:
+    """Tạo LLM instance với fallback models (LLMPool khi cấu hình OLLAMA_INSTANCES)"""
+    # requests + the daemon check are only needed once a model is requested
+    from utils.ollama_manager import HOST
+
     model = model or CONFIG["OLLAMA_MODELS"][0]
-    
-    # Thử với model được yêu cầu
-    try:
-        ensure_ollama_ready(model)
-        return ChatOllama(
+
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        # Replayed runs never reach the model: skip starting/pulling it
+        return _chat_ollama()(
             model=model,
+            base_url=HOST,
             temperature=temperature,
             request_timeout=timeout,
             verbose=verbose,
         )
+
+    # Thử với model được yêu cầu
+    try:
+        return _build_llm(model, temperature, timeout, verbose)
     except Exception as e:
-        print(f"Không thể sử dụng model {model}: {e}")
+        logger.warning("Không thể sử dụng model %s: %s", model, e)
         
         # Fallback sang các model khác trong config
         fallback_models = [m for m in CONFIG["OLLAMA_MODELS"] if m != model]
         
         for fallback_model in fallback_models:
             try:
-                print(f"Thử fallback model: {fallback_model}")
-                ensure_ollama_ready(fallback_model)
-                return ChatOllama(
-                    model=fallback_model,
-                    temperature=temperature,
-                    request_timeout=timeout,
-                    verbose=verbose,
-                )
+                logger.info("Thử fallback model: %s", fallback_model)
+                return _build_llm(fallback_model, temperature, timeout, verbose)
             except Exception as fallback_e:
-                print(f"Fallback model {fallback_model} thất bại: {fallback_e}")
+                logger.warning("Fallback model %s thất bại: %s", fallback_model, fallback_e)
                 continue
         
         raise RuntimeError(
@@ -68,22 +150,184 @@ def get_llm(
             f"  3. Thử pull model thủ công: ollama pull qwen3:1.7b"
         )
 
-def call_llm(llm: ChatOllama, prompt: str, max_retry: int = 2) -> str:
-    """Gọi LLM với retry logic"""
-    for attempt in range(1, max_retry + 2):
+def _token_counts(response: Any) -> dict:
+    """Prompt/completion token counts and Ollama timings of a chat response"""
+    meta = getattr(response, "response_metadata", None) or {}
+    usage = getattr(response, "usage_metadata", None) or {}
+    counts = {
+        "prompt_tokens": meta.get("prompt_eval_count", usage.get("input_tokens")),
+        "completion_tokens": meta.get("eval_count", usage.get("output_tokens")),
+    }
+    # Ollama reports durations in ns: model load, prompt prefill, generation
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration"):
+        if meta.get(key) is not None:
+            counts[f"{key}_s"] = meta[key] / 1e9
+    return {k: v for k, v in counts.items() if v is not None}
+
+class LLMCallError(RuntimeError):
+    """
+    call_llm gave up: typed, so callers can tell an unavailable model from
+    bad output instead of parsing an error string as if the model wrote it.
+
+        kind  "timeout" | "unavailable" | "circuit_open" | "error"
+    """
+
+    def __init__(self, message: str, kind: str, attempts: int, backend: str | None = None):
+        super().__init__(message)
+        self.kind = kind
+        self.attempts = attempts
+        self.backend = backend
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "message": str(self), "attempts": self.attempts, "backend": self.backend}
+
+
+def _error_kind(exc: BaseException) -> str:
+    text = f"{type(exc).__name__} {exc}".lower()
+    if "timeout" in text or "timed out" in text:
+        return "timeout"
+    if "connect" in text or "refused" in text or "unavailable" in text:
+        return "unavailable"
+    return "error"
+
+
+def _backends(llm: Any) -> List[Tuple[str, Any, Any]]:
+    """(name, instance or None, client) of every backend the llm can use"""
+    if isinstance(llm, LLMPool):
+        ready = sorted(llm.backends, key=lambda b: b[0].inflight / b[0].num_parallel)
+        return [(inst.host, inst, client) for inst, client in ready]
+    return [(getattr(llm, "base_url", None) or getattr(llm, "model", None) or "llm", None, llm)]
+
+
+def _invoke(backend: Tuple[str, Any, Any], prompt: str, attempt: int, hedge: bool) -> Tuple[str, dict, float]:
+    """One call on one backend, traced and leased; (text, token counts, seconds)"""
+    name, inst, client = backend
+    if inst is not None:
+        inst.acquire()
+    try:
+        with get_tracer().span("llm.call", kind="llm", model=getattr(client, "model", None), attempt=attempt,
+                               prompt_chars=len(prompt), backend=name, hedge=hedge) as span:
+            # timed here, not by the span: spans are no-ops with TRACING_ENABLED off,
+            # and this duration drives the hedge p95
+            started = time.perf_counter()
+            response = client.invoke(prompt)
+            duration = time.perf_counter() - started
+            counts = _token_counts(response)
+            span.set(**counts)
+    finally:
+        if inst is not None:
+            inst.release()
+    text = response.content if hasattr(response, "content") else str(response)
+    return text, counts, duration
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=int(CONFIG.get("LLM_HEDGE_WORKERS", 16)),
+                                             thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+
+def _submit(fn, *args):
+    # each thread gets its own copy of the context: tracing node, run id and
+    # the graph's streaming callbacks follow the call
+    return _get_hedge_pool().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _call_hedged(backends: List[Tuple[str, Any, Any]], prompt: str, attempt: int,
+                 hedge_after: float | None) -> Tuple[str, dict, float, str]:
+    """
+    Call the first backend; if it has not answered after `hedge_after`
+    seconds (observed p95) and a second backend is available, send the same
+    prompt there too and take whichever succeeds first. The slower call is
+    left to finish in the background.
+    """
+    primary = backends[0]
+    if hedge_after is None or len(backends) < 2:
         try:
-            response = llm.invoke(prompt)
-            if hasattr(response, 'content'):
-                return response.content
+            return (*_invoke(primary, prompt, attempt, False), primary[0])
+        except Exception:
+            get_breaker(primary[0]).record_failure()
+            raise
+
+    futures = {_submit(_invoke, primary, prompt, attempt, False): primary}
+    done, _ = wait(futures, timeout=hedge_after)
+    tracer = get_tracer()
+    if not done:
+        secondary = backends[1]
+        tracer.count("affina_llm_hedges_total", agent=current_node() or "none")
+        logger.info("LLM %s chậm hơn p95 (%.1fs), gửi thêm sang %s", primary[0], hedge_after, secondary[0])
+        futures[_submit(_invoke, secondary, prompt, attempt, True)] = secondary
+
+    errors: dict = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future][0]
+            if future.exception() is None:
+                if name != primary[0]:
+                    tracer.count("affina_llm_hedge_wins_total", agent=current_node() or "none")
+                return (*future.result(), name)
+            get_breaker(name).record_failure()
+            errors[name] = future.exception()
+    raise errors[primary[0]]
+
+
+def call_llm(llm: ChatOllama | LLMPool, prompt: str, max_retry: int = 2) -> str:
+    """
+    Gọi LLM với retry (exponential backoff + jitter), circuit breaker cho
+    từng backend và hedging khi có backend thứ hai (LLMPool). Hết lượt thử
+    thì raise LLMCallError thay vì trả về chuỗi lỗi.
+    """
+    tracer = get_tracer()
+    model = getattr(llm, "model", None)
+    cassette = get_cassette()
+    request = {"model": model, "prompt": prompt}
+
+    if cassette is not None and cassette.replaying:
+        with tracer.span("llm.call", kind="llm", model=model, attempt=1,
+                         prompt_chars=len(prompt), cassette="replay"):
+            return cassette.play("llm", request)[0]
+
+    base = float(CONFIG.get("LLM_BACKOFF_BASE_S", 1.0))
+    cap = float(CONFIG.get("LLM_BACKOFF_MAX_S", 20.0))
+    latency = get_latency_window(str(model))
+    hedge_pct = float(CONFIG.get("LLM_HEDGE_PERCENTILE", 95))
+    last_error: LLMCallError | None = None
+
+    for attempt in range(1, max_retry + 2):
+        backends = [b for b in _backends(llm) if get_breaker(b[0]).allow()]
+        if not backends:
+            last_error = LLMCallError("Mọi backend LLM đang bị ngắt (circuit open)", "circuit_open", attempt)
+            logger.warning("Error (lần %d/%d): %s", attempt, max_retry + 1, last_error)
+        else:
+            hedge_after = latency.percentile(hedge_pct) if CONFIG.get("LLM_HEDGE", True) else None
+            try:
+                text, counts, duration, used = _call_hedged(backends, prompt, attempt, hedge_after)
+            except Exception as exc:
+                last_error = LLMCallError(str(exc), _error_kind(exc), attempt, backends[0][0])
+                logger.warning("Error (lần %d/%d, %s): %s", attempt, max_retry + 1, backends[0][0], exc)
             else:
-                return str(response)
-        except Exception as exc:
-            print(f"[LLM] Error (lần {attempt}/{max_retry+1}): {exc}")
-            if attempt > max_retry:
-                return f"Error sau {max_retry+1} lần thử: {exc}"
-            
-            sleep_time = 1.5 * attempt
-            print(f"[LLM] Chờ {sleep_time}s trước khi thử lại...")
-            time.sleep(sleep_time)
-    
-    return "Lỗi không xác định trong retry logic."
\ No newline at end of file
+                get_breaker(used).record_success()
+                latency.observe(duration)
+                if cassette is not None:
+                    cassette.record("llm", request, text,
+                                    {"attempt": attempt, "duration_s": round(duration, 6), **counts})
+                return text
+
+        if attempt > max_retry:
+            break
+        tracer.count("affina_llm_retries_total", agent=current_node() or "none")
+        sleep_time = backoff_delay(attempt, base, cap)
+        logger.info("Chờ %.1fs trước khi thử lại...", sleep_time)
+        time.sleep(sleep_time)
+
+    tracer.count("affina_llm_failures_total", agent=current_node() or "none", kind=last_error.kind)
+    raise last_error
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from config import CONFIG
+
+ROOT_LOGGER = "affina"
+
+# Correlation id of the run currently executing in this context
+_run_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("run_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the project root logger, e.g. get_logger("orchestrator")"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def current_run_id() -> Optional[str]:
+    return _run_id.get()
+
+
+@contextmanager
+def log_context(run_id: Optional[str]) -> Iterator[None]:
+    """Tag every record logged inside the block (and in tasks that copy the
+    context, such as LangGraph node threads) with `run_id`"""
+    token = _run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _run_id.reset(token)
+
+
+class _RunIdFilter(logging.Filter):
+    """Runs in the calling thread, where the run context is visible"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id.get()
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the background listener unformatted. The stock
+    QueueHandler formats (and thus serializes payloads) in the calling
+    thread; here only the traceback is rendered eagerly, since it must not
+    outlive the frame.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line; `extra={"payload": ...}` is embedded as-is"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "msg": record.getMessage(),
+        }
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            entry["payload"] = payload
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines; payloads are pretty-printed under the message"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        run_id = getattr(record, "run_id", None)
+        prefix = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} [{record.levelname}]"
+        if run_id:
+            prefix += f" [{run_id[:8]}]"
+        text = f"{prefix} {record.getMessage()}"
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            text += "\n" + json.dumps(payload, indent=2, ensure_ascii=False, default=str)
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        return text
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    log_file: Optional[str] = None,
+) -> None:
+    """
+    Route the project's loggers through a queue to one background thread.
+
+    level:    argument > LOG_LEVEL env > CONFIG["LOG_LEVEL"] (default INFO)
+    fmt:      "text" or "json" (JSON lines), default CONFIG["LOG_FORMAT"]
+    log_file: write there instead of stderr, default CONFIG["LOG_FILE"]
+
+    Calling it again replaces the previous configuration.
+    """
+    global _listener
+
+    level = (level or os.environ.get("LOG_LEVEL") or CONFIG.get("LOG_LEVEL") or "INFO").upper()
+    fmt = fmt or CONFIG.get("LOG_FORMAT") or "text"
+    log_file = log_file or CONFIG.get("LOG_FILE")
+
+    if _listener is not None:
+        _listener.stop()
+
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        sink: logging.Handler = logging.FileHandler(log_file, encoding="utf-8")
+    else:
+        sink = logging.StreamHandler(sys.stderr)
+    sink.setFormatter(JsonLinesFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    handler.addFilter(_RunIdFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, sink)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records (registered at exit)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
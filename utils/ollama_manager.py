@@ -2,13 +2,27 @@ import subprocess
 import time
 import shutil
 import atexit
+import json
+import random
+import threading
 import requests
 import os
 import sys
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 from config import CONFIG
+from utils.log_service import get_logger
 
-HOST = "http://localhost:11434"
+logger = get_logger("ollama")
+
+def _resolve_host() -> str:
+    """Ollama endpoint: env OLLAMA_HOST > config OLLAMA_HOST > default"""
+    host = os.environ.get("OLLAMA_HOST") or CONFIG.get("OLLAMA_HOST") or "http://localhost:11434"
+    if not host.startswith(("http://", "https://")):
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+HOST = _resolve_host()
 DEFAULT_MODEL = CONFIG["OLLAMA_MODELS"][0]
 
 # Fix encoding issues on Windows
@@ -22,6 +36,15 @@ def is_running() -> bool:
     except requests.exceptions.RequestException:
         return False
 
+def list_models() -> list[str]:
+    """Danh sách model mà daemon đang phục vụ (qua /api/tags)"""
+    try:
+        resp = requests.get(f"{HOST}/api/tags", timeout=2)
+        resp.raise_for_status()
+        return [m.get("name", "") for m in resp.json().get("models", [])]
+    except (requests.exceptions.RequestException, ValueError):
+        return []
+
 def start_daemon():
     """Khởi động Ollama daemon"""
     if shutil.which("ollama") is None:
@@ -32,53 +55,438 @@ def start_daemon():
         stdout=subprocess.DEVNULL,
         stderr=subprocess.STDOUT,
     )
-    atexit.register(proc.terminate)
+    atexit.register(_stop_process, proc)
     return proc
 
-def model_exists(model: str) -> bool:
-    """Kiểm tra xem model đã tồn tại local chưa"""
+def _full_name(model: str) -> str:
+    """'qwen3' -> 'qwen3:latest' (the name /api/tags reports)"""
+    return model if ":" in model.rsplit("/", 1)[-1] else f"{model}:latest"
+
+def model_exists(model: str, host: Optional[str] = None) -> bool:
+    """Model đã được daemon phục vụ chưa (qua /api/tags, không dò file trong ~/.ollama)"""
     try:
-        root = Path.home() / ".ollama" / "models"
-        return root.exists() and any(model in p.name for p in root.glob(f"**/{model.replace(':','_')}*"))
-    except Exception:
+        resp = requests.get(f"{host or HOST}/api/tags", timeout=5)
+        resp.raise_for_status()
+        names = {_full_name(m.get("name", "")) for m in resp.json().get("models", [])}
+    except (requests.exceptions.RequestException, ValueError):
         return False
+    return _full_name(model) in names
 
-def pull_model(model: str) -> bool:
-    """Pull model với error handling"""
-    if model_exists(model):
-        print(f"{model} đã có sẵn.")
+# Errors a retry cannot fix (unknown model, daemon too old)
+_FATAL_PULL_ERRORS = ("file does not exist", "not found", "newer version", "412", "invalid model")
+
+class PullError(RuntimeError):
+    """A pull failed for a reason a retry cannot fix"""
+
+class PullProgress:
+    """
+    State of one /api/pull stream: current status line, bytes completed over
+    all layers and a smoothed download rate. Ollama reports progress per
+    layer digest; a retried pull resumes the layers' partial blobs, so the
+    counters continue instead of starting over.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.status = "waiting"
+        self.layers: Dict[str, List[int]] = {}    # digest -> [completed, total]
+        self.bytes_per_s = 0.0
+        self.attempt = 0
+        self.error: Optional[str] = None
+        self.done = False
+        self.started = time.monotonic()
+        self._mark = (self.started, 0)
+
+    @property
+    def completed(self) -> int:
+        return sum(c for c, _ in self.layers.values())
+
+    @property
+    def total(self) -> int:
+        return sum(t for _, t in self.layers.values())
+
+    def update(self, event: Dict) -> None:
+        self.status = event.get("status", self.status)
+        digest = event.get("digest")
+        if digest and event.get("total"):
+            self.layers[digest] = [int(event.get("completed") or 0), int(event["total"])]
+        now = time.monotonic()
+        t0, b0 = self._mark
+        if now - t0 >= 0.5:
+            rate = max(0.0, (self.completed - b0) / (now - t0))
+            # EMA, so one slow read does not make the rate jump around
+            self.bytes_per_s = rate if not self.bytes_per_s else 0.7 * self.bytes_per_s + 0.3 * rate
+            self._mark = (now, self.completed)
+
+    def format(self) -> str:
+        line = f"{self.model}: {self.status}"
+        if self.total:
+            line += (f" {100 * self.completed / self.total:5.1f}% "
+                     f"{self.completed / 2**20:.1f}/{self.total / 2**20:.1f} MB "
+                     f"{self.bytes_per_s / 2**20:.1f} MB/s")
+        if self.attempt > 1:
+            line += f" (lần thử {self.attempt})"
+        return line
+
+def _stream_pull(model: str, progress: PullProgress, host: str, stall_timeout: float,
+                 on_progress: Optional[Callable[[PullProgress], None]]) -> None:
+    # (connect, read) timeouts: read is the longest silence allowed between
+    # two progress lines, not a bound on the whole download
+    with requests.post(f"{host}/api/pull", json={"model": model, "stream": True},
+                       stream=True, timeout=(10, stall_timeout)) as resp:
+        if resp.status_code >= 400:
+            try:
+                message = resp.json().get("error", resp.text)
+            except ValueError:
+                message = resp.text
+            raise PullError(message) if any(e in message for e in _FATAL_PULL_ERRORS) \
+                else requests.exceptions.HTTPError(f"{resp.status_code}: {message}")
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "error" in event:
+                message = event["error"]
+                if any(e in message for e in _FATAL_PULL_ERRORS):
+                    raise PullError(message)
+                raise requests.exceptions.ConnectionError(message)
+            progress.update(event)
+            if on_progress:
+                on_progress(progress)
+            if event.get("status") == "success":
+                return
+    raise requests.exceptions.ConnectionError("pull stream ended before 'success'")
+
+def pull_model(model: str,
+               on_progress: Optional[Callable[[PullProgress], None]] = None,
+               retries: Optional[int] = None,
+               stall_timeout: Optional[float] = None,
+               host: Optional[str] = None) -> bool:
+    """
+    Pull model qua /api/pull (stream), báo tiến độ qua on_progress.
+    Lỗi mạng / stream đứt được thử lại với backoff (phần đã tải được giữ);
+    không có timeout tổng, chỉ huỷ khi không nhận được gì trong stall_timeout giây.
+    """
+    host = host or HOST
+    if model_exists(model, host):
+        logger.debug("%s đã có sẵn.", model)
         return True
-    
-    print(f"Đang pull {model}...")
-    try:
-        result = subprocess.run(
-            ["ollama", "pull", model], 
-            capture_output=True, 
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            timeout=300
-        )
-        
-        if result.returncode == 0:
-            print(f"{model} pull thành công!")
-            return True
-        else:
-            error_output = result.stderr if result.stderr else result.stdout
-            print(f"Lỗi khi pull {model}: {error_output}")
+
+    retries = int(CONFIG.get("PULL_RETRIES", 5)) if retries is None else retries
+    stall_timeout = stall_timeout or float(CONFIG.get("PULL_STALL_TIMEOUT", 300))
+    progress = PullProgress(model)
+    logger.info("Đang pull %s...", model)
+
+    for attempt in range(1, retries + 2):
+        progress.attempt = attempt
+        try:
+            _stream_pull(model, progress, host, stall_timeout, on_progress)
+            break
+        except PullError as e:
+            progress.error = str(e)
+            logger.error("Không thể pull %s: %s", model, e)
             return False
-            
-    except subprocess.TimeoutExpired:
-        print(f"Timeout khi pull {model}")
-        return False
-    except Exception as e:
-        print(f"Lỗi khi pull {model}: {e}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            progress.error = str(e)
+            if attempt > retries:
+                logger.error("Lỗi khi pull %s sau %d lần thử: %s", model, attempt, e)
+                return False
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning("Pull %s bị gián đoạn (%s), thử lại sau %.1fs", model, e, delay)
+            progress.status = f"thử lại sau {delay:.0f}s"
+            if on_progress:
+                on_progress(progress)
+            time.sleep(delay)
+
+    progress.done = True
+    progress.error = None
+    if not model_exists(model, host):
+        logger.error("%s pull xong nhưng /api/tags chưa có model", model)
         return False
+    logger.info("%s pull thành công! (%.1f MB trong %.0fs)",
+                model, progress.total / 2**20, time.monotonic() - progress.started)
+    return True
+
+def pull_models(models: List[str],
+                parallel: Optional[int] = None,
+                on_progress: Optional[Callable[[PullProgress], None]] = None,
+                host: Optional[str] = None) -> Dict[str, bool]:
+    """Pull nhiều model song song (PULL_PARALLEL luồng); model -> thành công"""
+    models = list(dict.fromkeys(m.strip() for m in models if m.strip()))
+    if not models:
+        return {}
+    parallel = parallel or int(CONFIG.get("PULL_PARALLEL", 3))
+    with ThreadPoolExecutor(max_workers=min(parallel, len(models)), thread_name_prefix="pull") as pool:
+        futures = {m: pool.submit(pull_model, m, on_progress, host=host) for m in models}
+        return {m: f.result() for m, f in futures.items()}
+
+def _stop_process(proc: subprocess.Popen, grace: float = 10.0) -> None:
+    """SIGTERM, then SIGKILL if the process has not exited after `grace` seconds"""
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def parse_cpus(spec) -> Optional[set]:
+    """'0-3,6' / [0, 1] / 2 -> set of CPU ids (None = no pinning)"""
+    if spec is None or spec == "":
+        return None
+    if isinstance(spec, int):
+        return {spec}
+    if isinstance(spec, (list, tuple)):
+        return {int(c) for c in spec}
+    cpus = set()
+    for part in str(spec).split(","):
+        lo, _, hi = part.strip().partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+class OllamaInstance:
+    """
+    One supervised `ollama serve` on its own port, with its own
+    OLLAMA_NUM_PARALLEL, CPU set and per-request thread count (num_thread).
+    `inflight` counts requests routed to it, so shutdown can drain them.
+    """
+
+    def __init__(self,
+                 port: int,
+                 num_parallel: int = 1,
+                 num_threads: Optional[int] = None,
+                 cpus=None,
+                 env: Optional[Dict[str, str]] = None,
+                 bind: str = "127.0.0.1"):
+        self.port = int(port)
+        self.num_parallel = int(num_parallel)
+        self.num_threads = int(num_threads) if num_threads else None
+        self.cpus = parse_cpus(cpus)
+        self.env = {k: str(v) for k, v in (env or {}).items()}
+        self.bind = bind
+        self.host = f"http://{bind}:{self.port}"
+        self.proc: Optional[subprocess.Popen] = None
+        self.state = "stopped"          # stopped | starting | ready | draining | failed
+        self.restarts = 0
+        self.started_at = 0.0
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, spec: Dict) -> "OllamaInstance":
+        return cls(port=spec["port"], num_parallel=spec.get("num_parallel", 1),
+                   num_threads=spec.get("num_threads"), cpus=spec.get("cpus"), env=spec.get("env"))
+
+    def _command(self) -> List[str]:
+        cmd = ["ollama", "serve"]
+        # taskset pins before exec, so every thread of the daemon inherits the set
+        if self.cpus and shutil.which("taskset"):
+            cmd = ["taskset", "-c", ",".join(map(str, sorted(self.cpus)))] + cmd
+        return cmd
+
+    def start(self) -> None:
+        env = {**os.environ, **self.env,
+               "OLLAMA_HOST": f"{self.bind}:{self.port}",
+               "OLLAMA_NUM_PARALLEL": str(self.num_parallel)}
+        self.state = "starting"
+        self.proc = subprocess.Popen(self._command(), env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        if self.cpus and not shutil.which("taskset") and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(self.proc.pid, self.cpus)
+            except OSError as e:
+                logger.warning("Không đặt được CPU affinity cho %s: %s", self.host, e)
+        self.started_at = time.monotonic()
+
+    def healthy(self) -> bool:
+        if self.proc is not None and self.proc.poll() is not None:
+            return False
+        try:
+            return requests.get(f"{self.host}/api/version", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def wait_ready(self, timeout: float = 30.0) -> None:
+        """Poll the health endpoint with exponential backoff (0.1s .. 2s)"""
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while True:
+            if self.proc is not None and self.proc.poll() is not None:
+                self.state = "failed"
+                raise RuntimeError(f"ollama serve {self.host} thoát với mã {self.proc.returncode}")
+            if self.healthy():
+                self.state = "ready"
+                return
+            if time.monotonic() + delay > deadline:
+                self.state = "failed"
+                raise RuntimeError(f"ollama serve {self.host} không sẵn sàng sau {timeout:.0f}s")
+            time.sleep(delay)
+            delay = min(2.0, delay * 2)
+
+    def acquire(self) -> None:
+        with self._cond:
+            self.inflight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    def stop(self, drain_timeout: float = 30.0) -> None:
+        """Stop routing to it, wait for in-flight requests, then terminate"""
+        self.state = "draining"
+        with self._cond:
+            self._cond.wait_for(lambda: self.inflight == 0, timeout=drain_timeout)
+            if self.inflight:
+                logger.warning("%s: dừng khi còn %d request", self.host, self.inflight)
+        if self.proc is not None:
+            _stop_process(self.proc)
+        self.state = "stopped"
+
+    def describe(self) -> Dict:
+        return {"host": self.host, "state": self.state, "pid": self.proc.pid if self.proc else None,
+                "num_parallel": self.num_parallel, "num_threads": self.num_threads,
+                "cpus": sorted(self.cpus) if self.cpus else None,
+                "restarts": self.restarts, "inflight": self.inflight}
+
+class OllamaSupervisor:
+    """
+    Starts N OllamaInstance, health-checks them and restarts crashed ones
+    (exponential backoff, reset once an instance stays up for
+    STABLE_AFTER seconds). shutdown() drains every instance; it is also
+    registered with atexit.
+    """
+
+    STABLE_AFTER = 60.0
+
+    def __init__(self,
+                 instances: List[OllamaInstance],
+                 start_timeout: Optional[float] = None,
+                 check_interval: Optional[float] = None,
+                 drain_timeout: Optional[float] = None):
+        self.instances = instances
+        self.start_timeout = start_timeout or float(CONFIG.get("OLLAMA_START_TIMEOUT", 30))
+        self.check_interval = check_interval or float(CONFIG.get("OLLAMA_CHECK_INTERVAL", 2))
+        self.drain_timeout = drain_timeout or float(CONFIG.get("OLLAMA_DRAIN_TIMEOUT", 30))
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self._crashes: Dict[int, int] = {}
+        self._retry_at: Dict[int, float] = {}
+
+    def start(self) -> "OllamaSupervisor":
+        """Start every instance and wait until all are healthy (idempotent)"""
+        with self._lock:
+            if self._started:
+                return self
+            if shutil.which("ollama") is None:
+                raise RuntimeError("Lệnh 'ollama' chưa được cài đặt!")
+            for inst in self.instances:
+                if inst.healthy():
+                    raise RuntimeError(f"Cổng {inst.port} đã có Ollama khác chạy; đổi port trong OLLAMA_INSTANCES")
+                logger.info("Khởi động ollama serve %s (parallel %d, cpus %s)",
+                            inst.host, inst.num_parallel, sorted(inst.cpus) if inst.cpus else "all")
+                inst.start()
+            try:
+                for inst in self.instances:
+                    inst.wait_ready(self.start_timeout)
+            except Exception:
+                for inst in self.instances:
+                    if inst.proc is not None:
+                        _stop_process(inst.proc)
+                raise
+            self._started = True
+            atexit.register(self.shutdown)
+            self._monitor = threading.Thread(target=self._watch, name="ollama-supervisor", daemon=True)
+            self._monitor.start()
+        return self
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            for inst in self.instances:
+                if inst.state in ("draining", "stopped") or self._stop.is_set():
+                    continue
+                if inst.proc is not None and inst.proc.poll() is None:
+                    if inst.state == "failed" and inst.healthy():
+                        inst.state = "ready"        # slow start finished after wait_ready gave up
+                    if inst.state == "ready" and time.monotonic() - inst.started_at > self.STABLE_AFTER:
+                        self._crashes[inst.port] = 0
+                    continue
+                self._restart(inst)
+
+    def _restart(self, inst: OllamaInstance) -> None:
+        now = time.monotonic()
+        if inst.state != "failed":
+            crashes = self._crashes.get(inst.port, 0) + 1
+            self._crashes[inst.port] = crashes
+            delay = min(60.0, 2.0 ** (crashes - 1))
+            code = inst.proc.returncode if inst.proc is not None else None
+            logger.error("ollama serve %s đã dừng (mã %s), khởi động lại sau %.0fs", inst.host, code, delay)
+            inst.state = "failed"
+            self._retry_at[inst.port] = now + delay
+        if now < self._retry_at.get(inst.port, 0.0):
+            return
+        inst.restarts += 1
+        try:
+            inst.start()
+            inst.wait_ready(self.start_timeout)
+            logger.info("ollama serve %s đã chạy lại", inst.host)
+        except Exception as e:
+            crashes = self._crashes.get(inst.port, 0) + 1
+            self._crashes[inst.port] = crashes
+            self._retry_at[inst.port] = time.monotonic() + min(60.0, 2.0 ** (crashes - 1))
+            logger.error("Khởi động lại %s thất bại: %s", inst.host, e)
+
+    def ready(self) -> List[OllamaInstance]:
+        return [inst for inst in self.instances if inst.state == "ready"]
+
+    def shutdown(self) -> None:
+        """Graceful drain: stop routing, wait for in-flight requests, terminate"""
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=self.check_interval + 1)
+        threads = [threading.Thread(target=inst.stop, args=(self.drain_timeout,)) for inst in self.instances
+                   if inst.state != "stopped"]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._started = False
+
+    def status(self) -> List[Dict]:
+        return [inst.describe() for inst in self.instances]
+
+_supervisor: Optional[OllamaSupervisor] = None
+_supervisor_lock = threading.Lock()
+
+def get_supervisor() -> Optional[OllamaSupervisor]:
+    """Supervisor for OLLAMA_INSTANCES (None when the list is empty: single daemon at HOST)"""
+    global _supervisor
+    specs = CONFIG.get("OLLAMA_INSTANCES") or []
+    if not specs:
+        return None
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = OllamaSupervisor([OllamaInstance.from_config(s) for s in specs])
+    return _supervisor
+
+def ensure_ollama_ready(model: str = DEFAULT_MODEL) -> List[str]:
+    """Đảm bảo Ollama sẵn sàng với model; trả về các host phục vụ nó"""
+    supervisor = get_supervisor()
+    if supervisor is not None:
+        hosts = [inst.host for inst in supervisor.start().ready()]
+        if not hosts:
+            raise RuntimeError("Không có Ollama instance nào sẵn sàng")
+        # instances share ~/.ollama/models, so one pull serves all of them
+        if not model_exists(model, hosts[0]) and not pull_model(model, host=hosts[0]):
+            raise RuntimeError(f"Không thể sử dụng model {model}")
+        logger.info("Model %s sẵn sàng trên %d instance", model, len(hosts))
+        return hosts
 
-def ensure_ollama_ready(model: str = DEFAULT_MODEL):
-    """Đảm bảo Ollama sẵn sàng với model"""
     if not is_running():
-        print("Khởi động Ollama daemon...")
+        logger.info("Khởi động Ollama daemon...")
         start_daemon()
         for _ in range(20):
             if is_running():
@@ -87,10 +495,34 @@ def ensure_ollama_ready(model: str = DEFAULT_MODEL):
         else:
             raise RuntimeError("Ollama daemon không khởi động được")
     
-    print("Ollama daemon đang chạy")
-    print(f"Kiểm tra model {model}...")
+    logger.debug("Ollama daemon đang chạy")
+    logger.debug("Kiểm tra model %s...", model)
     
+    if model_exists(model):
+        logger.info("Model %s sẵn sàng", model)
+        return [HOST]
+
     if not pull_model(model):
         raise RuntimeError(f"Không thể sử dụng model {model}")
     
-    print("Model sẵn sàng")
\ No newline at end of file
+    logger.info("Model %s sẵn sàng", model)
+    return [HOST]
+def main() -> None:
+    """Chạy các instance trong OLLAMA_INSTANCES và giám sát đến khi Ctrl+C"""
+    supervisor = get_supervisor()
+    if supervisor is None:
+        sys.exit("OLLAMA_INSTANCES trống: chỉ dùng một daemon tại " + HOST)
+    supervisor.start()
+    try:
+        while True:
+            for inst in supervisor.status():
+                print(f"{inst['host']}  {inst['state']:8s} pid {inst['pid']}  parallel {inst['num_parallel']}  "
+                      f"cpus {inst['cpus'] or 'all'}  inflight {inst['inflight']}  restarts {inst['restarts']}")
+            print(flush=True)
+            time.sleep(10)
+    except KeyboardInterrupt:
+        print("Đang dừng (drain)...")
+        supervisor.shutdown()
+
+if __name__ == "__main__":
+    main()
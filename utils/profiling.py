@@ -0,0 +1,166 @@
+"""
+Opt-in per-node profiling (main.py / content_plan.py --profile).
+
+While enabled, every graph node execution is run under cProfile and
+between two tracemalloc snapshots, and writes into the run directory:
+
+    <seq>_<run>_<node>.pstats      load with pstats / snakeviz
+    <seq>_<run>_<node>.alloc.txt   top allocation sites of that node
+    summary.txt / summary.json     written by disable_profiling()
+
+When disabled the node wrapper only checks get_profiler() for None.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import itertools
+import json
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.log_service import current_run_id, get_logger
+
+logger = get_logger("profiling")
+
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 10
+
+
+def default_run_dir() -> Path:
+    return Path("outputs") / "profile" / datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+class NodeProfiler:
+    """
+    cProfile + tracemalloc around each graph node.
+
+    cProfile allows one active profiler at a time, so when nodes of
+    concurrent runs overlap, only the first is CPU-profiled and the others
+    get an allocation report only. tracemalloc is process-wide: with
+    concurrent runs a node's allocation diff includes the other threads.
+    """
+
+    def __init__(self, run_dir: str | Path):
+        self.run_dir = Path(run_dir)
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self._seq = itertools.count(1)
+        self._cpu_lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = []
+        self._records_lock = threading.Lock()
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    @contextmanager
+    def node(self, name: str) -> Iterator[None]:
+        run_id = current_run_id() or "run"
+        stem = f"{next(self._seq):03d}_{re.sub(r'[^A-Za-z0-9_-]', '', run_id)[:8]}_{name}"
+
+        profiler = cProfile.Profile() if self._cpu_lock.acquire(blocking=False) else None
+        before = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._cpu_lock.release()
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            self._write(stem, name, run_id, elapsed, profiler, before, after)
+
+    def _write(self, stem: str, name: str, run_id: str, elapsed: float,
+               profiler: Optional[cProfile.Profile],
+               before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> None:
+        record: Dict[str, Any] = {"file": stem, "node": name, "run_id": run_id, "seconds": round(elapsed, 6)}
+
+        if profiler is not None:
+            profiler.dump_stats(self.run_dir / f"{stem}.pstats")
+            record["pstats"] = f"{stem}.pstats"
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        grown = [d for d in diff if d.size_diff > 0]
+        record["alloc_kb"] = round(sum(d.size_diff for d in grown) / 1024, 1)
+        lines = [
+            f"# {name} ({run_id}) {elapsed:.3f}s, +{record['alloc_kb']} KiB net allocated",
+            "# process-wide: includes other threads when runs overlap",
+            "",
+        ]
+        lines += [str(d) for d in grown[:TOP_ALLOCATIONS]]
+        (self.run_dir / f"{stem}.alloc.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        with self._records_lock:
+            self._records.append(record)
+
+    def write_summary(self, top: int = 40) -> Path:
+        """Aggregate all node profiles into summary.txt and summary.json"""
+        with self._records_lock:
+            records = list(self._records)
+
+        per_node: Dict[str, Dict[str, float]] = {}
+        for r in records:
+            agg = per_node.setdefault(r["node"], {"calls": 0, "seconds": 0.0, "alloc_kb": 0.0})
+            agg["calls"] += 1
+            agg["seconds"] = round(agg["seconds"] + r["seconds"], 6)
+            agg["alloc_kb"] = round(agg["alloc_kb"] + r["alloc_kb"], 1)
+        (self.run_dir / "summary.json").write_text(
+            json.dumps({"nodes": per_node, "executions": records}, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+        out = io.StringIO()
+        out.write("Node            calls   seconds   alloc KiB\n")
+        for node, agg in sorted(per_node.items(), key=lambda kv: -kv[1]["seconds"]):
+            out.write(f"{node:15s} {agg['calls']:5d} {agg['seconds']:9.3f} {agg['alloc_kb']:11.1f}\n")
+
+        pstat_files = [str(self.run_dir / r["pstats"]) for r in records if "pstats" in r]
+        if pstat_files:
+            out.write(f"\nTop {top} functions by cumulative time, all nodes:\n")
+            stats = pstats.Stats(*pstat_files, stream=out)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+
+        path = self.run_dir / "summary.txt"
+        path.write_text(out.getvalue(), encoding="utf-8")
+        return path
+
+    def close(self) -> Path:
+        path = self.write_summary()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        return path
+
+
+_profiler: Optional[NodeProfiler] = None
+
+
+def get_profiler() -> Optional[NodeProfiler]:
+    """Active profiler, None unless enable_profiling() was called"""
+    return _profiler
+
+
+def enable_profiling(run_dir: Optional[str | Path] = None) -> NodeProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = NodeProfiler(run_dir or default_run_dir())
+        logger.info("Profiling graph nodes into %s", _profiler.run_dir)
+    return _profiler
+
+
+def disable_profiling() -> Optional[Path]:
+    """Stop profiling; returns the summary file (None if it was not enabled)"""
+    global _profiler
+    if _profiler is None:
+        return None
+    profiler, _profiler = _profiler, None
+    return profiler.close()
@@ -1,80 +1,70 @@
 import sys
 import shutil
-import subprocess
+import time
 import os
-from pathlib import Path
+import threading
+from typing import Dict
 from config import CONFIG
+from utils.ollama_manager import (
+    HOST,
+    PullProgress,
+    is_running,
+    pull_models,
+    start_daemon,
+)
 
 # Fix encoding issues on Windows
 if sys.platform.startswith('win'):
     os.environ['PYTHONIOENCODING'] = 'utf-8'
 
-def model_exists(model: str) -> bool:
-    """Kiểm tra xem model đã tồn tại local chưa"""
-    root = Path.home() / ".ollama" / "models"
-    return root.exists() and any(model in p.name for p in root.glob(f"**/{model.replace(':','_')}*"))
+class ProgressPrinter:
+    """In tiến độ của từng model, tối đa một dòng / giây / model (an toàn giữa các luồng)"""
 
-def pull_model(model: str) -> bool:
-    """Pull model với error handling"""
-    if model_exists(model):
-        print(f"{model} đã có sẵn.")
-        return True
-    
-    print(f"Đang pull {model}...")
-    try:
-        # Set environment for UTF-8
-        env = os.environ.copy()
-        env['PYTHONIOENCODING'] = 'utf-8'
-        
-        result = subprocess.run(
-            ["ollama", "pull", model], 
-            capture_output=True, 
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            env=env,
-            timeout=300
-        )
-        
-        if result.returncode == 0:
-            print(f"{model} pull thành công!")
-            return True
-        else:
-            error_output = result.stderr if result.stderr else result.stdout
-            
-            if "no such host" in error_output or "dial tcp" in error_output:
-                print(f"Lỗi kết nối mạng khi pull {model}")
-                print("Kiểm tra kết nối internet và thử lại")
-            elif "412" in error_output or "newer version" in error_output:
-                print(f"Model {model} yêu cầu phiên bản Ollama mới hơn!")
-                print("Hãy cập nhật Ollama tại: https://ollama.com/download")
-            elif "not found" in error_output:
-                print(f"Model {model} không tồn tại. Kiểm tra lại tên model.")
-            else:
-                print(f"Lỗi khi pull {model}: {error_output}")
-            
-            return False
-            
-    except subprocess.TimeoutExpired:
-        print(f"Timeout khi pull {model} (>5 phút)")
-        return False
-    except Exception as e:
-        print(f"Lỗi khi pull {model}: {e}")
-        return False
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._last: Dict[str, float] = {}
+        self._status: Dict[str, str] = {}
+        self._lock = threading.Lock()
 
-def main(models):
-    """Main function để pull models"""
+    def __call__(self, progress: PullProgress) -> None:
+        now = time.monotonic()
+        with self._lock:
+            changed = self._status.get(progress.model) != progress.status
+            if not changed and now - self._last.get(progress.model, 0.0) < self.interval:
+                return
+            self._last[progress.model] = now
+            self._status[progress.model] = progress.status
+            print(progress.format(), flush=True)
+
+def _ensure_daemon() -> None:
+    if is_running():
+        return
     if shutil.which("ollama") is None:
-        sys.exit("'ollama' chưa được cài đặt.")
-    
-    success_count = 0
-    for model in models:
-        if pull_model(model.strip()):
-            success_count += 1
-    
-    print(f"\nKết quả: {success_count}/{len(models)} model được tải thành công")
+        sys.exit(f"Ollama daemon không chạy tại {HOST} và 'ollama' chưa được cài đặt.")
+    print("Khởi động Ollama daemon...")
+    start_daemon()
+    for _ in range(40):
+        if is_running():
+            return
+        time.sleep(0.5)
+    sys.exit("Ollama daemon không khởi động được")
+
+def main(models, parallel=None):
+    """Pull các model song song qua /api/pull, in tiến độ và tốc độ tải"""
+    _ensure_daemon()
+
+    started = time.monotonic()
+    results = pull_models(models, parallel=parallel, on_progress=ProgressPrinter())
+    for model, ok in results.items():
+        print(f"{'✔' if ok else '✘'} {model}")
+
+    success_count = sum(results.values())
+    print(f"\nKết quả: {success_count}/{len(results)} model được tải thành công "
+          f"({time.monotonic() - started:.0f}s)")
+    if success_count < len(results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     cli = sys.argv[1:]
     models = cli or CONFIG.get("OLLAMA_MODELS", [])
-    main(models)
\ No newline at end of file
+    main(models)
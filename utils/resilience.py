@@ -0,0 +1,107 @@
+"""
+Building blocks for calling flaky backends: jittered exponential backoff,
+a per-backend circuit breaker and a rolling latency window (p95 for hedging).
+"""
+from __future__ import annotations
+
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from config import CONFIG
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 20.0) -> float:
+    """'Full jitter' backoff: uniform in [0, min(cap, base * 2**(attempt-1))]"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    closed     calls pass; `failure_threshold` consecutive failures open it
+    open       calls are refused for `reset_timeout` seconds
+    half_open  one trial call passes; success closes, failure re-opens
+               (a trial that never reports back is re-granted after `reset_timeout`)
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial = False
+            now = time.monotonic()
+            if self.state == "half_open" and (not self._trial or now - self._trial_at >= self.reset_timeout):
+                self._trial = True
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class LatencyWindow:
+    """Last `size` successful call durations; percentile() once `min_samples` are in"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._values: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, None while the window is too small to trust"""
+        with self._lock:
+            if len(self._values) < self.min_samples:
+                return None
+            ordered = sorted(self._values)
+        return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_windows: Dict[str, LatencyWindow] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    with _registry_lock:
+        if backend not in _breakers:
+            _breakers[backend] = CircuitBreaker(int(CONFIG.get("LLM_BREAKER_FAILURES", 5)),
+                                                float(CONFIG.get("LLM_BREAKER_RESET_S", 30)))
+        return _breakers[backend]
+
+
+def get_latency_window(key: str) -> LatencyWindow:
+    with _registry_lock:
+        if key not in _windows:
+            _windows[key] = LatencyWindow(min_samples=int(CONFIG.get("LLM_HEDGE_MIN_SAMPLES", 20)))
+        return _windows[key]
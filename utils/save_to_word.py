@@ -1,46 +1,44 @@
 # utils/save_to_word.py
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
-import re
-
-from docx import Document
-
-
-def _add_paragraph_with_markdown(doc: Document, text: str) -> None:
-    """Thêm một paragraph, tự parse **bold** sang run.bold = True."""
-    pattern = re.compile(r"\*\*(.*?)\*\*")
-    p = doc.add_paragraph()
-    pos = 0
-    for m in pattern.finditer(text):
-        # phần trước **bold**
-        if m.start() > pos:
-            p.add_run(text[pos:m.start()])
-        # phần **bold**
-        p.add_run(m.group(1)).bold = True
-        pos = m.end()
-    # phần còn lại
-    if pos < len(text):
-        p.add_run(text[pos:])
+from typing import TYPE_CHECKING, Optional
+import hashlib
+import os
+import threading
+
+from utils.exporters.docx_writer import render_docx
+from utils.exporters.markdown import tokenize
+
+if TYPE_CHECKING:
+    from docx.document import Document
+
+
+def content_filename(content: str, ext: str = "docx") -> str:
+    """Tên file theo hash nội dung: không trùng giữa các lần chạy song song,
+    và cùng nội dung thì cùng file"""
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    return f"affina_post_{digest}.{ext}"
+
+
+def build_document(content: str) -> "Document":
+    """Heading, list, **bold** / *italic* và hashtag giữ nguyên định dạng"""
+    return render_docx(tokenize(content))
 
 
 def save_to_word(
     content: str,
     score: Optional[float] = None,
     out_dir: str | Path = "outputs",
+    filename: Optional[str] = None,
 ) -> Path:
 
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
+    file_path = out_dir / (filename or content_filename(content))
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_path = out_dir / f"affina_post_{ts}.docx"
-
-    doc = Document()
-
-    # Tách đoạn theo 2 dòng trống
-    for block in content.split("\n\n"):
-        _add_paragraph_with_markdown(doc, block)
+    doc = build_document(content)
 
-    doc.save(file_path)
+    # Ghi file tạm rồi đổi tên, để không ai đọc phải file ghi dở
+    tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    doc.save(tmp_path)
+    os.replace(tmp_path, file_path)
     return file_path
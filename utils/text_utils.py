@@ -1,25 +1,33 @@
-# import re
-# from typing import List
+import re
+from typing import List
 
-# __all__ = ["normalize_title", "parse_markdown_table"]
+__all__ = ["normalize_title", "parse_markdown_table", "estimate_tokens", "CHARS_PER_TOKEN"]
 
-# def normalize_title(title: str) -> str:
-#     return re.sub(r"[^\w\s]+", "-", title.lower()).strip("-")
+# Rough chars per token (Vietnamese syllables run ~3 chars/token on the Qwen
+# tokenizer, English a little more): errs towards over-counting, so token
+# budgets are not overrun
+CHARS_PER_TOKEN = 3
 
-# def parse_markdown_table(table_lines: List[str]) -> str:
-#     if not table_lines:
-#         return ""
-#     formatted = []
-#     for line in table_lines:
-#         line = line.strip()
-#         if not line or not line.startswith("|"):
-#             continue
-#         cells = [c.strip() for c in line.strip("|").split("|")]
-#         if all(
-#             c in {"", "-", "---", "----"} or (c.startswith("-") and c.endswith("-"))
-#             for c in cells
-#         ):
-#             continue
-#         processed = [c if c not in {"NaN", ""} else "" for c in cells]
-#         formatted.append(" | ".join(processed))
-#     return "\n".join(formatted)
+def normalize_title(title: str) -> str:
+    return re.sub(r"[^\w\s]+", "-", title.lower()).strip("-")
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def parse_markdown_table(table_lines: List[str]) -> str:
+    if not table_lines:
+        return ""
+    formatted = []
+    for line in table_lines:
+        line = line.strip()
+        if not line or not line.startswith("|"):
+            continue
+        cells = [c.strip() for c in line.strip("|").split("|")]
+        if all(
+            c in {"", "-", "---", "----"} or (c.startswith("-") and c.endswith("-"))
+            for c in cells
+        ):
+            continue
+        processed = [c if c not in {"NaN", ""} else "" for c in cells]
+        formatted.append(" | ".join(processed))
+    return "\n".join(formatted)
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import CONFIG
+from utils.log_service import current_run_id
+
+# Latency buckets (seconds) shared by every histogram: sub-ms template/parse
+# work up to multi-minute generations on CPU.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Graph node currently executing in this context; LLM/search spans use it as
+# their agent label
+_current_node: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_node", default=None)
+
+
+def current_node() -> Optional[str]:
+    return _current_node.get()
+
+
+class Span:
+    __slots__ = ("name", "kind", "agent", "run_id", "start", "duration", "attrs", "error")
+
+    def __init__(self, name: str, kind: str, agent: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.agent = agent
+        self.run_id = current_run_id()
+        self.start = time.time()
+        self.duration = 0.0
+        self.attrs = attrs
+        self.error: Optional[str] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "agent": self.agent,
+            "run_id": self.run_id,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _labels(**labels: Optional[str]) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels.items() if v is not None)
+
+
+class Tracer:
+    """
+    Collects finished spans (bounded ring buffer) and aggregates them into
+    Prometheus-style metrics: a latency histogram per (kind, name, agent),
+    token/error counters per agent, plus counters recorded explicitly with
+    count() (retries) and cache_event() / a span's "cache" attribute.
+    """
+
+    def __init__(self, max_spans: int = 10000, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans: Deque[Span] = deque(maxlen=max_spans)
+        self._histograms: Dict[Tuple[str, str, Optional[str]], _Histogram] = {}
+        self._counters: Dict[Tuple[str, str], float] = {}
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", agent: Optional[str] = None, **attrs: Any) -> Iterator[Span]:
+        """Time a block; attributes can be added to the yielded span with .set()"""
+        span = Span(name, kind, agent or _current_node.get(), attrs)
+        if not self.enabled:
+            yield span
+            return
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            self._record(span)
+
+    @contextmanager
+    def node(self, name: str) -> Iterator[Span]:
+        """Span for a graph node; nested spans are attributed to it"""
+        token = _current_node.set(name)
+        try:
+            with self.span(name, kind="node", agent=name) as span:
+                yield span
+        finally:
+            _current_node.reset(token)
+
+    def count(self, metric: str, value: float = 1, **labels: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        key = (metric, _labels(**labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def cache_event(self, cache: str, hit: bool) -> None:
+        self.count("affina_cache_events_total", cache=cache, outcome="hit" if hit else "miss")
+
+    def _record(self, span: Span) -> None:
+        key = (span.kind, span.name, span.agent)
+        with self._lock:
+            self._spans.append(span)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram()
+            hist.observe(span.duration)
+
+        agent = span.agent or "none"
+        if span.error:
+            self.count("affina_span_errors_total", kind=span.kind, name=span.name, agent=agent)
+        for attr, metric in (
+            ("prompt_tokens", "affina_llm_prompt_tokens_total"),
+            ("completion_tokens", "affina_llm_completion_tokens_total"),
+        ):
+            if span.attrs.get(attr):
+                self.count(metric, span.attrs[attr], agent=agent)
+        if "cache" in span.attrs:
+            self.cache_event(span.name, span.attrs["cache"] == "hit")
+
+    def spans(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        return [s.to_dict() for s in spans if run_id is None or s.run_id == run_id]
+
+    def export_jsonl(self, path: str | Path, run_id: Optional[str] = None) -> Path:
+        """Append spans (optionally of one run) to a JSONL trace file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            for span in self.spans(run_id):
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+        return path
+
+    def prometheus_text(self) -> str:
+        """Current metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            "# HELP affina_span_seconds Latency of graph nodes, LLM calls, searches and exports",
+            "# TYPE affina_span_seconds histogram",
+        ]
+        for (kind, name, agent), (counts, total, count) in sorted(histograms.items(), key=str):
+            labels = _labels(kind=kind, name=name, agent=agent)
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, counts):
+                cumulative += n
+                lines.append(f'affina_span_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'affina_span_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"affina_span_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"affina_span_seconds_count{{{labels}}} {count}")
+
+        seen_types = set()
+        for (metric, labels), value in sorted(counters.items()):
+            if metric not in seen_types:
+                lines.append(f"# TYPE {metric} counter")
+                seen_types.add(metric)
+            lines.append(f"{metric}{{{labels}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.prometheus_text(), encoding="utf-8")
+        return path
+
+
+_tracer = Tracer(
+    max_spans=CONFIG.get("TRACE_MAX_SPANS", 10000),
+    enabled=CONFIG.get("TRACING_ENABLED", True),
+)
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer"""
+    return _tracer